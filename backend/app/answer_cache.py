@@ -0,0 +1,178 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from app.core.config import settings
+from app.information_query import get_node_parser
+from llama_index.core import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry(NamedTuple):
+    embedding: Optional[np.ndarray]
+    answer: str
+    created_at: float
+    scope: Tuple[str, ...]
+
+
+class AnswerLookup(NamedTuple):
+    answer: Optional[str]
+    key: str
+    embedding: Optional[np.ndarray]
+    corpus_version: int
+    scope: Tuple[str, ...] = ()
+
+
+def normalize_question(question: str) -> str:
+    """Case-fold a question and drop whitespace and punctuation differences."""
+    return re.sub(r"\s+", " ", question.casefold()).strip(" ?!.")
+
+
+def embed_question(question: str) -> List[float]:
+    get_node_parser()
+    return Settings.embed_model.get_query_embedding(question)
+
+
+class SemanticAnswerCache:
+    """
+    Answers to previous questions, matched by the similarity of question embeddings.
+
+    A question is first looked up by its normalized text, which needs no embedding
+    call; otherwise it matches the cached question whose embedding has the highest
+    cosine similarity, if that is at least threshold. Only questions with the same
+    scope, i.e. naming the same policies, match: the embeddings of questions that
+    differ only in the company they ask about are far more similar than the threshold.
+    Entries expire after ttl_seconds and the least recently used are evicted beyond
+    max_entries.
+
+    Every entry belongs to a corpus version. Once a newer version is seen, e.g. after a
+    policy upload or delete, all older answers are dropped and answers still being
+    computed against an older version are not stored.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], List[float]],
+        max_entries: int,
+        ttl_seconds: float,
+        threshold: float,
+    ):
+        self._embed = embed
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._corpus_version = -1
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sync_version(self, corpus_version: int) -> bool:
+        # Returns whether corpus_version is current; must hold the lock
+        if corpus_version > self._corpus_version:
+            if self._entries:
+                logger.info(
+                    f"Dropping {len(self._entries)} cached answers for corpus version "
+                    f"{corpus_version}"
+                )
+            self._entries.clear()
+            self._corpus_version = corpus_version
+        return corpus_version == self._corpus_version
+
+    def _expire(self, now: float) -> None:
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for key in expired:
+            del self._entries[key]
+
+    def _hit(self, key: str) -> str:
+        self._entries.move_to_end(key)
+        return self._entries[key].answer
+
+    def lookup(
+        self, question: str, corpus_version: int, scope: Tuple[str, ...] = ()
+    ) -> AnswerLookup:
+        """
+        Find a cached answer to a question.
+
+        Args:
+            question (str): The user's question.
+            corpus_version (int): The version of the policies the answer must be for.
+            scope (Tuple[str, ...]): The policies the question names, if any.
+
+        Returns:
+            AnswerLookup: The cached answer, or None on a miss, together with what
+                          store needs to cache the answer once it is computed.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            if not self.max_entries or not self._sync_version(corpus_version):
+                return AnswerLookup(None, key, None, corpus_version, scope)
+            self._expire(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None and entry.scope == scope:
+                return AnswerLookup(self._hit(key), key, None, corpus_version, scope)
+
+        try:
+            embedding = np.asarray(self._embed(question), dtype=np.float32)
+            embedding /= np.linalg.norm(embedding) or 1
+        except Exception as e:
+            logger.warning(f"Could not embed question for the answer cache: {str(e)}")
+            return AnswerLookup(None, key, None, corpus_version, scope)
+
+        with self._lock:
+            if corpus_version != self._corpus_version:
+                return AnswerLookup(None, key, embedding, corpus_version, scope)
+            keys = [
+                k
+                for k, entry in self._entries.items()
+                if entry.embedding is not None and entry.scope == scope
+            ]
+            if keys:
+                matrix = np.vstack([self._entries[k].embedding for k in keys])
+                scores = matrix @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    return AnswerLookup(
+                        self._hit(keys[best]), key, embedding, corpus_version, scope
+                    )
+        return AnswerLookup(None, key, embedding, corpus_version, scope)
+
+    def store(self, lookup: AnswerLookup, answer: str) -> None:
+        """
+        Cache the answer to a question that missed.
+
+        Args:
+            lookup (AnswerLookup): The result of the lookup that missed.
+            answer (str): The computed answer.
+        """
+        with self._lock:
+            if not self.max_entries or not self._sync_version(lookup.corpus_version):
+                return
+            self._entries[lookup.key] = _Entry(
+                lookup.embedding, answer, time.monotonic(), lookup.scope
+            )
+            self._entries.move_to_end(lookup.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+answer_cache = SemanticAnswerCache(
+    embed_question,
+    max_entries=settings.ANSWER_CACHE_SIZE,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    threshold=settings.ANSWER_CACHE_SIMILARITY,
+)
@@ -1,26 +1,105 @@
+from typing import Awaitable
+
 from app.api.deps import get_chatbot_service, get_current_user
-from app.models.chatbot import ComparisonRequest, QuestionRequest
+from app.core.config import settings
+from app.core.streaming import sse_stream
+from app.llm_scheduler import llm_scheduler
+from app.models.chatbot import (
+    ComparisonRequest,
+    MultiComparisonRequest,
+    QuestionRequest,
+)
 from app.services.chatbot_service import ChatbotService
-from fastapi import APIRouter, Depends, Request
+from app.usage import USAGE_HEADER, track_usage, usage_counters
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 
 router = APIRouter()
 
 
+async def tracked(response: Response, answer: Awaitable[dict]) -> dict:
+    # Record the calls made for the answer and report them in a header if enabled
+    with track_usage() as usage:
+        result = await answer
+    if settings.USAGE_HEADER_ENABLED:
+        response.headers[USAGE_HEADER] = usage.header()
+    return result
+
+
 @router.post("/compare-policies")
 async def compare_policies(
     request: Request,
+    response: Response,
     comparerequest: ComparisonRequest,
+    stream: bool = False,
+    chatbot_service: ChatbotService = Depends(get_chatbot_service),
+):
+    if await get_current_user(request.cookies.get("access_token")):
+        if stream:
+            return StreamingResponse(
+                sse_stream(chatbot_service.compare_policies_stream(comparerequest)),
+                media_type="text/event-stream",
+            )
+        return await tracked(response, chatbot_service.compare_policies(comparerequest))
+
+
+@router.post("/compare-many-policies")
+async def compare_many_policies(
+    request: Request,
+    response: Response,
+    comparerequest: MultiComparisonRequest,
     chatbot_service: ChatbotService = Depends(get_chatbot_service),
 ):
     if await get_current_user(request.cookies.get("access_token")):
-        return await chatbot_service.compare_policies(comparerequest)
+        return await tracked(
+            response, chatbot_service.compare_many_policies(comparerequest)
+        )
 
 
 @router.post("/question")
 async def ask_question(
     request: Request,
+    response: Response,
     questionrequest: QuestionRequest,
+    stream: bool = False,
     chatbot_service: ChatbotService = Depends(get_chatbot_service),
 ):
-    if await get_current_user(request.cookies.get("access_token")):
-        return await chatbot_service.ask(questionrequest)
+    current_user = await get_current_user(request.cookies.get("access_token"))
+    if current_user:
+        # Every user has their own conversation, which follow-up questions build on
+        session_id = current_user.email
+        if stream:
+            return StreamingResponse(
+                sse_stream(chatbot_service.ask_stream(questionrequest, session_id)),
+                media_type="text/event-stream",
+            )
+        return await tracked(response, chatbot_service.ask(questionrequest, session_id))
+
+
+@router.delete("/conversation")
+async def reset_conversation(
+    request: Request,
+    chatbot_service: ChatbotService = Depends(get_chatbot_service),
+):
+    current_user = await get_current_user(request.cookies.get("access_token"))
+    if current_user:
+        chatbot_service.reset_conversation(current_user.email)
+        return {"message": "Conversation reset"}
+
+
+@router.get("/usage")
+async def get_usage(request: Request):
+    current_user = await get_current_user(request.cookies.get("access_token"))
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to view usage")
+    return usage_counters.snapshot()
+
+
+@router.get("/llm-queue")
+async def get_llm_queue(request: Request):
+    current_user = await get_current_user(request.cookies.get("access_token"))
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=403, detail="Not authorized to view the LLM queue"
+        )
+    return llm_scheduler.snapshot()
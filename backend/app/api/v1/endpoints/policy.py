@@ -1,11 +1,21 @@
 from app.api.deps import get_current_user, get_policy_service
+from app.models.ingestion import IngestionJob
 from app.services.policy_service import PolicyService
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Request,
+    UploadFile,
+    status,
+)
 
 router = APIRouter()
 
 
-@router.post("/upload-policy")
+@router.post("/upload-policy", status_code=status.HTTP_202_ACCEPTED)
 async def upload_policy(
     request: Request,
     file: UploadFile = File(...),
@@ -36,6 +46,20 @@ async def delete_policy(
     return await policy_service.delete_policy(insurance_name, policy_name)
 
 
+@router.get("/jobs/{job_id}", response_model=IngestionJob)
+async def get_ingestion_job(
+    job_id: str,
+    request: Request,
+    policy_service: PolicyService = Depends(get_policy_service),
+):
+    current_user = await get_current_user(request.cookies.get("access_token"))
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=403, detail="Not authorized to view ingestion jobs"
+        )
+    return await policy_service.get_ingestion_job(job_id)
+
+
 @router.get("/policies")
 async def get_policies(policy_service: PolicyService = Depends(get_policy_service)):
     return await policy_service.get_policies()
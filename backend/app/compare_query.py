@@ -1,15 +1,45 @@
+import asyncio
+import hashlib
+import json
 import os
+import time
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, AsyncIterator, List, Optional, Tuple
 
-import PyPDF2
-from openai import OpenAI
+from app.answer_cache import normalize_question
+from app.core.config import settings
+from app.core.disk_cache import DiskCache
+from app.information_query import live_registry
+from app.llm_backends import get_openai_clients, model_id
+from app.text_cache import content_hash, get_text
+from app.usage import record_call
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore
 
 # Define the directory where PDF policies are stored
 PDF_DIRECTORY = Path("insurance_policies")
 
-# Initialize OpenAI client
-client = OpenAI()
+# Bump whenever the prompts change so cached comparisons are not reused
+PROMPT_VERSION = 1
+
+# Initialize the OpenAI clients, or their stand-ins for the fake backend
+client, async_client = get_openai_clients()
+
+# Completed comparisons by policy contents, query and prompt version
+comparison_cache = DiskCache(
+    settings.COMPARISON_CACHE_PATH, settings.COMPARISON_CACHE_MAX_BYTES
+)
+
+
+def _record_completion(tool: str, usage: Optional[Any], start: float) -> None:
+    # usage is the CompletionUsage of a completion, None if the API did not report it
+    record_call(
+        "llm",
+        tool,
+        usage.prompt_tokens if usage is not None else 0,
+        usage.completion_tokens if usage is not None else 0,
+        time.perf_counter() - start,
+    )
 
 
 def get_policy_files() -> List[Path]:
@@ -39,11 +69,7 @@ def load_pdf_text(file_path: str) -> str:
     if not pdf_path.exists() or pdf_path.suffix.lower() != ".pdf":
         raise ValueError(f"Invalid PDF file path: {file_path}")
 
-    text = ""
-    with pdf_path.open("rb") as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = "".join(page.extract_text() for page in pdf_reader.pages)
-    return text
+    return get_text(pdf_path)
 
 
 def prepare_policy_data(policy_path: str) -> Tuple[str, str]:
@@ -63,32 +89,92 @@ def prepare_policy_data(policy_path: str) -> Tuple[str, str]:
     try:
         policy_text = load_pdf_text(full_path)
         policy_name = Path(full_path).stem
-        return policy_name, policy_text[
-            :50000
-        ]  # Limit text to 50000 characters to prevent potential issues with API limits.
+        return (
+            policy_name,
+            policy_text[:50000],
+        )  # Limit text to 50000 characters to prevent potential issues with API limits.
     except ValueError as e:
         raise ValueError(f"Error loading policy {policy_path}: {str(e)}")
 
 
-def compare_policies_query(policy1_path: str, policy2_path: str, query: str) -> str:
+def _policy_retriever(
+    policy_path: str, top_k: Optional[int]
+) -> Tuple[str, BaseRetriever]:
+    policy_file = Path(policy_path)
+    full_policy_name = f"{policy_file.parent.name}_{policy_file.stem}"
+    registry = live_registry.current()
+    if full_policy_name not in registry:
+        raise ValueError(f"Error loading policy {policy_path}: Policy not found")
+
+    retriever = registry.get(full_policy_name).vector_index.as_retriever(
+        similarity_top_k=top_k or settings.COMPARISON_TOP_K
+    )
+    return policy_file.stem, retriever
+
+
+def _format_chunks(nodes: List[NodeWithScore]) -> str:
+    nodes = sorted(nodes, key=lambda node: int(node.metadata.get("page_label", 0)))
+    return "\n\n".join(
+        f"[Side {node.metadata.get('page_label', '?')}]\n{node.get_content()}"
+        for node in nodes
+    )
+
+
+def retrieve_policy_data(
+    policy_path: str, query: str, top_k: Optional[int] = None
+) -> Tuple[str, str]:
     """
-    Compare two insurance policies based on a given query using OpenAI's GPT model.
+    Retrieve the parts of a policy relevant to a query from its vector index.
+
+    The top_k most similar chunks are returned in page order, each labelled with the
+    page it was taken from.
 
     Args:
-        policy1_path (str): The file name of the first policy.
-        policy2_path (str): The file name of the second policy.
+        policy_path (str): The path to the policy file relative to PDF_DIRECTORY,
+                           e.g. "IF/Bil.pdf".
         query (str): The comparison query.
+        top_k (Optional[int]): The number of chunks. Defaults to settings.COMPARISON_TOP_K.
 
     Returns:
-        str: The AI-generated comparison result.
+        Tuple[str, str]: A tuple containing the policy name and the retrieved text.
+
+    Raises:
+        ValueError: If the policy is not registered.
     """
+    policy_name, retriever = _policy_retriever(policy_path, top_k)
+    return policy_name, _format_chunks(retriever.retrieve(query))
 
-    try:
-        policy1_name, policy1_text = prepare_policy_data(policy1_path)
-        policy2_name, policy2_text = prepare_policy_data(policy2_path)
-    except ValueError as e:
-        return f"Error: {str(e)}"
 
+async def aretrieve_policy_data(
+    policy_path: str, query: str, top_k: Optional[int] = None
+) -> Tuple[str, str]:
+    """Async version of retrieve_policy_data."""
+    policy_name, retriever = await asyncio.to_thread(
+        _policy_retriever, policy_path, top_k
+    )
+    return policy_name, _format_chunks(await retriever.aretrieve(query))
+
+
+def build_comparison_messages(
+    policy1_name: str,
+    policy1_text: str,
+    policy2_name: str,
+    policy2_text: str,
+    query: str,
+) -> List[dict]:
+    """
+    Build the chat messages asking the model to compare two policies.
+
+    Args:
+        policy1_name (str): The name of the first policy.
+        policy1_text (str): The text of the first policy sent to the model.
+        policy2_name (str): The name of the second policy.
+        policy2_text (str): The text of the second policy sent to the model.
+        query (str): The comparison query.
+
+    Returns:
+        List[dict]: The system and user messages.
+    """
     system_prompt = f"""
     Please compare the {policy1_name} and {policy2_name} insurance policies with respect to the following question:
     {query}
@@ -134,15 +220,417 @@ Based on the provided information, IF's policy appears to be more transparent ab
     {policy2_text}
     """
 
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def comparison_cache_key(
+    policy1_path: str, policy2_path: str, query: str, mode: str
+) -> str:
+    """
+    Build the cache key of a comparison from the content hashes of both policies.
+
+    Args:
+        policy1_path (str): The file name of the first policy.
+        policy2_path (str): The file name of the second policy.
+        query (str): The comparison query.
+        mode (str): The comparison mode.
+
+    Returns:
+        str: The cache key.
+
+    Raises:
+        ValueError: If either policy file does not exist.
+    """
+    hashes = []
+    for policy_path in (policy1_path, policy2_path):
+        full_path = PDF_DIRECTORY / policy_path
+        if not full_path.is_file():
+            raise ValueError(f"Error loading policy {policy_path}: Policy not found")
+        hashes.append(content_hash(full_path))
+    top_k = settings.COMPARISON_TOP_K if mode != "full_text" else None
+    key = [*hashes, normalize_question(query), PROMPT_VERSION, model_id(), mode, top_k]
+    return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+def compare_policies_query(
+    policy1_path: str, policy2_path: str, query: str, mode: Optional[str] = None
+) -> str:
+    """
+    Compare two insurance policies based on a given query using OpenAI's GPT model.
+
+    Args:
+        policy1_path (str): The file name of the first policy.
+        policy2_path (str): The file name of the second policy.
+        query (str): The comparison query.
+        mode (Optional[str]): "retrieval" sends only the chunks of each policy relevant
+                              to the query, "full_text" sends the first 50000 characters
+                              of each policy. Defaults to settings.COMPARISON_MODE.
+
+    Returns:
+        str: The AI-generated comparison result.
+    """
+    mode = mode or settings.COMPARISON_MODE
+
+    try:
+        cache_key = comparison_cache_key(policy1_path, policy2_path, query, mode)
+        cached = comparison_cache.get(cache_key)
+        if cached is not None:
+            return cached.decode("utf-8")
+
+        if mode == "full_text":
+            policy1_name, policy1_text = prepare_policy_data(policy1_path)
+            policy2_name, policy2_text = prepare_policy_data(policy2_path)
+        else:
+            policy1_name, policy1_text = retrieve_policy_data(policy1_path, query)
+            policy2_name, policy2_text = retrieve_policy_data(policy2_path, query)
+    except ValueError as e:
+        return f"Error: {str(e)}"
+
+    messages = build_comparison_messages(
+        policy1_name, policy1_text, policy2_name, policy2_text, query
+    )
+
     try:
+        start = time.perf_counter()
         completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+            model=settings.LLM_MODEL,
+            messages=messages,
+        )
+        _record_completion("compare", completion.usage, start)
+        result = completion.choices[0].message.content
+        comparison_cache.set(cache_key, result.encode("utf-8"))
+        return result
+    except Exception as e:
+        error_message = f"Error during policy comparison: {str(e)}"
+        return error_message
+
+
+async def _aprepare_comparison(
+    policy1_path: str, policy2_path: str, query: str, mode: str
+) -> Tuple[str, Optional[str], Optional[List[dict]]]:
+    # Returns the cache key and either the cached result or the messages to send
+    cache_key = await asyncio.to_thread(
+        comparison_cache_key, policy1_path, policy2_path, query, mode
+    )
+    cached = await asyncio.to_thread(comparison_cache.get, cache_key)
+    if cached is not None:
+        return cache_key, cached.decode("utf-8"), None
+
+    if mode == "full_text":
+        policies = [
+            asyncio.to_thread(prepare_policy_data, policy_path)
+            for policy_path in (policy1_path, policy2_path)
+        ]
+    else:
+        policies = [
+            aretrieve_policy_data(policy_path, query)
+            for policy_path in (policy1_path, policy2_path)
+        ]
+    (policy1_name, policy1_text), (policy2_name, policy2_text) = await asyncio.gather(
+        *policies
+    )
+    messages = build_comparison_messages(
+        policy1_name, policy1_text, policy2_name, policy2_text, query
+    )
+    return cache_key, None, messages
+
+
+async def acompare_policies_query(
+    policy1_path: str, policy2_path: str, query: str, mode: Optional[str] = None
+) -> str:
+    """
+    Async version of compare_policies_query.
+
+    The completion is requested with the async OpenAI client and file and cache access
+    runs in worker threads, so a comparison never blocks the event loop.
+    """
+    mode = mode or settings.COMPARISON_MODE
+
+    try:
+        cache_key, cached, messages = await _aprepare_comparison(
+            policy1_path, policy2_path, query, mode
+        )
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    if cached is not None:
+        return cached
+
+    try:
+        start = time.perf_counter()
+        completion = await async_client.chat.completions.create(
+            model=settings.LLM_MODEL,
+            messages=messages,
+        )
+        _record_completion("compare", completion.usage, start)
+        result = completion.choices[0].message.content
+        await asyncio.to_thread(comparison_cache.set, cache_key, result.encode("utf-8"))
+        return result
+    except Exception as e:
+        error_message = f"Error during policy comparison: {str(e)}"
+        return error_message
+
+
+async def astream_compare_policies_query(
+    policy1_path: str, policy2_path: str, query: str, mode: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Streaming version of acompare_policies_query.
+
+    The comparison is yielded as the model produces it. A cached comparison is yielded
+    at once, and errors are yielded as text like acompare_policies_query returns them.
+    The result is only cached once it has been streamed completely.
+
+    Yields:
+        str: The next piece of the comparison.
+    """
+    mode = mode or settings.COMPARISON_MODE
+
+    try:
+        cache_key, cached, messages = await _aprepare_comparison(
+            policy1_path, policy2_path, query, mode
+        )
+    except ValueError as e:
+        yield f"Error: {str(e)}"
+        return
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    usage = None
+    try:
+        start = time.perf_counter()
+        stream = await async_client.chat.completions.create(
+            model=settings.LLM_MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            # The usage arrives in a last chunk without choices
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        _record_completion("compare", usage, start)
+    except Exception as e:
+        yield f"Error during policy comparison: {str(e)}"
+        return
+    await asyncio.to_thread(
+        comparison_cache.set, cache_key, "".join(parts).encode("utf-8")
+    )
+
+
+def build_findings_messages(
+    policy_name: str, policy_text: str, query: str
+) -> List[dict]:
+    """
+    Build the chat messages extracting what one policy says about a comparison query.
+
+    This is the map step of a comparison of many policies; the findings of every
+    policy are merged into one comparison by build_merge_messages.
+
+    Args:
+        policy_name (str): The name of the policy.
+        policy_text (str): The text of the policy sent to the model.
+        query (str): The comparison query.
+
+    Returns:
+        List[dict]: The system and user messages.
+    """
+    system_prompt = f"""
+    You are preparing a comparison of insurance policies with respect to the following question:
+    {query}
+
+    Extract everything the {policy_name} policy says that is relevant to the question, as short markdown bullet points.
+    Quote the policy where relevant and mention the page, e.g. (Side 4), when it is given.
+    If the policy does not cover the question, say so in one bullet point.
+    Do NOT rely on prior knowledge. Only use the information provided in the policy.
+    Do NOT compare with other policies.
+    Always answer in danish
+    """
+
+    user_prompt = f"""
+    Policy ({policy_name}) content:
+    {policy_text}
+    """
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def build_merge_messages(findings: List[Tuple[str, str]], query: str) -> List[dict]:
+    """
+    Build the chat messages merging the findings of many policies into one comparison.
+
+    Args:
+        findings (List[Tuple[str, str]]): The name and findings of every policy, in
+                                          the order of the comparison's columns.
+        query (str): The comparison query.
+
+    Returns:
+        List[dict]: The system and user messages.
+    """
+    names = [name for name, _ in findings]
+    system_prompt = f"""
+    Please compare the {", ".join(names)} insurance policies with respect to the following question:
+    {query}
+
+    You are given the findings extracted from each policy.
+    Provide a concise answer in markdown format for easy reading and understanding, highlighting differences between the policies.
+    Start with a table with one row per aspect and one column per policy, in this order: {" | ".join(names)}.
+    Write "Ikke angivet" where a policy does not cover an aspect.
+    Follow the table with a "## Key Differences" list and a short "## Summary", mentioning where a policy offers better coverage or terms.
+    Do NOT rely on prior knowledge. Only use the information provided in the findings.
+    Always answer in danish
+    """
+
+    user_prompt = "\n".join(f"""
+    Findings for {name}:
+    {text}
+    """ for name, text in findings)
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _policy_label(policy_path: str) -> str:
+    # Policies of the same type differ only by company, so both are needed
+    policy_file = Path(policy_path)
+    return f"{policy_file.parent.name} {policy_file.stem}".strip()
+
+
+def _cache_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+async def _aextract_findings(
+    policy_path: str, policy_hash: str, query: str, mode: str, limit: asyncio.Semaphore
+) -> Tuple[str, str]:
+    # Map step for one policy; findings are cached on their own so comparisons of
+    # different sets of policies share them
+    label = _policy_label(policy_path)
+    top_k = settings.COMPARISON_TOP_K if mode != "full_text" else None
+    cache_key = _cache_key(
+        "findings",
+        policy_hash,
+        normalize_question(query),
+        PROMPT_VERSION,
+        model_id(),
+        mode,
+        top_k,
+    )
+    cached = await asyncio.to_thread(comparison_cache.get, cache_key)
+    if cached is not None:
+        return label, cached.decode("utf-8")
+
+    async with limit:
+        if mode == "full_text":
+            _, policy_text = await asyncio.to_thread(prepare_policy_data, policy_path)
+        else:
+            _, policy_text = await aretrieve_policy_data(policy_path, query)
+        start = time.perf_counter()
+        completion = await async_client.chat.completions.create(
+            model=settings.LLM_MODEL,
+            messages=build_findings_messages(label, policy_text, query),
+        )
+        _record_completion("compare_findings", completion.usage, start)
+    findings = completion.choices[0].message.content
+    await asyncio.to_thread(comparison_cache.set, cache_key, findings.encode("utf-8"))
+    return label, findings
+
+
+async def amulti_compare_policies_query(
+    policy_paths: List[str], query: str, mode: Optional[str] = None
+) -> str:
+    """
+    Compare any number of insurance policies based on a given query.
+
+    The relevant findings of every policy are extracted concurrently, at most
+    settings.COMPARISON_CONCURRENCY at a time, and then merged into one comparison
+    table by a final request. The latency is therefore that of about two requests
+    however many policies are compared, as long as they fit in the concurrency limit.
+
+    Args:
+        policy_paths (List[str]): The file names of the policies, e.g. "IF/Bil.pdf",
+                                  in the order of the comparison's columns.
+        query (str): The comparison query.
+        mode (Optional[str]): "retrieval" or "full_text", as for
+                              compare_policies_query. Defaults to
+                              settings.COMPARISON_MODE.
+
+    Returns:
+        str: The AI-generated comparison result.
+    """
+    mode = mode or settings.COMPARISON_MODE
+
+    if len(set(policy_paths)) < 2:
+        return "Error: At least two different policies are needed for a comparison"
+    if len(policy_paths) > settings.COMPARISON_MAX_POLICIES:
+        return (
+            f"Error: At most {settings.COMPARISON_MAX_POLICIES} policies can be "
+            "compared at once"
+        )
+
+    try:
+        hashes = []
+        for policy_path in policy_paths:
+            full_path = PDF_DIRECTORY / policy_path
+            if not full_path.is_file():
+                raise ValueError(
+                    f"Error loading policy {policy_path}: Policy not found"
+                )
+            hashes.append(await asyncio.to_thread(content_hash, full_path))
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    top_k = settings.COMPARISON_TOP_K if mode != "full_text" else None
+    cache_key = _cache_key(
+        "merge",
+        hashes,
+        normalize_question(query),
+        PROMPT_VERSION,
+        model_id(),
+        mode,
+        top_k,
+    )
+    cached = await asyncio.to_thread(comparison_cache.get, cache_key)
+    if cached is not None:
+        return cached.decode("utf-8")
+
+    limit = asyncio.Semaphore(max(1, settings.COMPARISON_CONCURRENCY))
+    tasks = [
+        asyncio.ensure_future(
+            _aextract_findings(policy_path, policy_hash, query, mode, limit)
+        )
+        for policy_path, policy_hash in zip(policy_paths, hashes)
+    ]
+    try:
+        findings = await asyncio.gather(*tasks)
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error during policy comparison: {str(e)}"
+    finally:
+        # One failed policy fails the comparison, so stop extracting the others
+        for task in tasks:
+            task.cancel()
+
+    try:
+        start = time.perf_counter()
+        completion = await async_client.chat.completions.create(
+            model=settings.LLM_MODEL,
+            messages=build_merge_messages(findings, query),
         )
+        _record_completion("compare_merge", completion.usage, start)
         result = completion.choices[0].message.content
+        await asyncio.to_thread(comparison_cache.set, cache_key, result.encode("utf-8"))
         return result
     except Exception as e:
         error_message = f"Error during policy comparison: {str(e)}"
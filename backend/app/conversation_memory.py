@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from app.core.config import settings
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+
+
+class Conversation:
+    """
+    The recent turns of one session, bounded to a window of token_limit tokens.
+
+    Only the questions and final answers are kept, not the tool calls the agents made
+    for them; older turns are dropped once the window is full.
+    """
+
+    def __init__(self, token_limit: int):
+        self._memory = ChatMemoryBuffer.from_defaults(token_limit=token_limit)
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def history(self) -> List[ChatMessage]:
+        with self._lock:
+            return self._memory.get()
+
+    def add_turn(self, question: str, answer: str) -> None:
+        with self._lock:
+            self._memory.put(ChatMessage(role=MessageRole.USER, content=question))
+            self._memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+            # get returns the window that fits the token limit; keep nothing older
+            self._memory.set(self._memory.get())
+
+
+class ConversationStore:
+    """
+    The conversations of active sessions, e.g. one per signed-in user.
+
+    A conversation expires after idle_seconds without a question, and the least
+    recently used conversations are evicted beyond max_sessions. A token_limit of 0
+    disables conversation memory, so every question is answered on its own.
+    """
+
+    def __init__(self, max_sessions: int, idle_seconds: float, token_limit: int):
+        self.max_sessions = max(1, max_sessions)
+        self.idle_seconds = idle_seconds
+        self.token_limit = token_limit
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    @property
+    def enabled(self) -> bool:
+        return self.token_limit > 0
+
+    def get(self, session_id: str) -> Conversation:
+        """Return the conversation of a session, starting a new one if it has none."""
+        now = time.monotonic()
+        with self._lock:
+            # The least recently used conversations are first, so expired ones are too
+            while self._conversations:
+                oldest = next(iter(self._conversations.values()))
+                if now - oldest.last_used < self.idle_seconds:
+                    break
+                self._conversations.popitem(last=False)
+
+            conversation = self._conversations.get(session_id)
+            if conversation is None:
+                conversation = Conversation(self.token_limit)
+                self._conversations[session_id] = conversation
+            conversation.last_used = now
+            self._conversations.move_to_end(session_id)
+            while len(self._conversations) > self.max_sessions:
+                self._conversations.popitem(last=False)
+            return conversation
+
+    def drop(self, session_id: str) -> None:
+        """Forget the conversation of a session, so its next question starts anew."""
+        with self._lock:
+            self._conversations.pop(session_id, None)
+
+
+conversations = ConversationStore(
+    max_sessions=settings.CONVERSATION_MAX_SESSIONS,
+    idle_seconds=settings.CONVERSATION_IDLE_SECONDS,
+    token_limit=settings.CONVERSATION_MEMORY_TOKENS,
+)
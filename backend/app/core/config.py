@@ -9,6 +9,51 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM")
     MONGODB_URL: str = os.getenv("MONGO_URL")
     BASE_PATH: str = "./insurance_policies"
+    POLICY_AGENT_CACHE_SIZE: int = 16
+    PDF_EXTRACTION_WORKERS: int = 0  # 0 uses one worker per CPU
+    PDF_PAGES_PER_TASK: int = 8
+    TEXT_CACHE_DIR: str = "./data/text_cache"
+    TEXT_CACHE_MEMORY_ENTRIES: int = 32
+    INGESTION_CONCURRENCY: int = 2
+    INGESTION_JOB_HISTORY: int = 100
+    EMBEDDING_CACHE_PATH: str = "./data/embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    SUMMARY_TOOL_MAX_TOKENS: int = 1000  # bounds the policy summary given to agents
+    COMPARISON_MODE: str = "retrieval"  # "retrieval" or "full_text"
+    COMPARISON_TOP_K: int = 8
+    ANSWER_CACHE_SIZE: int = 256  # 0 disables the answer cache
+    ANSWER_CACHE_TTL_SECONDS: float = 3600
+    ANSWER_CACHE_SIMILARITY: float = 0.95
+    CONVERSATION_MEMORY_TOKENS: int = 2000  # 0 answers every question on its own
+    CONVERSATION_IDLE_SECONDS: float = 1800
+    CONVERSATION_MAX_SESSIONS: int = 1000
+    COMPARISON_CACHE_PATH: str = "./data/comparison_cache.sqlite3"
+    COMPARISON_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    COMPARISON_MAX_POLICIES: int = 20
+    COMPARISON_CONCURRENCY: int = 8  # policies whose findings are extracted at once
+    POLICY_ROUTER_ENABLED: bool = True
+    POLICY_ROUTER_FUZZY_CUTOFF: float = 0.9
+    POLICY_ROUTER_EMBEDDINGS: bool = False
+    POLICY_ROUTER_SIMILARITY: float = 0.8
+    TOP_AGENT_TOOL_TOP_K: int = 8  # 0 offers every policy tool to the top agent
+    LLM_BACKEND: str = "openai"  # "openai" or "fake", which needs no key or network
+    LLM_MODEL: str = "gpt-4o-mini"
+    EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    FAKE_LLM_LATENCY_SECONDS: float = 0.0
+    FAKE_EMBEDDING_LATENCY_SECONDS: float = 0.0
+    FAKE_EMBEDDING_DIM: int = 256
+    LLM_HTTP_MAX_CONNECTIONS: int = 64
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 64
+    LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30
+    LLM_HTTP_TIMEOUT_SECONDS: float = 60
+    LLM_HTTP_CONNECT_TIMEOUT_SECONDS: float = 5
+    LLM_HTTP_POOL_SHARDS: int = 8  # the connection limits are split between the shards
+    LLM_MAX_CONCURRENCY: int = 32
+    LLM_MIN_CONCURRENCY: int = 2
+    LLM_REQUESTS_PER_SECOND: float = 0.0  # 0 sends requests without pacing
+    LLM_REQUEST_BURST: int = 10
+    LLM_LATENCY_TOLERANCE: float = 3.0  # 0 ignores latency when adapting the limit
+    USAGE_HEADER_ENABLED: bool = False  # report each request's LLM usage in X-Usage
 
     class Config:
         env_file = ".env"
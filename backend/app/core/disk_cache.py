@@ -0,0 +1,190 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+class DiskCache:
+    """
+    Persistent key-value store of bytes with size-based LRU eviction.
+
+    Entries are kept in a single SQLite file. Reads refresh an entry's last use and
+    writes evict the least recently used entries once the stored values exceed
+    max_bytes. All methods are thread safe, and several processes may share the file:
+    the total size is kept in a one-row table that every write adjusts in its own
+    transaction.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS totals ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)"
+            )
+            # Files written before the total was kept start from the stored entries
+            connection.execute(
+                "INSERT OR IGNORE INTO totals (id, size) "
+                "SELECT 0, COALESCE(SUM(size), 0) FROM entries"
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """
+        Look up several keys at once.
+
+        Args:
+            keys (Sequence[str]): The keys to look up.
+
+        Returns:
+            Dict[str, bytes]: The values of the keys that were found.
+        """
+        found: Dict[str, bytes] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(unique_keys), _LOOKUP_CHUNK):
+                chunk = unique_keys[start : start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = connection.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})",
+                    chunk,
+                )
+                found.update(rows)
+            if found:
+                now = time.time()
+                connection.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                connection.commit()
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Mapping[str, bytes]) -> None:
+        """
+        Store several values at once, evicting old entries if the cache is full.
+
+        Args:
+            items (Mapping[str, bytes]): The values to store by key.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            # Take the write lock up front, so no other process changes the entries
+            # between reading the total and adjusting it
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                replaced = self._sizes(connection, items.keys())
+                connection.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(key, value, len(value), now) for key, value in items.items()],
+                )
+                self._add_size(
+                    connection, sum(len(value) for value in items.values()) - replaced
+                )
+                self._evict(connection)
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many({key: value})
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = self._sizes(connection, keys)
+                connection.executemany(
+                    "DELETE FROM entries WHERE key = ?", [(key,) for key in keys]
+                )
+                self._add_size(connection, -deleted)
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+    def size(self) -> int:
+        """The total size in bytes of the stored values."""
+        with self._lock:
+            return self._total_size(self._connect())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    @staticmethod
+    def _total_size(connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+
+    @staticmethod
+    def _add_size(connection: sqlite3.Connection, delta: int) -> None:
+        connection.execute("UPDATE totals SET size = size + ? WHERE id = 0", (delta,))
+
+    @staticmethod
+    def _sizes(connection: sqlite3.Connection, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        total = 0
+        for start in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[start : start + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            total += connection.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM entries WHERE key IN ({placeholders})",
+                chunk,
+            ).fetchone()[0]
+        return total
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        size = self._total_size(connection)
+        if size <= self.max_bytes:
+            return
+        # Evict down to 90% so a full cache does not evict on every write
+        target = self.max_bytes * 0.9
+        evicted = []
+        freed = 0
+        cursor = connection.execute("SELECT key, size FROM entries ORDER BY last_used")
+        for key, entry_size in cursor:
+            if size - freed <= target:
+                break
+            evicted.append((key,))
+            freed += entry_size
+        cursor.close()
+        connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self._add_size(connection, -freed)
+        logger.info(f"Evicted {len(evicted)} entries from {self.path}")
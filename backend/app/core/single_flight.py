@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation.
+
+    The first caller for a key starts the computation in a task and later callers with
+    the same key wait for that task instead of starting their own. Every caller gets
+    the same result or exception. Once the computation finishes the key is forgotten, so
+    nothing is cached beyond the calls in flight.
+
+    A caller that is cancelled stops waiting without affecting the others; the
+    computation itself is only cancelled once no caller is waiting for it any more.
+    """
+
+    def __init__(self):
+        # Task and number of waiting callers by key
+        self._calls: Dict[Hashable, Tuple[asyncio.Task, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if key in self._calls and self._calls[key][0] is task:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn unless a call with the same key is already in flight.
+
+        Args:
+            key (Hashable): Identifies calls that compute the same result.
+            fn (Callable[[], Awaitable[T]]): Starts the computation.
+
+        Returns:
+            T: The result of the shared computation.
+        """
+        if key in self._calls:
+            task, waiters = self._calls[key]
+            self._calls[key] = (task, waiters + 1)
+            logger.info("Joined an identical request already in flight")
+        else:
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self._calls[key] = (task, 1)
+
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if key in self._calls and self._calls[key][0] is task:
+                task, waiters = self._calls[key]
+                if waiters > 1:
+                    self._calls[key] = (task, waiters - 1)
+                else:
+                    task.cancel()
+                    self._forget(key, task)
+            raise
@@ -0,0 +1,39 @@
+import json
+import logging
+from typing import AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_stream(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Encode an answer produced piece by piece as server-sent events.
+
+    Every piece is sent as a message with a "token" field. Once the answer is complete
+    a "done" event carries the full answer; if producing it fails an "error" event
+    carries the error instead, since the response status has already been sent.
+
+    Args:
+        tokens (AsyncIterator[str]): The pieces of the answer.
+
+    Yields:
+        str: The encoded events.
+    """
+    answer = []
+    try:
+        async for token in tokens:
+            answer.append(token)
+            yield sse_event({"token": token})
+    except Exception as e:
+        logger.error(f"Streaming failed: {str(e)}")
+        yield sse_event(
+            {"detail": f"An error occurred while streaming the answer: {str(e)}"},
+            event="error",
+        )
+        return
+    yield sse_event({"answer": "".join(answer)}, event="done")
@@ -0,0 +1,37 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+
+class StageTimer:
+    """
+    Accumulates wall time and item counts per named stage of a pipeline.
+
+    A stage may be entered many times, e.g. once per batch, and its time is summed.
+    The optional on_stage callback is called with the stage name whenever a stage is
+    entered, which lets callers report the current stage.
+    """
+
+    def __init__(self, on_stage: Optional[Callable[[str], None]] = None):
+        self.timings: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self._on_stage = on_stage
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if self._on_stage is not None:
+            self._on_stage(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings[name] += elapsed
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += amount
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+from array import array
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.disk_cache import DiskCache
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+_cache: Optional[DiskCache] = None
+
+
+def get_embedding_cache() -> DiskCache:
+    """Return the embedding store shared by every CachedEmbedding."""
+    global _cache
+
+    if _cache is None:
+        _cache = DiskCache(
+            settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_BYTES
+        )
+    return _cache
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model_name}:{digest}"
+
+
+def _encode(embedding: Embedding) -> bytes:
+    return array("f", embedding).tobytes()
+
+
+def _decode(value: bytes) -> Embedding:
+    return array("f", value).tolist()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model that reuses the embeddings of text it has embedded before.
+
+    Text embeddings are stored keyed by the wrapped model's name and a hash of the
+    text, so re-ingesting a policy only embeds the chunks that changed. A batch is
+    looked up in one go and only the misses are sent to the wrapped model. Query
+    embeddings are always computed by the wrapped model.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: DiskCache = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache: Optional[DiskCache] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            callback_manager=embed_model.callback_manager,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache or get_embedding_cache()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _lookup(self, texts: List[str]) -> Dict[str, Embedding]:
+        keys = {text: embedding_key(self.model_name, text) for text in texts}
+        found = self._cache.get_many(list(keys.values()))
+        return {text: _decode(found[key]) for text, key in keys.items() if key in found}
+
+    def _store(self, texts: List[str], embeddings: List[Embedding]) -> None:
+        self._cache.set_many(
+            {
+                embedding_key(self.model_name, text): _encode(embedding)
+                for text, embedding in zip(texts, embeddings)
+            }
+        )
+
+    def _merge(
+        self,
+        texts: List[str],
+        cached: Dict[str, Embedding],
+        misses: List[str],
+        embeddings: List[Embedding],
+    ) -> List[Embedding]:
+        self._store(misses, embeddings)
+        cached.update(zip(misses, embeddings))
+        logger.info(
+            f"Embedded {len(misses)} of {len(texts)} texts, "
+            f"{len(texts) - len(misses)} were cached"
+        )
+        return [cached[text] for text in texts]
+
+    def get_text_embedding_batch(
+        self, texts: List[str], show_progress: bool = False, **kwargs: Any
+    ) -> List[Embedding]:
+        cached = self._lookup(texts)
+        misses = list(dict.fromkeys(text for text in texts if text not in cached))
+        embeddings = (
+            self._embed_model.get_text_embedding_batch(misses, show_progress, **kwargs)
+            if misses
+            else []
+        )
+        return self._merge(texts, cached, misses, embeddings)
+
+    async def aget_text_embedding_batch(
+        self, texts: List[str], show_progress: bool = False
+    ) -> List[Embedding]:
+        cached = self._lookup(texts)
+        misses = list(dict.fromkeys(text for text in texts if text not in cached))
+        embeddings = (
+            await self._embed_model.aget_text_embedding_batch(misses, show_progress)
+            if misses
+            else []
+        )
+        return self._merge(texts, cached, misses, embeddings)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self.get_text_embedding_batch([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self.aget_text_embedding_batch([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self.aget_text_embedding_batch(texts)
+
+    # The private methods of the wrapped model are called so a query embedding is
+    # reported to the callback manager once, by this model
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embed_model._aget_query_embedding(query)
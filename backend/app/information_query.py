@@ -1,23 +1,50 @@
+import asyncio
+import json
 import logging
 import os
+import shutil
+import threading
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional
-
-import PyPDF2
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from weakref import WeakKeyDictionary, WeakValueDictionary
+
+from app.core.config import settings
+from app.core.timing import StageTimer
+from app.embedding_cache import CachedEmbedding
+from app.llm_backends import get_embed_model, get_llm, model_id
+from app.policy_registry import (
+    LazyPolicyQueryEngine,
+    LiveRegistry,
+    PolicyAgent,
+    PolicyRegistry,
+    agent_runner,
+)
+from app.policy_router import PolicyRouter
+from app.policy_summaries import (
+    PolicySummary,
+    PolicySummaryQueryEngine,
+    SectionSummarizer,
+    read_summaries,
+    write_summaries,
+)
+from app.text_cache import content_hash, invalidate, iter_pages
+from app.usage import usage_handler
+from app.vector_store import MmapVectorStore
 from llama_index.agent.openai import OpenAIAgent
 from llama_index.core import (
     Document,
     Settings,
     StorageContext,
-    SummaryIndex,
     VectorStoreIndex,
     load_index_from_storage,
 )
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.llms import LLM, ChatMessage
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.objects import ObjectIndex
+from llama_index.core.schema import BaseNode
 from llama_index.core.tools import QueryEngineTool, ToolMetadata
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
 
 # Set up logging
 logging.basicConfig(
@@ -28,17 +55,39 @@ logger = logging.getLogger(__name__)
 # Define the directory where your PDF policies are stored
 PDF_DIRECTORY = Path("insurance_policies")
 
+# Files persisted next to each policy's storage context
+MANIFEST_FILE = "manifest.json"
+VECTOR_INDEX_ID = "vector"
+# Bump to rebuild persisted indexes when the way nodes are produced changes
+INDEX_FORMAT = 3
+
+# Number of nodes embedded and indexed at a time while ingesting a policy
+INGEST_BATCH_SIZE = 64
+
+
+_node_parser = None
+
 
 def initialize_settings():
     try:
-        Settings.llm = OpenAI(temperature=0, model="gpt-4o-mini")
-        Settings.embed_model = OpenAIEmbedding(model="text-embedding-ada-002")
+        Settings.callback_manager = CallbackManager([usage_handler])
+        Settings.llm = get_llm(temperature=0)
+        Settings.embed_model = CachedEmbedding(get_embed_model())
         return SentenceSplitter()
     except Exception as e:
         logger.error(f"Failed to initialize global settings: {str(e)}")
         raise
 
 
+def get_node_parser() -> SentenceSplitter:
+    """Initialize the global LlamaIndex settings once and return the node parser."""
+    global _node_parser
+
+    if _node_parser is None:
+        _node_parser = initialize_settings()
+    return _node_parser
+
+
 def build_folder_structure_index(base_path: Path) -> Dict[str, List[str]]:
     """
     Build a dictionary representing the folder structure of insurance policies.
@@ -62,6 +111,52 @@ def build_folder_structure_index(base_path: Path) -> Dict[str, List[str]]:
         return {}
 
 
+def iter_page_documents(file_path: str) -> Iterator[Document]:
+    """
+    Yield one Document per page of a PDF file, streaming the pages from the text cache.
+
+    Args:
+        file_path (str): The path to the PDF file.
+
+    Yields:
+        Document: The next page, with its 1-based page number as "page_label" metadata.
+    """
+    for page_number, text in enumerate(iter_pages(file_path), start=1):
+        yield Document(
+            text=text, metadata={"source": file_path, "page_label": str(page_number)}
+        )
+
+
+def iter_policy_nodes(
+    file_path: str, node_parser: SentenceSplitter, timer: Optional[StageTimer] = None
+) -> Iterator[BaseNode]:
+    """
+    Yield the nodes of a PDF file page by page.
+
+    Each page is split on its own, so only one page's text and nodes are in flight at a
+    time and every node carries the page it came from.
+
+    Args:
+        file_path (str): The path to the PDF file.
+        node_parser (SentenceSplitter): The parser used to split the pages into nodes.
+        timer (Optional[StageTimer]): Records the "extract" and "split" stages.
+
+    Yields:
+        BaseNode: The next node.
+    """
+    timer = timer or StageTimer()
+    documents = iter_page_documents(file_path)
+    while True:
+        with timer.stage("extract"):
+            document = next(documents, None)
+        if document is None:
+            return
+        timer.count("pages")
+        with timer.stage("split"):
+            nodes = node_parser.get_nodes_from_documents([document])
+        yield from nodes
+
+
 def load_pdf(file_path: str) -> Optional[List[Document]]:
     """
     Load a PDF file and convert it to a list of Document objects.
@@ -70,114 +165,275 @@ def load_pdf(file_path: str) -> Optional[List[Document]]:
         file_path (str): The path to the PDF file.
 
     Returns:
-        Optional[List[Document]]: A list containing a single Document object with the PDF's text content,
+        Optional[List[Document]]: A list with one Document object per page of the PDF,
                                   or None if an error occurs.
     """
     try:
-        with open(file_path, "rb") as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = "".join(page.extract_text() for page in pdf_reader.pages)
-        return [Document(text=text, metadata={"source": file_path})]
+        return list(iter_page_documents(file_path))
     except Exception as e:
         logger.error(f"Error loading PDF {file_path}: {str(e)}")
         return None
 
 
-# Build agents dictionary
-agents = {}
-query_engines = {}
+def read_manifest(index_path: Path) -> Optional[dict]:
+    manifest_path = index_path / MANIFEST_FILE
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest {manifest_path}: {str(e)}")
+        return None
+
 
-# This is for the baseline
-all_nodes = []
+def write_manifest(index_path: Path, manifest: dict) -> None:
+    # Write to a temporary file first so a crash never leaves a manifest that
+    # vouches for a half-persisted index.
+    manifest_path = index_path / MANIFEST_FILE
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_path)
 
 
-def create_agents_and_databases():
-    node_parser = initialize_settings()
-    agents = {}
-    query_engines = {}
-    all_tools = []
+def _page_order(node: BaseNode) -> int:
+    return int(node.metadata.get("page_label", 0))
 
-    for company_folder in PDF_DIRECTORY.iterdir():
-        if company_folder.is_dir():
-            company_name = company_folder.name
-            for policy_file in company_folder.glob("*.pdf"):
-                policy_name = policy_file.stem
-                full_policy_name = f"{company_name}_{policy_name}"
 
-                policy_docs = load_pdf(str(policy_file))
-                nodes = node_parser.get_nodes_from_documents(policy_docs)
+def load_policy_indexes(
+    policy_file: Path,
+    index_path: Path,
+    node_parser: SentenceSplitter,
+    timer: Optional[StageTimer] = None,
+) -> Tuple[VectorStoreIndex, PolicySummary]:
+    """
+    Load the vector index and summaries of a policy, building them only if needed.
 
-                index_path = company_folder / f"{full_policy_name}_index"
-                if not os.path.exists(index_path):
-                    vector_index = VectorStoreIndex(nodes)
-                    vector_index.storage_context.persist(persist_dir=index_path)
-                else:
-                    vector_index = load_index_from_storage(
-                        StorageContext.from_defaults(persist_dir=index_path),
-                    )
+    The parsed nodes and the index structure share one storage context persisted in
+    index_path, with the embeddings in a memory-mapped MmapVectorStore. The section and
+    policy summaries are generated while the nodes are embedded and persisted next to
+    it. A manifest records the content hash of the PDF they were built from, so an
+    unchanged policy is loaded straight from disk without parsing the PDF or asking
+    the LLM for summaries again.
 
-                summary_index = SummaryIndex(nodes)
-
-                vector_query_engine = vector_index.as_query_engine(llm=Settings.llm)
-                summary_query_engine = summary_index.as_query_engine(llm=Settings.llm)
-
-                query_engine_tools = [
-                    QueryEngineTool(
-                        query_engine=vector_query_engine,
-                        metadata=ToolMetadata(
-                            name=f"vector_tool_{full_policy_name}",
-                            description=(
-                                f"Useful for questions related to specific aspects of the {company_name} {policy_name} insurance policy "
-                                "(e.g. coverage details, exclusions, premiums, or more)."
-                            ),
-                        ),
-                    ),
-                    QueryEngineTool(
-                        query_engine=summary_query_engine,
-                        metadata=ToolMetadata(
-                            name=f"summary_tool_{full_policy_name}",
-                            description=(
-                                f"Useful for any requests that require a holistic summary of EVERYTHING about the {company_name} {policy_name} "
-                                "insurance policy. For questions about more specific sections, please use the vector_tool."
-                            ),
-                        ),
-                    ),
-                ]
+    Args:
+        policy_file (Path): The policy PDF.
+        index_path (Path): The directory holding the persisted indexes.
+        node_parser (SentenceSplitter): The parser used to split the policy into nodes.
+        timer (Optional[StageTimer]): Records the time spent in each ingestion stage.
 
-                function_llm = OpenAI(model="gpt-4o-mini")
-                agent = OpenAIAgent.from_tools(
-                    query_engine_tools,
-                    llm=function_llm,
-                    verbose=False,
-                    system_prompt=f"""\
+    Returns:
+        Tuple[VectorStoreIndex, PolicySummary]: The vector index and summaries of the
+                                                policy.
+    """
+    timer = timer or StageTimer()
+    policy_hash = content_hash(policy_file)
+    manifest = read_manifest(index_path)
+    policy_name = f"{policy_file.parent.name} {policy_file.stem}"
+    embed_model = Settings.embed_model.model_name
+
+    if (
+        manifest is not None
+        and manifest.get("sha256") == policy_hash
+        and manifest.get("format") == INDEX_FORMAT
+        # Manifests written before the embedding model was recorded are OpenAI's
+        and manifest.get("embed_model", "text-embedding-ada-002") == embed_model
+    ):
+        try:
+            with timer.stage("load"):
+                storage_context = StorageContext.from_defaults(
+                    persist_dir=index_path,
+                    vector_store=MmapVectorStore.from_persist_dir(index_path),
+                )
+                vector_index = load_index_from_storage(
+                    storage_context, index_id=VECTOR_INDEX_ID
+                )
+                summaries = read_summaries(index_path, policy_hash, model_id())
+        except Exception as e:
+            logger.warning(f"Rebuilding index {index_path}: {str(e)}")
+        else:
+            if summaries is None:
+                # Indexes persisted before summaries were, or with older prompts,
+                # only need the summaries generated from their stored nodes
+                with timer.stage("summarize"):
+                    summarizer = SectionSummarizer(policy_name, Settings.llm)
+                    summarizer.add(
+                        sorted(storage_context.docstore.docs.values(), key=_page_order)
+                    )
+                    summaries = summarizer.finish()
+                    write_summaries(index_path, policy_hash, model_id(), summaries)
+            return vector_index, summaries
+
+    if index_path.exists():
+        shutil.rmtree(index_path)
+    storage_context = StorageContext.from_defaults(vector_store=MmapVectorStore())
+    vector_index = VectorStoreIndex([], storage_context=storage_context)
+    vector_index.set_index_id(VECTOR_INDEX_ID)
+    summarizer = SectionSummarizer(policy_name, Settings.llm)
+
+    nodes = iter_policy_nodes(str(policy_file), node_parser, timer)
+    while batch := list(islice(nodes, INGEST_BATCH_SIZE)):
+        with timer.stage("embed"):
+            vector_index.insert_nodes(batch)
+        with timer.stage("summarize"):
+            summarizer.add(batch)
+        timer.count("nodes", len(batch))
+    with timer.stage("summarize"):
+        summaries = summarizer.finish()
+
+    with timer.stage("persist"):
+        storage_context.persist(persist_dir=index_path)
+        write_summaries(index_path, policy_hash, model_id(), summaries)
+        write_manifest(
+            index_path,
+            {
+                "sha256": policy_hash,
+                "format": INDEX_FORMAT,
+                "embed_model": embed_model,
+                "source": str(policy_file),
+            },
+        )
+
+    return vector_index, summaries
+
+
+def create_policy_agent(
+    company_name: str,
+    policy_name: str,
+    vector_index: VectorStoreIndex,
+    summaries: PolicySummary,
+) -> OpenAIAgent:
+    full_policy_name = f"{company_name}_{policy_name}"
+    vector_query_engine = vector_index.as_query_engine(llm=Settings.llm)
+    # The summaries were generated at ingestion, so this tool costs no LLM call
+    summary_query_engine = PolicySummaryQueryEngine.from_summary(
+        summaries, settings.SUMMARY_TOOL_MAX_TOKENS
+    )
+
+    query_engine_tools = [
+        QueryEngineTool(
+            query_engine=vector_query_engine,
+            metadata=ToolMetadata(
+                name=f"vector_tool_{full_policy_name}",
+                description=(
+                    f"Useful for questions related to specific aspects of the {company_name} {policy_name} insurance policy "
+                    "(e.g. coverage details, exclusions, premiums, or more)."
+                ),
+            ),
+        ),
+        QueryEngineTool(
+            query_engine=summary_query_engine,
+            metadata=ToolMetadata(
+                name=f"summary_tool_{full_policy_name}",
+                description=(
+                    f"Useful for any requests that require a holistic summary of EVERYTHING about the {company_name} {policy_name} "
+                    "insurance policy. For questions about more specific sections, please use the vector_tool."
+                ),
+            ),
+        ),
+    ]
+
+    function_llm = get_llm()
+    agent = OpenAIAgent.from_tools(
+        query_engine_tools,
+        llm=function_llm,
+        verbose=False,
+        system_prompt=f"""\
 You are a specialized agent designed to answer queries about the {company_name} {policy_name} insurance policy.
 You must ALWAYS use at least one of the tools provided when answering a question; do NOT rely on prior knowledge.\
 """,
-                )
+    )
 
-                agents[full_policy_name] = agent
-                query_engines[full_policy_name] = vector_index.as_query_engine(
-                    similarity_top_k=2
-                )
+    return agent
 
-                doc_tool = QueryEngineTool(
-                    query_engine=agent,
-                    metadata=ToolMetadata(
-                        name=f"tool_{full_policy_name}",
-                        description=f"This tool provides information about the {company_name} {policy_name} insurance policy. Use "
-                        f"this tool for any questions specifically about the {company_name} {policy_name} policy.\n",
-                    ),
-                )
-                all_tools.append(doc_tool)
 
-    obj_index = ObjectIndex.from_objects(
-        all_tools,
-        index_cls=VectorStoreIndex,
+_policy_locks: "WeakValueDictionary[str, threading.RLock]" = WeakValueDictionary()
+_policy_locks_lock = threading.Lock()
+
+
+def policy_lock(full_policy_name: str) -> threading.RLock:
+    """
+    Return the lock serializing building, registering and deleting one policy.
+
+    Whoever holds it is the only one reading, rewriting or removing the policy's
+    persisted indexes, e.g. an ingestion job and a lazy build of the same policy.
+    """
+    with _policy_locks_lock:
+        lock = _policy_locks.get(full_policy_name)
+        if lock is None:
+            lock = threading.RLock()
+            _policy_locks[full_policy_name] = lock
+        return lock
+
+
+def build_policy_agent(
+    policy_file: Path, timer: Optional[StageTimer] = None
+) -> PolicyAgent:
+    """
+    Build the vector index, summaries and agent for a single policy.
+
+    Args:
+        policy_file (Path): The policy PDF, stored in its insurance company's folder.
+        timer (Optional[StageTimer]): Records the time spent in each ingestion stage.
+
+    Returns:
+        PolicyAgent: The policy agent, a plain vector query engine over the policy and
+                     its vector index.
+    """
+    company_folder = policy_file.parent
+    company_name = company_folder.name
+    policy_name = policy_file.stem
+    full_policy_name = f"{company_name}_{policy_name}"
+
+    timer = timer or StageTimer()
+    index_path = company_folder / f"{full_policy_name}_index"
+    with policy_lock(full_policy_name):
+        # Hashed first, so a change while building makes the registry rebuild it
+        policy_hash = content_hash(policy_file)
+        vector_index, summaries = load_policy_indexes(
+            policy_file, index_path, get_node_parser(), timer
+        )
+
+    with timer.stage("build_agent"):
+        agent = create_policy_agent(company_name, policy_name, vector_index, summaries)
+
+    return PolicyAgent(
+        agent=agent,
+        query_engine=vector_index.as_query_engine(similarity_top_k=2),
+        vector_index=vector_index,
+        content_hash=policy_hash,
     )
 
-    top_agent = OpenAIAgent.from_tools(
-        all_tools,
-        system_prompt=""" \
+
+def build_policy_tool(registry: PolicyRegistry, name: str) -> QueryEngineTool:
+    """
+    Build the tool exposing a registered policy to the top agent.
+
+    The tool only holds the policy's name; its agent is resolved from the given registry
+    version when the tool is called, so building the tool never touches the policy itself.
+
+    Args:
+        registry (PolicyRegistry): The registry version the tool belongs to.
+        name (str): The full policy name, e.g. "IF_Bil".
+
+    Returns:
+        QueryEngineTool: The tool for the top agent.
+    """
+    policy_file = registry.policy_file(name)
+    company_name = policy_file.parent.name
+    policy_name = policy_file.stem
+    return QueryEngineTool(
+        query_engine=LazyPolicyQueryEngine(registry, name),
+        metadata=ToolMetadata(
+            name=f"tool_{name}",
+            description=f"This tool provides information about the {company_name} {policy_name} insurance policy. Use "
+            f"this tool for any questions specifically about the {company_name} {policy_name} policy.\n",
+        ),
+    )
+
+
+TOP_AGENT_PROMPT = """ \
 You are an expert Danish insurance agent designed to answer queries about various insurance policies from different companies.
 Your primary task is to provide accurate information based on the specific insurance policies you have access to.
 
@@ -185,16 +441,283 @@ Here are your instructions:
 1. ALWAYS use at least one of the provided tools to answer questions. Do not rely on prior knowledge.
 2. When a query mentions a specific company or policy, use the corresponding tool.
 3. If you don't have access to information about a specific policy or company mentioned in the query, clearly state this limitation.
-""",
-        verbose=False,
+"""
+
+
+class TopAgent:
+    """
+    The agent that answers queries using the per-policy tools.
+
+    With more tools than tool_top_k, the tool descriptions are embedded into an
+    ObjectIndex when the top agent is built, and each query is answered by an agent
+    offered only the tool_top_k tools most similar to it, so the prompt does not grow
+    with the number of policies. The tools are retrieved before that agent runs: an
+    agent given the retriever itself would retrieve them with a blocking embedding
+    call on every step, also on the event loop.
+
+    tool_top_k defaults to settings.TOP_AGENT_TOOL_TOP_K; 0 offers every tool. The
+    agents use Settings.llm unless an llm is given.
+    """
+
+    def __init__(
+        self,
+        tools: List[QueryEngineTool],
+        tool_top_k: Optional[int] = None,
+        llm: Optional[LLM] = None,
+    ):
+        if tool_top_k is None:
+            tool_top_k = settings.TOP_AGENT_TOOL_TOP_K
+        self._llm = llm
+        self._retriever = None
+        self._agent = None
+        if tool_top_k and len(tools) > tool_top_k:
+            obj_index = ObjectIndex.from_objects(tools, index_cls=VectorStoreIndex)
+            self._retriever = obj_index.as_retriever(similarity_top_k=tool_top_k)
+        else:
+            self._agent = self._build(tools)
+
+    def _build(self, tools: List[QueryEngineTool]) -> OpenAIAgent:
+        return OpenAIAgent.from_tools(
+            tools, llm=self._llm, system_prompt=TOP_AGENT_PROMPT, verbose=False
+        )
+
+    def agent(self, query: str) -> OpenAIAgent:
+        """Return the agent offering the tools for a query; this may embed the query."""
+        if self._retriever is None:
+            return self._agent
+        return self._build(self._retriever.retrieve(query))
+
+    async def aagent(self, query: str) -> OpenAIAgent:
+        """Like agent, embedding the query without blocking the event loop."""
+        if self._retriever is None:
+            return self._agent
+        return self._build(await self._retriever.aretrieve(query))
+
+
+def create_top_agent(registry: PolicyRegistry) -> TopAgent:
+    get_node_parser()
+    return TopAgent([build_policy_tool(registry, name) for name in registry.names()])
+
+
+live_registry = LiveRegistry(
+    PolicyRegistry(
+        build_policy_agent,
+        max_resident=settings.POLICY_AGENT_CACHE_SIZE,
+        top_agent_factory=create_top_agent,
+        fingerprint=content_hash,
     )
+)
+
+
+def scan_policies(base_path: Path = PDF_DIRECTORY) -> Dict[str, Path]:
+    """
+    Find every policy PDF under base_path.
+
+    Args:
+        base_path (Path): The base directory containing company folders.
 
-    return agents, query_engines, top_agent
+    Returns:
+        Dict[str, Path]: The full policy names, e.g. "IF_Bil", and their PDF files.
+    """
+    policies = {}
+    for company, policy_files in build_folder_structure_index(base_path).items():
+        for policy_file in policy_files:
+            policy_path = base_path / company / policy_file
+            policies[f"{company}_{policy_path.stem}"] = policy_path
+    return policies
 
 
-agents, query_engines, top_agent = create_agents_and_databases()
+def load_registry(base_path: Path = PDF_DIRECTORY, warm: bool = False) -> None:
+    """
+    Re-scan base_path and swap in a registry version with the policies found.
 
+    Queries already running keep using the previous version until they finish. With
+    warm, the agents resident in the current version are rebuilt on the new version
+    before it is swapped in, so no request pays for building them.
 
-def process_query(query, top_agent=top_agent):
-    response = top_agent.query(query)
+    Args:
+        base_path (Path): The base directory containing company folders.
+        warm (bool): Whether to build the resident agents before swapping.
+    """
+    policies = scan_policies(base_path)
+    current = live_registry.current()
+    registry = current.with_policies(policies)
+    if warm:
+        for name in current.resident():
+            if name in registry:
+                registry.get(name)
+        registry.top_agent()
+
+    # A concurrent register or unregister may have happened while warming; keep it
+    # rather than dropping it with a stale catalogue.
+    def derive(latest: PolicyRegistry) -> PolicyRegistry:
+        return registry if latest is current else latest.with_policies(policies)
+
+    live_registry.update(derive)
+
+
+def register_policy(
+    company_name: str,
+    policy_name: str,
+    timer: Optional[StageTimer] = None,
+    cancelled: Optional[threading.Event] = None,
+) -> None:
+    """
+    Build a single policy and swap in a registry version that includes it.
+
+    Only the given policy is read, split and embedded; the other policies are left
+    untouched. A previous version of the policy keeps serving queries until the new
+    one is built, and queries already running finish on the version they started on.
+
+    Args:
+        company_name (str): The insurance company folder name.
+        policy_name (str): The policy file name without the .pdf extension.
+        timer (Optional[StageTimer]): Records the time spent in each ingestion stage.
+        cancelled (Optional[threading.Event]): Set when the policy is deleted meanwhile,
+                                               in which case it is not registered.
+    """
+    full_policy_name = f"{company_name}_{policy_name}"
+    policy_file = PDF_DIRECTORY / company_name / f"{policy_name}.pdf"
+    # Held until registered, so a deletion waits and then removes what was registered
+    with policy_lock(full_policy_name):
+        policy_agent = build_policy_agent(policy_file, timer)
+        if cancelled is not None and cancelled.is_set():
+            logger.info(f"Skipped registering deleted policy {full_policy_name}")
+            return
+        live_registry.update(
+            lambda registry: registry.with_policy(
+                full_policy_name, policy_file, policy_agent
+            )
+        )
+    logger.info(f"Registered policy {full_policy_name}")
+
+
+def unregister_policy(company_name: str, policy_name: str) -> None:
+    """
+    Swap in a registry version without the given policy.
+
+    Args:
+        company_name (str): The insurance company folder name.
+        policy_name (str): The policy file name without the .pdf extension.
+    """
+    full_policy_name = f"{company_name}_{policy_name}"
+    invalidate(PDF_DIRECTORY / company_name / f"{policy_name}.pdf")
+    if full_policy_name in live_registry.current():
+        live_registry.update(lambda registry: registry.without_policy(full_policy_name))
+        logger.info(f"Unregistered policy {full_policy_name}")
+
+
+load_registry()
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    get_node_parser()
+    return Settings.embed_model.get_text_embedding_batch(texts)
+
+
+_routers: "WeakKeyDictionary[PolicyRegistry, PolicyRouter]" = WeakKeyDictionary()
+_routers_lock = threading.Lock()
+
+
+def get_router(registry: PolicyRegistry) -> PolicyRouter:
+    """Return the policy router over the policies of a registry version."""
+    with _routers_lock:
+        router = _routers.get(registry)
+        if router is None:
+            router = PolicyRouter(
+                {name: registry.policy_file(name) for name in registry.names()},
+                fuzzy_cutoff=settings.POLICY_ROUTER_FUZZY_CUTOFF,
+                embed=embed_texts if settings.POLICY_ROUTER_EMBEDDINGS else None,
+                similarity_threshold=settings.POLICY_ROUTER_SIMILARITY,
+            )
+            _routers[registry] = router
+        return router
+
+
+def route_query(query: str, registry: PolicyRegistry) -> Optional[str]:
+    """
+    Pick the policy agent that should answer a query directly, if any.
+
+    Args:
+        query (str): The user's question.
+        registry (PolicyRegistry): The registry version to answer from.
+
+    Returns:
+        Optional[str]: The full policy name, or None if the top agent should decide.
+    """
+    if not settings.POLICY_ROUTER_ENABLED:
+        return None
+    return get_router(registry).route(query)
+
+
+def question_scope(query: str, registry: PolicyRegistry) -> Tuple[str, ...]:
+    """The policies a query names, which answers to similar queries must share."""
+    return tuple(get_router(registry).named_policies(query))
+
+
+def process_query(query, registry: Optional[PolicyRegistry] = None):
+    if registry is None:
+        registry = live_registry.current()
+    name = route_query(query, registry)
+    agent = registry.get(name).agent if name else registry.top_agent().agent(query)
+    response = agent_runner(agent).query(query)
+    return response.response
+
+
+async def aselect_agent(query: str, registry: PolicyRegistry) -> OpenAIAgent:
+    # Routing may embed the query and building a policy agent reads from disk
+    name = await asyncio.to_thread(route_query, query, registry)
+    if name is None:
+        # Building the top agent embeds the descriptions of every policy tool
+        top_agent = await asyncio.to_thread(registry.top_agent)
+        return await top_agent.aagent(query)
+    return (await asyncio.to_thread(registry.get, name)).agent
+
+
+async def astream_query(
+    query: str,
+    registry: Optional[PolicyRegistry] = None,
+    chat_history: Optional[List[ChatMessage]] = None,
+) -> AsyncIterator[str]:
+    """
+    Answer a query, yielding the answer as the LLM produces it.
+
+    A query about a single policy goes straight to that policy's agent, any other
+    query to the top agent.
+
+    Args:
+        query (str): The user's question.
+        registry (Optional[PolicyRegistry]): The registry version to answer from.
+                                             Defaults to the current version.
+        chat_history (Optional[List[ChatMessage]]): The earlier turns of the
+                                                    conversation, if any.
+
+    Yields:
+        str: The next piece of the answer.
+    """
+    if registry is None:
+        registry = live_registry.current()
+    agent = await aselect_agent(query, registry)
+    # A limit of 0 disables conversation memory, so there is no history to bound
+    runner = agent_runner(
+        agent, chat_history, settings.CONVERSATION_MEMORY_TOKENS or None
+    )
+    response = await runner.astream_chat(query)
+    async for token in response.async_response_gen():
+        yield token
+
+
+async def aprocess_query(
+    query,
+    registry: Optional[PolicyRegistry] = None,
+    chat_history: Optional[List[ChatMessage]] = None,
+):
+    if registry is None:
+        registry = live_registry.current()
+    agent = await aselect_agent(query, registry)
+    # A limit of 0 disables conversation memory, so there is no history to bound
+    runner = agent_runner(
+        agent, chat_history, settings.CONVERSATION_MEMORY_TOKENS or None
+    )
+    response = await runner.achat(query)
     return response.response
@@ -0,0 +1,566 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import httpx
+import numpy as np
+from app.core.config import settings
+from app.llm_scheduler import LLMScheduler, llm_scheduler, retry_after_seconds
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    MessageRole,
+)
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import Field
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.llms.openai import OpenAI
+from openai import AsyncOpenAI
+from openai import OpenAI as OpenAIClient
+from openai.types import CompletionUsage
+from openai.types.chat import (
+    ChatCompletion,
+    ChatCompletionChunk,
+    ChatCompletionMessageToolCall,
+)
+
+# Words of the last message a fake answer echoes
+FAKE_ANSWER_WORDS = 40
+
+# Connection pools shared by every OpenAI LLM, embedding model and client
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_http_lock = threading.Lock()
+
+
+def _shard_limits() -> httpx.Limits:
+    shards = settings.LLM_HTTP_POOL_SHARDS
+    return httpx.Limits(
+        max_connections=max(1, -(-settings.LLM_HTTP_MAX_CONNECTIONS // shards)),
+        max_keepalive_connections=max(
+            1, -(-settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS // shards)
+        ),
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.LLM_HTTP_TIMEOUT_SECONDS,
+        connect=settings.LLM_HTTP_CONNECT_TIMEOUT_SECONDS,
+    )
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    # Response body that frees the request's scheduler slot once it is closed
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+def _scheduled_response(
+    response: httpx.Response, start: float, scheduler: LLMScheduler, stream_type: type
+) -> httpx.Response:
+    # The slot is held until the body has been read, but the limits adapt to the
+    # time until the response started
+    seconds = time.perf_counter() - start
+    retry_after = retry_after_seconds(response.headers)
+    return httpx.Response(
+        status_code=response.status_code,
+        headers=response.headers,
+        stream=stream_type(
+            response.stream,
+            lambda: scheduler.release(response.status_code, seconds, retry_after),
+        ),
+        extensions=response.extensions,
+    )
+
+
+class ShardedTransport(httpx.BaseTransport):
+    """
+    Connection pool split into shards that requests are spread over in turn.
+
+    httpcore scans every connection of a pool for every waiting request, so one large
+    pool spends more time assigning requests than sending them under concurrent load.
+    Each shard keeps its share of the limits, so the total stays as configured.
+
+    Every request first waits for a slot of the scheduler, which holds it until its
+    response has been read.
+    """
+
+    def __init__(self, shards: int, limits: httpx.Limits, scheduler: LLMScheduler):
+        self._transports = [httpx.HTTPTransport(limits=limits) for _ in range(shards)]
+        self._next = itertools.count()
+        self._scheduler = scheduler
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        shard = next(self._next) % len(self._transports)
+        self._scheduler.acquire_blocking()
+        start = time.perf_counter()
+        try:
+            response = self._transports[shard].handle_request(request)
+        except BaseException:
+            self._scheduler.release()
+            raise
+        return _scheduled_response(response, start, self._scheduler, _ReleasingStream)
+
+    def close(self) -> None:
+        for transport in self._transports:
+            transport.close()
+
+
+class AsyncShardedTransport(httpx.AsyncBaseTransport):
+    """Async version of ShardedTransport."""
+
+    def __init__(self, shards: int, limits: httpx.Limits, scheduler: LLMScheduler):
+        self._transports = [
+            httpx.AsyncHTTPTransport(limits=limits) for _ in range(shards)
+        ]
+        self._next = itertools.count()
+        self._scheduler = scheduler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        shard = next(self._next) % len(self._transports)
+        await self._scheduler.acquire()
+        start = time.perf_counter()
+        try:
+            response = await self._transports[shard].handle_async_request(request)
+        except BaseException:
+            self._scheduler.release()
+            raise
+        return _scheduled_response(
+            response, start, self._scheduler, _AsyncReleasingStream
+        )
+
+    async def aclose(self) -> None:
+        for transport in self._transports:
+            await transport.aclose()
+
+
+def get_http_client() -> httpx.Client:
+    """Return the keep-alive client every synchronous OpenAI request is sent with."""
+    global _http_client
+
+    with _http_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                transport=ShardedTransport(
+                    settings.LLM_HTTP_POOL_SHARDS, _shard_limits(), llm_scheduler
+                ),
+                timeout=_timeout(),
+            )
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the keep-alive client every asynchronous OpenAI request is sent with."""
+    global _async_http_client
+
+    with _http_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                transport=AsyncShardedTransport(
+                    settings.LLM_HTTP_POOL_SHARDS, _shard_limits(), llm_scheduler
+                ),
+                timeout=_timeout(),
+            )
+        return _async_http_client
+
+
+async def close_http_clients() -> None:
+    """Close the shared connection pools, e.g. when the app shuts down."""
+    global _http_client, _async_http_client
+
+    with _http_lock:
+        http_client, async_http_client = _http_client, _async_http_client
+        _http_client = _async_http_client = None
+    if http_client is not None:
+        http_client.close()
+    if async_http_client is not None:
+        await async_http_client.aclose()
+
+
+def model_id() -> str:
+    """Identify the configured LLM, for keys of anything persisted from its output."""
+    return f"{settings.LLM_BACKEND}:{settings.LLM_MODEL}"
+
+
+def _words(text: Optional[str]) -> List[str]:
+    return re.findall(r"\w+", text or "")
+
+
+def fake_answer(messages: Sequence[Tuple[str, Optional[str]]]) -> str:
+    """
+    Build the deterministic answer of the fake backends to a conversation.
+
+    Args:
+        messages (Sequence[Tuple[str, Optional[str]]]): The role and content of every
+                                                         message.
+
+    Returns:
+        str: A short Danish answer echoing the start of the last message.
+    """
+    content = next((content for role, content in reversed(messages) if content), "")
+    return "Svar: " + " ".join(_words(content)[:FAKE_ANSWER_WORDS])
+
+
+def _usage(messages: Sequence[Tuple[str, Optional[str]]], answer: str) -> dict:
+    prompt_tokens = sum(len(_words(content)) for _, content in messages)
+    completion_tokens = len(_words(answer))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+class FakeLLM(OpenAI):
+    """
+    LLM answering locally after latency seconds, for load tests and benchmarks.
+
+    It subclasses the OpenAI LLM so OpenAIAgent accepts it. When tools are offered
+    and the last message is the user's, it calls the first tool with the user's
+    message, which runs a question through the whole agent pipeline; otherwise it
+    answers with fake_answer.
+    """
+
+    latency: float = Field(default=0.0, description="Seconds every request takes.")
+
+    def __init__(self, latency: float = 0.0, **kwargs: Any):
+        kwargs.setdefault("model", settings.LLM_MODEL)
+        kwargs.setdefault("api_key", "fake")
+        super().__init__(latency=latency, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    def _respond(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        tools = kwargs.get("tools")
+        if tools and messages and messages[-1].role == MessageRole.USER:
+            tool_call = ChatCompletionMessageToolCall(
+                id=f"call_{len(messages)}",
+                type="function",
+                function={
+                    "name": tools[0]["function"]["name"],
+                    "arguments": json.dumps({"input": messages[-1].content}),
+                },
+            )
+            message = ChatMessage(
+                role=MessageRole.ASSISTANT,
+                content=None,
+                additional_kwargs={"tool_calls": [tool_call]},
+            )
+            answer = ""
+        else:
+            answer = fake_answer([(m.role.value, m.content) for m in messages])
+            message = ChatMessage(role=MessageRole.ASSISTANT, content=answer)
+        usage = _usage([(m.role.value, m.content) for m in messages], answer)
+        return ChatResponse(message=message, raw={"usage": usage})
+
+    def _chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        time.sleep(self.latency)
+        return self._respond(messages, **kwargs)
+
+    async def _achat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponse:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages, **kwargs)
+
+    def _stream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseGen:
+        response = self._chat(messages, **kwargs)
+
+        def gen() -> ChatResponseGen:
+            yield from _stream_response(response)
+
+        return gen()
+
+    async def _astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        response = await self._achat(messages, **kwargs)
+
+        async def gen() -> ChatResponseAsyncGen:
+            for chunk in _stream_response(response):
+                yield chunk
+
+        return gen()
+
+
+def _stream_response(response: ChatResponse) -> Iterator[ChatResponse]:
+    # Tool calls arrive in one chunk; an answer word by word
+    if not response.message.content:
+        yield response
+        return
+    content = ""
+    for word in response.message.content.split(" "):
+        delta = f" {word}" if content else word
+        content += delta
+        yield ChatResponse(
+            message=ChatMessage(role=MessageRole.ASSISTANT, content=content),
+            delta=delta,
+            raw=response.raw,
+        )
+
+
+class HashingEmbedding(BaseEmbedding):
+    """
+    Embedding model hashing words into embed_dim signed buckets, without a network.
+
+    Texts sharing words get similar embeddings, so retrieval behaves plausibly, and
+    the same text always gets the same embedding. Every request, i.e. every batch,
+    takes latency seconds.
+    """
+
+    embed_dim: int = Field(default=256, gt=0)
+    latency: float = Field(default=0.0, description="Seconds every request takes.")
+
+    def __init__(self, embed_dim: int = 256, latency: float = 0.0, **kwargs: Any):
+        super().__init__(
+            embed_dim=embed_dim,
+            latency=latency,
+            model_name=f"hashing-{embed_dim}",
+            **kwargs,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    def _embed(self, text: str) -> Embedding:
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for word in _words(text.casefold()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.embed_dim] += 1.0 if value & (1 << 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._aget_text_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class _FakeCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def _completion(self, model: str, messages: List[dict]) -> ChatCompletion:
+        pairs = [(message["role"], message.get("content")) for message in messages]
+        answer = fake_answer(pairs)
+        return ChatCompletion(
+            id="fake",
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": answer},
+                }
+            ],
+            usage=CompletionUsage(**_usage(pairs, answer)),
+        )
+
+    def _chunks(
+        self, completion: ChatCompletion, stream_options: Optional[dict]
+    ) -> Iterator[ChatCompletionChunk]:
+        words = completion.choices[0].message.content.split(" ")
+        for i, word in enumerate(words):
+            yield ChatCompletionChunk(
+                id=completion.id,
+                object="chat.completion.chunk",
+                created=completion.created,
+                model=completion.model,
+                choices=[
+                    {
+                        "index": 0,
+                        "delta": {"content": f" {word}" if i else word},
+                        "finish_reason": "stop" if i == len(words) - 1 else None,
+                    }
+                ],
+            )
+        if stream_options and stream_options.get("include_usage"):
+            yield ChatCompletionChunk(
+                id=completion.id,
+                object="chat.completion.chunk",
+                created=completion.created,
+                model=completion.model,
+                choices=[],
+                usage=completion.usage,
+            )
+
+
+class _SyncFakeCompletions(_FakeCompletions):
+    def create(
+        self, model: str, messages: List[dict], stream: bool = False, **kwargs: Any
+    ):
+        time.sleep(self.latency)
+        completion = self._completion(model, messages)
+        if not stream:
+            return completion
+        return self._chunks(completion, kwargs.get("stream_options"))
+
+
+class _AsyncFakeCompletions(_FakeCompletions):
+    async def create(
+        self, model: str, messages: List[dict], stream: bool = False, **kwargs: Any
+    ):
+        await asyncio.sleep(self.latency)
+        completion = self._completion(model, messages)
+        if not stream:
+            return completion
+
+        async def chunks() -> AsyncIterator[ChatCompletionChunk]:
+            for chunk in self._chunks(completion, kwargs.get("stream_options")):
+                yield chunk
+
+        return chunks()
+
+
+class _FakeChat:
+    def __init__(self, completions: _FakeCompletions):
+        self.completions = completions
+
+
+class FakeOpenAIClient:
+    """Stand-in for openai.OpenAI answering chat completions like FakeLLM."""
+
+    def __init__(self, latency: float = 0.0):
+        self.chat = _FakeChat(_SyncFakeCompletions(latency))
+
+
+class FakeAsyncOpenAIClient:
+    """Stand-in for openai.AsyncOpenAI answering chat completions like FakeLLM."""
+
+    def __init__(self, latency: float = 0.0):
+        self.chat = _FakeChat(_AsyncFakeCompletions(latency))
+
+
+def _check_backend() -> None:
+    if settings.LLM_BACKEND not in ("openai", "fake"):
+        raise ValueError(f"Unknown LLM backend {settings.LLM_BACKEND}")
+
+
+def get_llm(**kwargs: Any) -> OpenAI:
+    """
+    Create an LLM of the configured backend, reporting to Settings.callback_manager.
+
+    OpenAI LLMs send their requests through the shared connection pools, so creating
+    one per agent opens no extra connections.
+
+    Args:
+        **kwargs: Passed on to the LLM, e.g. temperature.
+
+    Returns:
+        OpenAI: The OpenAI LLM, or a FakeLLM if settings.LLM_BACKEND is "fake".
+    """
+    _check_backend()
+    kwargs.setdefault("callback_manager", Settings.callback_manager)
+    if settings.LLM_BACKEND == "fake":
+        return FakeLLM(latency=settings.FAKE_LLM_LATENCY_SECONDS, **kwargs)
+    return OpenAI(
+        model=settings.LLM_MODEL,
+        timeout=settings.LLM_HTTP_TIMEOUT_SECONDS,
+        http_client=get_http_client(),
+        async_http_client=get_async_http_client(),
+        **kwargs,
+    )
+
+
+def get_embed_model() -> BaseEmbedding:
+    """Create the embedding model of the configured backend."""
+    _check_backend()
+    if settings.LLM_BACKEND == "fake":
+        return HashingEmbedding(
+            embed_dim=settings.FAKE_EMBEDDING_DIM,
+            latency=settings.FAKE_EMBEDDING_LATENCY_SECONDS,
+            callback_manager=Settings.callback_manager,
+        )
+    return OpenAIEmbedding(
+        model=settings.EMBEDDING_MODEL,
+        callback_manager=Settings.callback_manager,
+        timeout=settings.LLM_HTTP_TIMEOUT_SECONDS,
+        http_client=get_http_client(),
+        async_http_client=get_async_http_client(),
+    )
+
+
+def get_openai_clients() -> Tuple[Any, Any]:
+    """Create the sync and async chat completion clients of the configured backend."""
+    _check_backend()
+    if settings.LLM_BACKEND == "fake":
+        return (
+            FakeOpenAIClient(settings.FAKE_LLM_LATENCY_SECONDS),
+            FakeAsyncOpenAIClient(settings.FAKE_LLM_LATENCY_SECONDS),
+        )
+    return (
+        OpenAIClient(http_client=get_http_client()),
+        AsyncOpenAI(http_client=get_async_http_client()),
+    )
@@ -0,0 +1,307 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Priorities of outbound requests; lower values are sent first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Responses that mean the provider is overloaded or rate limiting us
+THROTTLED_STATUS_CODES = (429, 503)
+# Pause after a throttled response that does not say how long to wait
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+# Factor the concurrency limit is multiplied by on a throttled or slow response
+THROTTLED_BACKOFF = 0.5
+SLOW_BACKOFF = 0.9
+# Weight of the latest latency in the smoothed latency
+LATENCY_SMOOTHING = 0.2
+# Per response, the baseline latency drifts this much towards the smoothed latency,
+# so a lasting change in latency becomes the new normal
+BASELINE_DRIFT = 0.01
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    """Send the LLM and embedding requests made in this context with the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def retry_after_seconds(headers: Any) -> Optional[float]:
+    """Read how long a throttled response asks us to wait, if it says so in seconds."""
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            continue
+    return None
+
+
+class _Waiter:
+    def __init__(self, priority: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self._loop = loop
+        if loop is None:
+            self._event = threading.Event()
+        else:
+            self._future = loop.create_future()
+
+    def grant(self) -> None:
+        self.granted = True
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self._future.done():
+            self._future.set_result(None)
+
+
+class LLMScheduler:
+    """
+    Admits outbound LLM and embedding requests by priority, within adaptive limits.
+
+    At most `limit` requests are in flight. Requests over the limit wait in a queue
+    ordered by priority, then arrival, so interactive questions go before background
+    ingestion. The limit adapts like TCP congestion control: it grows by about one per
+    `limit` successful responses, up to max_concurrency, and shrinks on a throttled
+    response (429 or 503), or when the smoothed latency exceeds latency_tolerance times
+    its usual value, down to min_concurrency. A throttled response also pauses every
+    new request for as long as its Retry-After asks.
+
+    Admitted requests are paced by a token bucket of requests_per_second with room for
+    burst requests at once; 0 requests per second disables pacing.
+
+    Both coroutines and threads can acquire slots, so the blocking OpenAI clients used
+    during ingestion share the limits with the async ones used for questions.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        requests_per_second: float = 0.0,
+        burst: int = 1,
+        latency_tolerance: float = 0.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.requests_per_second = requests_per_second
+        self.burst = max(1, burst)
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        # Requests admitted, seconds waited in the queue and the longest wait
+        self._waits = {
+            priority: {"requests": 0, "seconds": 0.0, "max_seconds": 0.0}
+            for priority in PRIORITY_NAMES
+        }
+        self._throttled = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_concurrency, int(self._limit))
+
+    def _enqueue(self, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        # Takes a slot right away if one is free and nobody is waiting for it
+        priority = _priority.get()
+        with self._lock:
+            if self._in_flight < self.limit and not self._queue:
+                self._in_flight += 1
+                self._record_wait(priority, 0.0)
+                return None
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._queued[priority] += 1
+            return waiter
+
+    def _grant(self) -> None:
+        while self._queue and self._in_flight < self.limit:
+            _, _, waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            self._queued[waiter.priority] -= 1
+            self._in_flight += 1
+            self._record_wait(waiter.priority, time.monotonic() - waiter.queued_at)
+            waiter.grant()
+
+    def _record_wait(self, priority: int, seconds: float) -> None:
+        waits = self._waits[priority]
+        waits["requests"] += 1
+        waits["seconds"] += seconds
+        waits["max_seconds"] = max(waits["max_seconds"], seconds)
+
+    def _reserve(self) -> float:
+        # Takes a token from the bucket, returning how long to wait for it
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._paused_until - now)
+            if self.requests_per_second <= 0:
+                return delay
+            elapsed = now - self._refilled_at
+            self._tokens = min(
+                self.burst, self._tokens + elapsed * self.requests_per_second
+            )
+            self._refilled_at = now
+            self._tokens -= 1
+            if self._tokens < 0:
+                delay = max(delay, -self._tokens / self.requests_per_second)
+            return delay
+
+    async def acquire(self) -> None:
+        """Wait for a slot, and for pacing, before sending a request."""
+        waiter = self._enqueue(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await waiter._future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter.granted:
+                        self._in_flight -= 1
+                        self._grant()
+                    else:
+                        waiter.cancelled = True
+                        self._queued[waiter.priority] -= 1
+                raise
+        delay = self._reserve()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+
+    def acquire_blocking(self) -> None:
+        """Like acquire, blocking the calling thread."""
+        waiter = self._enqueue(None)
+        if waiter is not None:
+            waiter._event.wait()
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(
+        self,
+        status_code: Optional[int] = None,
+        seconds: Optional[float] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """
+        Free the slot of a finished request and adapt the limits to its response.
+
+        Args:
+            status_code (Optional[int]): The response status, or None if the request
+                                         failed without a response.
+            seconds (Optional[float]): How long the response took to arrive.
+            retry_after (Optional[float]): How long a throttled response asked us to
+                                           wait.
+        """
+        with self._lock:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if status_code in THROTTLED_STATUS_CODES:
+                self._throttled += 1
+                pause = (
+                    DEFAULT_RETRY_AFTER_SECONDS if retry_after is None else retry_after
+                )
+                self._paused_until = max(self._paused_until, now + pause)
+                self._decrease(now, THROTTLED_BACKOFF)
+            elif status_code is not None and status_code < 500 and seconds is not None:
+                self._adapt_to_latency(now, seconds)
+            self._grant()
+
+    def _decrease(self, now: float, factor: float) -> None:
+        # One decrease per smoothed round trip, as the responses of requests sent
+        # before the last decrease say nothing about the new limit
+        if now - self._decreased_at < (self._latency or 0.0):
+            return
+        self._decreased_at = now
+        limit = max(self.min_concurrency, self._limit * factor)
+        if int(limit) < int(self._limit):
+            logger.info(f"LLM concurrency limit lowered to {int(limit)}")
+        self._limit = limit
+
+    def _adapt_to_latency(self, now: float, seconds: float) -> None:
+        if self._latency is None:
+            self._latency = self._baseline = seconds
+        else:
+            self._latency += LATENCY_SMOOTHING * (seconds - self._latency)
+            self._baseline = min(
+                self._latency,
+                self._baseline + BASELINE_DRIFT * (self._latency - self._baseline),
+            )
+        if (
+            self.latency_tolerance > 0
+            and self._latency > self._baseline * self.latency_tolerance
+        ):
+            self._decrease(now, SLOW_BACKOFF)
+        else:
+            self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The current limit, in-flight requests, queue depth and waits by priority."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queued": {
+                    name: self._queued[priority]
+                    for priority, name in PRIORITY_NAMES.items()
+                },
+                "waits": {
+                    name: {
+                        "requests": self._waits[priority]["requests"],
+                        "seconds": round(self._waits[priority]["seconds"], 3),
+                        "max_seconds": round(self._waits[priority]["max_seconds"], 3),
+                    }
+                    for priority, name in PRIORITY_NAMES.items()
+                },
+                "throttled": self._throttled,
+                "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+                "latency_seconds": (
+                    None if self._latency is None else round(self._latency, 3)
+                ),
+            }
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    min_concurrency=settings.LLM_MIN_CONCURRENCY,
+    requests_per_second=settings.LLM_REQUESTS_PER_SECOND,
+    burst=settings.LLM_REQUEST_BURST,
+    latency_tolerance=settings.LLM_LATENCY_TOLERANCE,
+)
@@ -1,4 +1,5 @@
 from app.api.v1.api import api_router
+from app.llm_backends import close_http_clients
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -19,6 +20,12 @@ app.add_middleware(
 
 app.include_router(api_router, prefix="/api/v1")
 
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_clients()
+
+
 if __name__ == "__main__":
     import uvicorn
 
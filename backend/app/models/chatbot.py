@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import List
+
+from pydantic import BaseModel, Field
 
 
 class ComparisonRequest(BaseModel):
@@ -7,5 +9,10 @@ class ComparisonRequest(BaseModel):
     query: str
 
 
+class MultiComparisonRequest(BaseModel):
+    policies: List[str] = Field(..., min_length=2)
+    query: str
+
+
 class QuestionRequest(BaseModel):
     question: str
@@ -0,0 +1,27 @@
+from datetime import datetime
+from enum import Enum
+from typing import Dict, Optional
+
+from pydantic import BaseModel, Field
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class IngestionJob(BaseModel):
+    id: str
+    insurance_name: str
+    policy_name: str
+    status: JobStatus = JobStatus.QUEUED
+    stage: Optional[str] = None  # Stage currently running
+    progress: Dict[str, int] = Field(default_factory=dict)  # e.g. pages, nodes
+    timings: Dict[str, float] = Field(default_factory=dict)  # Seconds per stage
+    error: Optional[str] = None
+    createdAt: datetime = Field(default_factory=datetime.now)
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
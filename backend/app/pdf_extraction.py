@@ -0,0 +1,187 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import PyPDF2
+from app.core.config import settings
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def default_workers() -> int:
+    return settings.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+
+
+def get_process_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Return the process pool shared by all PDF extraction calls.
+
+    The pool is created on first use and recreated only if a different worker count is
+    requested. Workers are spawned rather than forked since the server process runs
+    threads.
+
+    Args:
+        max_workers (Optional[int]): The number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor: The shared pool.
+    """
+    global _pool, _pool_workers
+
+    max_workers = max_workers or default_workers()
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_workers = max_workers
+        return _pool
+
+
+def count_pages(file_path: str) -> int:
+    with open(file_path, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """
+    Extract the text of the pages [start, stop) of a PDF file.
+
+    Args:
+        file_path (str): The path to the PDF file.
+        start (int): The first page, zero-based.
+        stop (int): The page after the last page.
+
+    Returns:
+        List[str]: The text of each page, in page order.
+    """
+    with open(file_path, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+def _page_ranges(page_count: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    return [
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+
+
+def extract_many(
+    file_paths: Sequence[str],
+    max_workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+) -> List[List[str]]:
+    """
+    Extract the pages of several PDF files on a process pool.
+
+    Every file is split into ranges of pages_per_task pages and all ranges of all files
+    are extracted concurrently. The results are merged back per file in page order.
+
+    Args:
+        file_paths (Sequence[str]): The paths to the PDF files.
+        max_workers (Optional[int]): The number of worker processes. Defaults to
+                                     settings.PDF_EXTRACTION_WORKERS or the CPU count.
+        pages_per_task (Optional[int]): The number of pages extracted per task.
+
+    Returns:
+        List[List[str]]: The page texts of each file, in the order of file_paths.
+    """
+    max_workers = max_workers or default_workers()
+    pages_per_task = pages_per_task or settings.PDF_PAGES_PER_TASK
+    tasks = [
+        (index, file_path, start, stop)
+        for index, file_path in enumerate(file_paths)
+        for start, stop in _page_ranges(count_pages(file_path), pages_per_task)
+    ]
+
+    results: List[List[str]] = [[] for _ in file_paths]
+    if max_workers == 1 or len(tasks) <= 1:
+        for index, file_path, start, stop in tasks:
+            results[index].extend(extract_page_range(file_path, start, stop))
+        return results
+
+    pool = get_process_pool(max_workers)
+    futures = [
+        (index, pool.submit(extract_page_range, file_path, start, stop))
+        for index, file_path, start, stop in tasks
+    ]
+    # Tasks are submitted in page order, so collecting them in submission order
+    # keeps every file's pages in order.
+    for index, future in futures:
+        results[index].extend(future.result())
+    return results
+
+
+def iter_pages(
+    file_path: str,
+    max_workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Yield the text of every page of a PDF file in page order.
+
+    Unlike extract_pages, at most max_workers + 1 page ranges are extracted ahead of
+    the consumer, so peak memory is bounded by the range size rather than the document.
+
+    Args:
+        file_path (str): The path to the PDF file.
+        max_workers (Optional[int]): The number of worker processes.
+        pages_per_task (Optional[int]): The number of pages extracted per task.
+
+    Yields:
+        str: The text of the next page.
+    """
+    max_workers = max_workers or default_workers()
+    pages_per_task = pages_per_task or settings.PDF_PAGES_PER_TASK
+    ranges = _page_ranges(count_pages(file_path), pages_per_task)
+
+    if max_workers == 1 or len(ranges) <= 1:
+        with open(file_path, "rb") as file:
+            for page in PyPDF2.PdfReader(file).pages:
+                yield page.extract_text()
+        return
+
+    pool = get_process_pool(max_workers)
+    pending = deque()
+    try:
+        for start, stop in ranges:
+            pending.append(pool.submit(extract_page_range, file_path, start, stop))
+            if len(pending) > max_workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Stop queued ranges if the consumer gave up early
+        for future in pending:
+            future.cancel()
+
+
+def extract_pages(
+    file_path: str,
+    max_workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+) -> List[str]:
+    """
+    Extract the text of every page of a PDF file.
+
+    Documents longer than pages_per_task pages are extracted on the process pool;
+    shorter ones are extracted inline since spreading them would cost more than it saves.
+
+    Args:
+        file_path (str): The path to the PDF file.
+        max_workers (Optional[int]): The number of worker processes.
+        pages_per_task (Optional[int]): The number of pages extracted per task.
+
+    Returns:
+        List[str]: The text of each page, in page order.
+    """
+    return extract_many([file_path], max_workers, pages_per_task)[0]
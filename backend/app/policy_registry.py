@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.agent.openai import OpenAIAgent
+from llama_index.core import VectorStoreIndex
+from llama_index.core.agent import AgentRunner
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.base.response.schema import RESPONSE_TYPE
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.llms import ChatMessage
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.prompts.mixin import PromptMixinType
+from llama_index.core.schema import QueryBundle
+
+logger = logging.getLogger(__name__)
+
+
+def agent_runner(
+    agent: AgentRunner,
+    chat_history: Optional[List[ChatMessage]] = None,
+    token_limit: Optional[int] = None,
+) -> AgentRunner:
+    """
+    Return a runner of a shared agent with its own memory and task state.
+
+    The agent's worker holds its LLM, tools and prompts and keeps no state between
+    tasks, so every query can run it through a runner of its own; the shared agent's
+    memory would otherwise collect the turns of every user for good.
+
+    Args:
+        agent (AgentRunner): The shared agent.
+        chat_history (Optional[List[ChatMessage]]): The turns the query follows on.
+        token_limit (Optional[int]): Bounds the history sent to the LLM.
+
+    Returns:
+        AgentRunner: A runner to answer one query with.
+    """
+    memory = ChatMemoryBuffer.from_defaults(
+        chat_history=list(chat_history or []), token_limit=token_limit
+    )
+    return AgentRunner(agent.agent_worker, memory=memory)
+
+
+@dataclass
+class PolicyAgent:
+    """The in-memory objects built for a single policy."""
+
+    agent: OpenAIAgent
+    query_engine: BaseQueryEngine
+    vector_index: Optional[VectorStoreIndex] = None
+    # The fingerprint of the policy file the agent was built from
+    content_hash: Optional[str] = None
+
+
+class PolicyRegistry:
+    """
+    One version of the catalogue of policies, whose agents are built on first use.
+
+    The set of policies of a version never changes; with_policy and without_policy
+    return a new version that shares the already built agents of unchanged policies.
+    Agents are built by the given builder the first time a policy is queried and at most
+    max_resident of them are kept in memory; the least recently used agent is evicted
+    when the budget is exceeded. The top agent over all policies is created by
+    top_agent_factory on first use. Given a fingerprint of policy files, e.g. their
+    content hash, agents built from a file whose content has since changed are not
+    carried over to new versions.
+    """
+
+    def __init__(
+        self,
+        builder: Callable[[Path], PolicyAgent],
+        max_resident: int,
+        top_agent_factory: Callable[["PolicyRegistry"], Any],
+        policies: Optional[Dict[str, Path]] = None,
+        version: int = 0,
+        fingerprint: Optional[Callable[[Path], str]] = None,
+    ):
+        self.version = version
+        self._builder = builder
+        self._fingerprint = fingerprint
+        self._max_resident = max(1, max_resident)
+        self._top_agent_factory = top_agent_factory
+        self._policies: Dict[str, Path] = dict(policies or {})
+        self._resident: "OrderedDict[str, PolicyAgent]" = OrderedDict()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._top_agent: Any = None
+        self._top_agent_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._policies
+
+    def __len__(self) -> int:
+        return len(self._policies)
+
+    def names(self) -> List[str]:
+        return list(self._policies)
+
+    def policy_file(self, name: str) -> Path:
+        return self._policies[name]
+
+    def resident(self) -> List[str]:
+        """Names of the policies currently held in memory, least recently used first."""
+        with self._lock:
+            return list(self._resident)
+
+    def with_policies(self, policies: Dict[str, Path]) -> "PolicyRegistry":
+        """
+        Return the next version with the given set of policies.
+
+        Agents of policies whose file is unchanged, in path and fingerprint, are carried
+        over; any other policy is built again on first use.
+
+        Args:
+            policies (Dict[str, Path]): The full policy names and their PDF files.
+
+        Returns:
+            PolicyRegistry: The new version.
+        """
+        registry = PolicyRegistry(
+            self._builder,
+            self._max_resident,
+            self._top_agent_factory,
+            policies,
+            self.version + 1,
+            self._fingerprint,
+        )
+        with self._lock:
+            carried = [
+                (name, agent)
+                for name, agent in self._resident.items()
+                if policies.get(name) == self._policies[name]
+            ]
+        # Fingerprinting reads the files, so not under the registry lock
+        for name, agent in carried:
+            if self._fingerprint is not None:
+                try:
+                    if agent.content_hash != self._fingerprint(policies[name]):
+                        continue
+                except OSError:
+                    continue
+            registry._resident[name] = agent
+        return registry
+
+    def with_policy(
+        self, name: str, policy_file: Path, agent: Optional[PolicyAgent] = None
+    ) -> "PolicyRegistry":
+        """
+        Return the next version with a policy added or replaced.
+
+        Args:
+            name (str): The full policy name, e.g. "IF_Bil".
+            policy_file (Path): The policy PDF.
+            agent (Optional[PolicyAgent]): An agent already built for the policy, which
+                                           is made resident right away.
+
+        Returns:
+            PolicyRegistry: The new version.
+        """
+        registry = self.with_policies({**self._policies, name: policy_file})
+        registry._resident.pop(name, None)
+        if agent is not None:
+            registry._resident[name] = agent
+            registry._evict()
+        return registry
+
+    def without_policy(self, name: str) -> "PolicyRegistry":
+        """Return the next version without the given policy."""
+        policies = dict(self._policies)
+        policies.pop(name, None)
+        return self.with_policies(policies)
+
+    def get(self, name: str) -> PolicyAgent:
+        """
+        Return the agent of a policy, building it if it is not resident.
+
+        Args:
+            name (str): The full policy name, e.g. "IF_Bil".
+
+        Returns:
+            PolicyAgent: The agent and vector query engine of the policy.
+
+        Raises:
+            KeyError: If the policy is not part of this version.
+        """
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is not None:
+                self._resident.move_to_end(name)
+                return entry
+            policy_file = self._policies[name]
+            build_lock = self._build_locks.setdefault(name, threading.Lock())
+
+        # Build outside the registry lock so other policies stay available, but only
+        # once per policy when several requests ask for it at the same time.
+        with build_lock:
+            with self._lock:
+                entry = self._resident.get(name)
+                if entry is not None:
+                    self._resident.move_to_end(name)
+                    return entry
+
+            # Once the build is over, requests already waiting for the lock find the
+            # agent resident, and later ones only need a lock again after an eviction
+            try:
+                entry = self._builder(policy_file)
+            except BaseException:
+                with self._lock:
+                    self._drop_build_lock(name, build_lock)
+                raise
+
+            with self._lock:
+                self._resident[name] = entry
+                self._drop_build_lock(name, build_lock)
+                self._evict()
+        return entry
+
+    def top_agent(self) -> Any:
+        """Return the top agent over every policy of this version, building it once."""
+        # Not under the registry lock: building embeds every tool description, and
+        # policy agents must stay available meanwhile
+        with self._top_agent_lock:
+            if self._top_agent is None:
+                self._top_agent = self._top_agent_factory(self)
+            return self._top_agent
+
+    def _drop_build_lock(self, name: str, build_lock: threading.Lock) -> None:
+        if self._build_locks.get(name) is build_lock:
+            del self._build_locks[name]
+
+    def _evict(self) -> None:
+        while len(self._resident) > self._max_resident:
+            name, _ = self._resident.popitem(last=False)
+            logger.info(f"Evicted policy agent {name}")
+
+
+class LiveRegistry:
+    """
+    Holds the registry version that new requests are served from.
+
+    Requests resolve the current version once and keep using it, so an update never
+    changes the objects a query is already running on. Updates derive the next version
+    off to the side and swap it in with a single reference assignment.
+    """
+
+    def __init__(self, registry: PolicyRegistry):
+        self._current = registry
+        self._update_lock = threading.Lock()
+
+    def current(self) -> PolicyRegistry:
+        return self._current
+
+    def update(
+        self, derive: Callable[[PolicyRegistry], PolicyRegistry]
+    ) -> PolicyRegistry:
+        """
+        Derive a new version from the current one and make it current.
+
+        Updates are serialized so concurrent updates never overwrite each other; derive
+        should therefore be quick, with any expensive building done beforehand.
+
+        Args:
+            derive (Callable[[PolicyRegistry], PolicyRegistry]): Returns the new version.
+
+        Returns:
+            PolicyRegistry: The new current version.
+        """
+        with self._update_lock:
+            registry = derive(self._current)
+            self._current = registry
+        logger.info(f"Policy registry is now at version {registry.version}")
+        return registry
+
+
+class LazyPolicyQueryEngine(BaseQueryEngine):
+    """Query engine that resolves a policy agent from a registry on every query."""
+
+    def __init__(
+        self,
+        registry: PolicyRegistry,
+        name: str,
+        callback_manager: CallbackManager = None,
+    ) -> None:
+        self._registry = registry
+        self._name = name
+        super().__init__(callback_manager=callback_manager)
+
+    def _get_prompt_modules(self) -> PromptMixinType:
+        return {}
+
+    def _query(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        agent = self._registry.get(self._name).agent
+        return agent_runner(agent).query(query_bundle.query_str)
+
+    async def _aquery(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        # Building a policy agent reads its index from disk, or ingests the policy
+        # if it has none, so it must not block the event loop.
+        policy_agent = await asyncio.to_thread(self._registry.get, self._name)
+        return await agent_runner(policy_agent.agent).aquery(query_bundle.query_str)
@@ -0,0 +1,223 @@
+import logging
+import re
+import threading
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Other ways users refer to companies and policies, by folder name and file stem
+COMPANY_ALIASES: Dict[str, List[str]] = {
+    "TopDanmark": ["top danmark"],
+    "IF": ["if forsikring", "if skadeforsikring"],
+    "Tryg": ["tryg forsikring"],
+    "Alm_Brand": ["almbrand", "alm brand"],
+    "Codan": ["codan forsikring"],
+}
+POLICY_ALIASES: Dict[str, List[str]] = {
+    "Bil": ["bilforsikring", "bilen", "auto", "autoforsikring", "kasko"],
+    "Hus": ["husforsikring", "huset"],
+    "Indbo": ["indboforsikring"],
+    "Rejse": ["rejseforsikring"],
+    "Ulykke": ["ulykkesforsikring"],
+}
+
+# Company names that are also everyday words, as in "if I crash" or "tryg" (safe), and
+# how the company writes them. They only name the company when written so, though not
+# as the first word unless in capitals, or when followed by a policy word, e.g. "tryg
+# bil".
+AMBIGUOUS_NAMES: Dict[str, str] = {"if": "IF", "tryg": "Tryg"}
+# Words that name a policy of any kind
+POLICY_WORDS = {"forsikring", "forsikringen", "forsikringer", "police", "policen"}
+
+# Terms shorter than this must match exactly; fuzzy matching them is too loose
+MIN_FUZZY_LENGTH = 4
+# The longest alias, in words
+MAX_TERM_WORDS = 3
+# How much more similar than the runner-up a policy must be to be routed to by embedding
+SIMILARITY_MARGIN = 0.05
+
+
+def _words(text: str, casefold: bool = True) -> List[str]:
+    # Split CamelCase and snake_case names into words before case folding
+    text = re.sub(r"(?<=[a-zæøå])(?=[A-ZÆØÅ])", " ", text)
+    words = re.findall(r"\w+", text.replace("_", " "))
+    return [word.casefold() for word in words] if casefold else words
+
+
+def _terms(name: str, aliases: Sequence[str]) -> List[str]:
+    terms = {"".join(_words(name)), *("".join(_words(alias)) for alias in aliases)}
+    return [term for term in terms if term]
+
+
+def _normalize(embeddings: List[List[float]]) -> np.ndarray:
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class PolicyRouter:
+    """
+    Picks the policy a question is about without asking an LLM.
+
+    Company and policy names are matched against the words of the question, allowing
+    for aliases, missing spaces and small typos. If nothing is named, the question can
+    optionally be matched to the policies by embedding similarity. A question is only
+    routed when exactly one policy fits; otherwise the top agent has to decide.
+    """
+
+    def __init__(
+        self,
+        policies: Dict[str, Path],
+        fuzzy_cutoff: float = 0.9,
+        embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        similarity_threshold: float = 0.8,
+    ):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.similarity_threshold = similarity_threshold
+        self._embed = embed
+        self._description_embeddings: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+        # Name, company and policy type of every policy
+        self._policies: List[Tuple[str, str, str]] = []
+        # Terms of each company, then those of its terms that are everyday words
+        self._companies: Dict[str, Tuple[List[str], List[str]]] = {}
+        # Terms of every known policy type, offered by any company or not
+        self._policy_types: Dict[str, List[str]] = {
+            policy: _terms(policy, aliases)
+            for policy, aliases in POLICY_ALIASES.items()
+        }
+        for name, policy_file in policies.items():
+            company = policy_file.parent.name
+            policy = policy_file.stem
+            self._policies.append((name, company, policy))
+            self._policy_types.setdefault(
+                policy, _terms(policy, POLICY_ALIASES.get(policy, []))
+            )
+            if company not in self._companies:
+                terms = _terms(company, COMPANY_ALIASES.get(company, []))
+                self._companies[company] = (
+                    [term for term in terms if term not in AMBIGUOUS_NAMES],
+                    [term for term in terms if term in AMBIGUOUS_NAMES],
+                )
+        self._names = [name for name, _, _ in self._policies]
+
+    def _matches(self, grams: List[str], terms: List[str]) -> bool:
+        for term in terms:
+            for gram in grams:
+                if gram == term:
+                    return True
+                if (
+                    len(term) >= MIN_FUZZY_LENGTH
+                    and SequenceMatcher(None, gram, term).ratio() >= self.fuzzy_cutoff
+                ):
+                    return True
+        return False
+
+    def _names_ambiguously(
+        self, words: List[str], written: List[str], term: str
+    ) -> bool:
+        for i, word in enumerate(words):
+            if word != term:
+                continue
+            spelling = AMBIGUOUS_NAMES[term]
+            if written[i] == spelling and (i > 0 or spelling.isupper()):
+                return True
+            following = words[i + 1 : i + 2]
+            if following and (
+                following[0] in POLICY_WORDS
+                or any(
+                    self._matches(following, terms)
+                    for terms in self._policy_types.values()
+                )
+            ):
+                return True
+        return False
+
+    def _match_names(self, question: str) -> Optional[List[str]]:
+        words = _words(question)
+        written = _words(question, casefold=False)
+        grams = [
+            "".join(words[start : start + size])
+            for size in range(1, MAX_TERM_WORDS + 1)
+            for start in range(len(words) - size + 1)
+        ]
+
+        companies = {
+            company
+            for company, (terms, ambiguous) in self._companies.items()
+            if self._matches(grams, terms)
+            or any(self._names_ambiguously(words, written, term) for term in ambiguous)
+        }
+        policy_types = {
+            policy
+            for policy, terms in self._policy_types.items()
+            if self._matches(grams, terms)
+        }
+        if not companies and not policy_types:
+            return None
+
+        candidates = [
+            name
+            for name, company, policy in self._policies
+            if (not companies or company in companies)
+            and (not policy_types or policy in policy_types)
+        ]
+        # Empty if the named company does not offer the named policy type, which is
+        # then left to the top agent rather than routed by embedding
+        return candidates
+
+    def _match_embedding(self, question: str) -> Optional[str]:
+        with self._lock:
+            if self._description_embeddings is None:
+                descriptions = [" ".join(_words(name)) for name in self._names]
+                self._description_embeddings = _normalize(self._embed(descriptions))
+        question_embedding = _normalize(self._embed([question]))[0]
+        scores = self._description_embeddings @ question_embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        # Only route when the best policy clearly beats the runner-up
+        if len(scores) > 1 and np.sort(scores)[-2] > scores[best] - SIMILARITY_MARGIN:
+            return None
+        return self._names[best]
+
+    def named_policies(self, question: str) -> List[str]:
+        """
+        Return the policies a question names by company or policy name.
+
+        Unlike route, this never embeds the question and may return several policies,
+        e.g. every policy of a named company, or none if nothing is named or no policy
+        fits what is named.
+        """
+        return self._match_names(question) or []
+
+    def route(self, question: str) -> Optional[str]:
+        """
+        Return the full name of the one policy a question is about.
+
+        Args:
+            question (str): The user's question.
+
+        Returns:
+            Optional[str]: The full policy name, e.g. "IF_Bil", or None if the question
+                           names no policy or several policies fit.
+        """
+        if not self._policies:
+            return None
+        candidates = self._match_names(question)
+        if candidates is None and self._embed is not None:
+            try:
+                name = self._match_embedding(question)
+            except Exception as e:
+                logger.warning(f"Could not route question by embedding: {str(e)}")
+                name = None
+            candidates = [name] if name else None
+        if candidates and len(candidates) == 1:
+            logger.info(f"Routed question to {candidates[0]}")
+            return candidates[0]
+        return None
@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Callable, Iterable, List, NamedTuple, Optional, Set
+
+from llama_index.core.llms import LLM
+from llama_index.core.query_engine import CustomQueryEngine
+from llama_index.core.schema import BaseNode
+from llama_index.core.utils import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Written next to the storage context of each policy
+SUMMARIES_FILE = "summaries.json"
+# Bump whenever the prompts change so persisted summaries are regenerated
+SUMMARY_PROMPT_VERSION = 1
+# Policy text summarized per section, and summaries combined per request, in tokens
+SECTION_TOKENS = 3000
+# Most tokens the summary tool answers with
+SUMMARY_TOOL_TOKENS = 1000
+# Words shorter than this say too little to pick the sections relevant to a query
+MIN_KEYWORD_LENGTH = 4
+
+SECTION_PROMPT = """\
+Summarize the following pages ({pages}) of the {policy} insurance policy.
+Cover what is insured, exclusions, deductibles, limits, payments and obligations, as far as these pages mention them.
+Write concise markdown bullet points and mention the page, e.g. (Side 4), of each point.
+Do NOT rely on prior knowledge. Only use the information provided.
+Always answer in danish
+
+{text}
+"""
+
+POLICY_PROMPT = """\
+Below are summaries of consecutive sections of the {policy} insurance policy.
+Combine them into one holistic summary of the policy in markdown, keeping the page references.
+Do NOT rely on prior knowledge. Only use the information provided.
+Always answer in danish
+
+{text}
+"""
+
+
+class SectionSummary(NamedTuple):
+    pages: str
+    summary: str
+
+    def to_text(self) -> str:
+        return f"### Side {self.pages}\n{self.summary}"
+
+
+class PolicySummary(NamedTuple):
+    summary: str
+    sections: List[SectionSummary]
+
+
+def _page_range(first: str, last: str) -> str:
+    return first if first == last else f"{first}-{last}"
+
+
+class SectionSummarizer:
+    """
+    Summarizes a policy hierarchically while its nodes are ingested.
+
+    Nodes are fed in page order and grouped into sections of about section_tokens
+    tokens; each section is summarized as soon as it is full, so only one section's
+    text is held at a time. finish then combines the section summaries into a summary
+    of the whole policy, in several rounds if they do not fit in one request.
+    """
+
+    def __init__(
+        self, policy_name: str, llm: LLM, section_tokens: int = SECTION_TOKENS
+    ):
+        self.policy_name = policy_name
+        self.llm = llm
+        self.section_tokens = section_tokens
+        self._tokenizer = get_tokenizer()
+        self._texts: List[str] = []
+        self._pages: List[str] = []
+        self._tokens = 0
+        self.sections: List[SectionSummary] = []
+
+    def _flush(self) -> None:
+        if not self._texts:
+            return
+        pages = _page_range(self._pages[0], self._pages[-1])
+        prompt = SECTION_PROMPT.format(
+            pages=pages, policy=self.policy_name, text="\n\n".join(self._texts)
+        )
+        self.sections.append(SectionSummary(pages, self.llm.complete(prompt).text))
+        self._texts, self._pages, self._tokens = [], [], 0
+
+    def add(self, nodes: Iterable[BaseNode]) -> None:
+        for node in nodes:
+            text = node.get_content()
+            tokens = len(self._tokenizer(text))
+            if self._texts and self._tokens + tokens > self.section_tokens:
+                self._flush()
+            self._texts.append(text)
+            self._pages.append(node.metadata.get("page_label", "?"))
+            self._tokens += tokens
+
+    def _combine(self, summaries: List[str]) -> str:
+        prompt = POLICY_PROMPT.format(
+            policy=self.policy_name, text="\n\n".join(summaries)
+        )
+        return self.llm.complete(prompt).text
+
+    def finish(self) -> PolicySummary:
+        """Summarize the last section and combine all sections into a policy summary."""
+        self._flush()
+        summaries = [section.summary for section in self.sections]
+        if not summaries:
+            return PolicySummary("", [])
+        if len(summaries) == 1:
+            return PolicySummary(summaries[0], self.sections)
+
+        while len(summaries) > 1:
+            groups, group, tokens = [], [], 0
+            for summary in summaries:
+                length = len(self._tokenizer(summary))
+                if group and tokens + length > self.section_tokens:
+                    groups.append(group)
+                    group, tokens = [], 0
+                group.append(summary)
+                tokens += length
+            groups.append(group)
+            if len(groups) == len(summaries):
+                # Every summary fills a request on its own; combine them pairwise
+                groups = [summaries[i : i + 2] for i in range(0, len(summaries), 2)]
+            summaries = [
+                self._combine(group) if len(group) > 1 else group[0] for group in groups
+            ]
+        return PolicySummary(summaries[0], self.sections)
+
+
+def read_summaries(
+    index_path: Path, policy_hash: str, model: str
+) -> Optional[PolicySummary]:
+    """
+    Read the summaries persisted for a policy.
+
+    Args:
+        index_path (Path): The directory of the policy's storage context.
+        policy_hash (str): The content hash of the policy PDF.
+        model (str): Identifies the LLM the summaries must have been generated by.
+
+    Returns:
+        Optional[PolicySummary]: The summaries, or None if they are missing or were
+                                 generated from another version of the PDF or prompts,
+                                 or by another LLM.
+    """
+    summaries_path = index_path / SUMMARIES_FILE
+    try:
+        with open(summaries_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        if (
+            data.get("sha256") != policy_hash
+            or data.get("prompt_version") != SUMMARY_PROMPT_VERSION
+            or data.get("model") != model
+        ):
+            return None
+        return PolicySummary(
+            data["summary"],
+            [SectionSummary(s["pages"], s["summary"]) for s in data["sections"]],
+        )
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable summaries {summaries_path}: {str(e)}")
+        return None
+
+
+def write_summaries(
+    index_path: Path, policy_hash: str, model: str, summary: PolicySummary
+) -> None:
+    summaries_path = index_path / SUMMARIES_FILE
+    tmp_path = summaries_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "sha256": policy_hash,
+                "prompt_version": SUMMARY_PROMPT_VERSION,
+                "model": model,
+                "summary": summary.summary,
+                "sections": [section._asdict() for section in summary.sections],
+            },
+            file,
+            ensure_ascii=False,
+        )
+    os.replace(tmp_path, summaries_path)
+
+
+def _keywords(text: str) -> Set[str]:
+    return {
+        word
+        for word in re.findall(r"\w+", text.casefold())
+        if len(word) >= MIN_KEYWORD_LENGTH
+    }
+
+
+class PolicySummaryQueryEngine(CustomQueryEngine):
+    """
+    Answers queries from the precomputed summaries of a policy, without an LLM.
+
+    The answer is the policy summary, followed by the summaries of the sections that
+    share the most words with the query, in page order. It is cut off at max_tokens
+    tokens, so an overview question does not put the whole policy in the prompt.
+    """
+
+    summary_text: str
+    section_texts: List[str] = []
+    max_tokens: int = SUMMARY_TOOL_TOKENS
+
+    @classmethod
+    def from_summary(
+        cls, summary: PolicySummary, max_tokens: int = SUMMARY_TOOL_TOKENS
+    ) -> "PolicySummaryQueryEngine":
+        return cls(
+            summary_text=summary.summary,
+            section_texts=[section.to_text() for section in summary.sections],
+            max_tokens=max_tokens,
+        )
+
+    def custom_query(self, query_str: str) -> str:
+        tokenizer = get_tokenizer()
+        text = _truncate(self.summary_text, self.max_tokens, tokenizer)
+        budget = self.max_tokens - len(tokenizer(text))
+
+        keywords = _keywords(query_str)
+        scores = [len(keywords & _keywords(section)) for section in self.section_texts]
+        relevant = sorted(
+            (i for i, score in enumerate(scores) if score > 0),
+            key=lambda i: -scores[i],
+        )
+        chosen = []
+        for i in relevant:
+            tokens = len(tokenizer(self.section_texts[i])) + 2
+            if tokens <= budget:
+                chosen.append(i)
+                budget -= tokens
+        if chosen:
+            sections = "\n\n".join(self.section_texts[i] for i in sorted(chosen))
+            text = f"{text}\n\n{sections}"
+        return text
+
+
+def _truncate(text: str, max_tokens: int, tokenizer: Callable[[str], List]) -> str:
+    tokens = len(tokenizer(text))
+    while tokens > max_tokens:
+        # Cut in proportion, then check again as tokens vary in length
+        text = text[: int(len(text) * max_tokens / tokens * 0.95)]
+        tokens = len(tokenizer(text))
+    return text
@@ -1,34 +1,142 @@
+import asyncio
 from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
-from app.compare_query import compare_policies_query
+from app.answer_cache import AnswerLookup, answer_cache, normalize_question
+from app.compare_query import (
+    acompare_policies_query,
+    amulti_compare_policies_query,
+    astream_compare_policies_query,
+)
+from app.conversation_memory import Conversation, conversations
 from app.core.config import settings
-from app.information_query import process_query
-from app.models.chatbot import ComparisonRequest, QuestionRequest
+from app.core.single_flight import SingleFlight
+from app.information_query import (
+    aprocess_query,
+    astream_query,
+    live_registry,
+    question_scope,
+)
+from app.models.chatbot import (
+    ComparisonRequest,
+    MultiComparisonRequest,
+    QuestionRequest,
+)
+from app.usage import add_usage, collect_usage
 from fastapi import HTTPException
 
+# Shared by all ChatbotService instances, which are created per request
+flights = SingleFlight()
+
 
 class ChatbotService:
     BASE_PATH = Path(settings.BASE_PATH)
 
-    async def ask(self, request: QuestionRequest):
+    async def ask(self, request: QuestionRequest, session_id: Optional[str] = None):
+        # Resolve the registry once so a concurrent re-index cannot change the
+        # policies this question is answered from halfway through.
+        registry = live_registry.current()
+        conversation = self._conversation(session_id)
+        history = conversation.history() if conversation else []
         try:
-            answer = process_query(request.question)
-            return {"answer": answer}
+            if history:
+                # A follow-up is answered in the context of its own conversation, so
+                # it is neither shared with other questions nor cached
+                answer = await aprocess_query(request.question, registry, history)
+            else:
+                # Identical questions asked while one is being answered share that
+                # answer
+                key = ("ask", normalize_question(request.question), registry.version)
+                answer = await self._shared(
+                    key, lambda: self._answer(request.question, registry)
+                )
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"An error occurred while processing the question: {str(e)}",
             )
+        if conversation is not None:
+            conversation.add_turn(request.question, answer)
+        return {"answer": answer}
+
+    @staticmethod
+    def _conversation(session_id: Optional[str]) -> Optional[Conversation]:
+        if session_id is None or not conversations.enabled:
+            return None
+        return conversations.get(session_id)
+
+    @staticmethod
+    async def _shared(key, fn: Callable[[], Awaitable[str]]) -> str:
+        # The shared computation runs in the context of the request that started it,
+        # so its calls are collected apart and charged to every request it answers
+        answer, calls = await flights.do(key, lambda: collect_usage(fn))
+        add_usage(calls)
+        return answer
+
+    @staticmethod
+    def _lookup(question: str, registry) -> AnswerLookup:
+        # Answers are only shared between questions naming the same policies
+        return answer_cache.lookup(
+            question, registry.version, question_scope(question, registry)
+        )
+
+    async def _answer(self, question: str, registry) -> str:
+        # The lookup may embed the question with a blocking call
+        cached = await asyncio.to_thread(self._lookup, question, registry)
+        if cached.answer is not None:
+            return cached.answer
+        answer = await aprocess_query(question, registry)
+        answer_cache.store(cached, answer)
+        return answer
+
+    async def ask_stream(
+        self, request: QuestionRequest, session_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Answer a question like ask, yielding the answer as it is generated."""
+        registry = live_registry.current()
+        conversation = self._conversation(session_id)
+        history = conversation.history() if conversation else []
+        # Like in ask, only questions that start a conversation use the answer cache
+        cached = None
+        if not history:
+            cached = await asyncio.to_thread(self._lookup, request.question, registry)
+        if cached is not None and cached.answer is not None:
+            answer = cached.answer
+            yield answer
+        else:
+            tokens = []
+            async for token in astream_query(request.question, registry, history):
+                tokens.append(token)
+                yield token
+            answer = "".join(tokens)
+            if cached is not None:
+                answer_cache.store(cached, answer)
+        if conversation is not None:
+            conversation.add_turn(request.question, answer)
+
+    def reset_conversation(self, session_id: str) -> None:
+        conversations.drop(session_id)
 
     async def compare_policies(self, request: ComparisonRequest):
         try:
             policy1_with_extension = f"{request.policy1}.pdf"
             policy2_with_extension = f"{request.policy2}.pdf"
 
-            answer = compare_policies_query(
+            key = (
+                "compare",
                 policy1_with_extension,
                 policy2_with_extension,
-                request.query,
+                normalize_question(request.query),
+                settings.COMPARISON_MODE,
+                live_registry.current().version,
+            )
+            answer = await self._shared(
+                key,
+                lambda: acompare_policies_query(
+                    policy1_with_extension,
+                    policy2_with_extension,
+                    request.query,
+                ),
             )
             return {"answer": answer}
         except Exception as e:
@@ -36,3 +144,36 @@ class ChatbotService:
                 status_code=500,
                 detail=f"An error occurred while comparing policies: {str(e)}",
             )
+
+    async def compare_many_policies(self, request: MultiComparisonRequest):
+        try:
+            policies_with_extension = [f"{policy}.pdf" for policy in request.policies]
+
+            key = (
+                "compare_many",
+                tuple(policies_with_extension),
+                normalize_question(request.query),
+                settings.COMPARISON_MODE,
+                live_registry.current().version,
+            )
+            answer = await self._shared(
+                key,
+                lambda: amulti_compare_policies_query(
+                    policies_with_extension, request.query
+                ),
+            )
+            return {"answer": answer}
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"An error occurred while comparing policies: {str(e)}",
+            )
+
+    async def compare_policies_stream(
+        self, request: ComparisonRequest
+    ) -> AsyncIterator[str]:
+        """Compare policies like compare_policies, yielding the answer as it is generated."""
+        async for token in astream_compare_policies_query(
+            f"{request.policy1}.pdf", f"{request.policy2}.pdf", request.query
+        ):
+            yield token
@@ -0,0 +1,121 @@
+# app/services/ingestion_service.py
+import asyncio
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.timing import StageTimer
+from app.information_query import register_policy
+from app.llm_scheduler import BACKGROUND, llm_priority
+from app.models.ingestion import IngestionJob, JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueue:
+    """
+    Runs policy ingestion (extract, split, embed, build the agent) in the background.
+
+    Jobs are started as asyncio tasks as soon as they are submitted, but at most
+    max_concurrency of them ingest at the same time; the rest wait in submission order.
+    The blocking ingestion itself runs in a worker thread so the event loop keeps
+    serving requests, and its LLM and embedding requests are sent with background
+    priority so they wait behind those of questions. Only the most recent max_history
+    jobs are kept for status queries.
+
+    Deleting a policy cancels its jobs: queued ones never start, and a running one
+    finishes building but does not register the policy.
+    """
+
+    def __init__(self, max_concurrency: int, max_history: int):
+        self._max_concurrency = max(1, max_concurrency)
+        self._max_history = max_history
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        # Unfinished jobs, with their task and the event set to cancel them
+        self._active: Dict[str, Tuple[IngestionJob, asyncio.Task, threading.Event]] = {}
+
+    def submit(self, insurance_name: str, policy_name: str) -> IngestionJob:
+        job = IngestionJob(
+            id=uuid.uuid4().hex, insurance_name=insurance_name, policy_name=policy_name
+        )
+        self._jobs[job.id] = job
+        while len(self._jobs) > self._max_history:
+            self._jobs.popitem(last=False)
+
+        cancelled = threading.Event()
+        task = asyncio.get_running_loop().create_task(self._run(job, cancelled))
+        self._active[job.id] = (job, task, cancelled)
+        task.add_done_callback(lambda _: self._active.pop(job.id, None))
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, insurance_name: str, policy_name: str) -> None:
+        """Cancel the unfinished jobs of a policy that is being deleted."""
+        for job, task, cancelled in list(self._active.values()):
+            if (job.insurance_name, job.policy_name) != (insurance_name, policy_name):
+                continue
+            cancelled.set()
+            if job.status == JobStatus.QUEUED:
+                task.cancel()
+                job.status = JobStatus.CANCELLED
+                job.finishedAt = datetime.now()
+
+    async def join(self) -> None:
+        """Wait for every submitted job to finish."""
+        while self._active:
+            await asyncio.gather(
+                *(task for _, task, _ in self._active.values()),
+                return_exceptions=True,
+            )
+
+    async def _run(self, job: IngestionJob, cancelled: threading.Event) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async with self._semaphore:
+            timer = StageTimer(on_stage=lambda stage: self._update(job, timer, stage))
+            job.status = JobStatus.RUNNING
+            job.startedAt = datetime.now()
+            try:
+                with llm_priority(BACKGROUND):
+                    await asyncio.to_thread(
+                        register_policy,
+                        job.insurance_name,
+                        job.policy_name,
+                        timer,
+                        cancelled,
+                    )
+                job.status = (
+                    JobStatus.CANCELLED if cancelled.is_set() else JobStatus.SUCCEEDED
+                )
+            except Exception as e:
+                logger.error(
+                    f"Ingestion of {job.insurance_name}/{job.policy_name} failed: "
+                    f"{str(e)}"
+                )
+                job.status = JobStatus.FAILED
+                job.error = str(e)
+            finally:
+                self._update(job, timer, None)
+                job.finishedAt = datetime.now()
+
+    @staticmethod
+    def _update(job: IngestionJob, timer: StageTimer, stage: Optional[str]) -> None:
+        job.stage = stage
+        job.progress = dict(timer.counts)
+        job.timings = {
+            name: round(seconds, 3) for name, seconds in timer.timings.items()
+        }
+
+
+ingestion_queue = IngestionQueue(
+    max_concurrency=settings.INGESTION_CONCURRENCY,
+    max_history=settings.INGESTION_JOB_HISTORY,
+)
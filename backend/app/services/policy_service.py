@@ -1,10 +1,13 @@
 # app/services/policy_service.py
+import asyncio
 import os
 import shutil
 from pathlib import Path
 
 from app.core.config import settings
-from app.information_query import create_agents_and_databases
+from app.information_query import policy_lock, unregister_policy
+from app.models.ingestion import IngestionJob
+from app.services.ingestion_service import ingestion_queue
 from fastapi import HTTPException, UploadFile
 
 
@@ -13,7 +16,7 @@ class PolicyService:
 
     async def upload_policy(
         self, file: UploadFile, insurance_name: str, policy_name: str
-    ) -> str:
+    ) -> dict:
         if not file.filename.endswith(".pdf"):
             raise HTTPException(status_code=400, detail="File must be a PDF")
 
@@ -29,15 +32,19 @@ class PolicyService:
                 shutil.copyfileobj(file.file, file_object)
         except IOError:
             raise HTTPException(status_code=500, detail="Failed to write file")
+        job_id = None
         if settings.ENVIRONMENT != "test":
-            try:
-                create_agents_and_databases()
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error creating agents and databases: {str(e)}",
-                )
-        return f"Successfully uploaded {insurance_name}/{policy_name}.pdf"
+            job_id = ingestion_queue.submit(insurance_name, policy_name).id
+        return {
+            "message": f"Successfully uploaded {insurance_name}/{policy_name}.pdf",
+            "job_id": job_id,
+        }
+
+    async def get_ingestion_job(self, job_id: str) -> IngestionJob:
+        job = ingestion_queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Ingestion job not found")
+        return job
 
     async def delete_policy(self, insurance_name: str, policy_name: str) -> str:
         file_path = self.BASE_PATH / insurance_name / f"{policy_name}.pdf"
@@ -50,8 +57,11 @@ class PolicyService:
 
         try:
             if settings.ENVIRONMENT != "test":
-                shutil.rmtree(index_path)
-            os.remove(file_path)
+                ingestion_queue.cancel(insurance_name, policy_name)
+            # Waits for a running ingestion of the policy, which then skips registering
+            await asyncio.to_thread(
+                self._remove_policy, insurance_name, policy_name, file_path, index_path
+            )
             return f"Successfully deleted {insurance_name}/{policy_name}.pdf"
         except Exception as e:
             raise HTTPException(
@@ -59,6 +69,16 @@ class PolicyService:
                 detail=f"An error occurred while deleting the file: {str(e)}",
             )
 
+    @staticmethod
+    def _remove_policy(
+        insurance_name: str, policy_name: str, file_path: Path, index_path: Path
+    ) -> None:
+        with policy_lock(f"{insurance_name}_{policy_name}"):
+            if settings.ENVIRONMENT != "test":
+                unregister_policy(insurance_name, policy_name)
+                shutil.rmtree(index_path, ignore_errors=True)
+            os.remove(file_path)
+
     async def get_policies(self) -> dict:
         if not self.BASE_PATH.exists() or not self.BASE_PATH.is_dir():
             raise HTTPException(status_code=500, detail="Insurance folder not found")
@@ -0,0 +1,105 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from app.answer_cache import SemanticAnswerCache, normalize_question
+
+EMBEDDINGS = {
+    "hvad dækker glasskade": [1.0, 0.0, 0.0],
+    "dækker forsikringen glasskade": [0.99, 0.1, 0.0],
+    "hvordan betaler jeg": [0.0, 1.0, 0.0],
+    "hvornår udløber policen": [0.0, 0.0, 1.0],
+    # Questions that only differ by company embed almost the same
+    "hvad dækker if ved glasskade": [0.0, 0.6, 0.8],
+    "hvad dækker tryg ved glasskade": [0.0, 0.61, 0.79],
+}
+
+
+@pytest.fixture
+def embed():
+    return MagicMock(
+        side_effect=lambda question: EMBEDDINGS[normalize_question(question)]
+    )
+
+
+@pytest.fixture
+def cache(embed):
+    return SemanticAnswerCache(embed, max_entries=2, ttl_seconds=60, threshold=0.95)
+
+
+def ask(cache, question, answer, corpus_version=1):
+    lookup = cache.lookup(question, corpus_version)
+    if lookup.answer is None:
+        cache.store(lookup, answer)
+    return lookup.answer
+
+
+def test_exact_question_skips_embedding(cache, embed):
+    ask(cache, "Hvad dækker glasskade?", "Ruder")
+
+    assert cache.lookup("hvad  dækker GLASSKADE", 1).answer == "Ruder"
+    assert embed.call_count == 1
+
+
+def test_similar_question_hits(cache):
+    ask(cache, "Hvad dækker glasskade?", "Ruder")
+
+    assert cache.lookup("Dækker forsikringen glasskade?", 1).answer == "Ruder"
+    assert cache.lookup("Hvordan betaler jeg?", 1).answer is None
+
+
+def test_new_corpus_version_invalidates(cache):
+    ask(cache, "Hvad dækker glasskade?", "Ruder")
+
+    assert cache.lookup("Hvad dækker glasskade?", 2).answer is None
+    assert len(cache) == 0
+
+    # An answer computed against the old corpus is not stored
+    ask(cache, "Hvordan betaler jeg?", "NemKonto", corpus_version=1)
+    assert len(cache) == 0
+
+
+def test_entries_expire(cache):
+    with patch("app.answer_cache.time.monotonic", side_effect=[0, 0, 61]):
+        ask(cache, "Hvad dækker glasskade?", "Ruder")
+        assert cache.lookup("Hvad dækker glasskade?", 1).answer is None
+
+
+def test_least_recently_used_is_evicted(cache):
+    ask(cache, "Hvad dækker glasskade?", "Ruder")
+    ask(cache, "Hvordan betaler jeg?", "NemKonto")
+    ask(cache, "Hvad dækker glasskade?", "Ruder")
+    ask(cache, "Hvornår udløber policen?", "Årligt")
+
+    assert len(cache) == 2
+    assert cache.lookup("Hvordan betaler jeg?", 1).answer is None
+    assert cache.lookup("Hvad dækker glasskade?", 1).answer == "Ruder"
+
+
+def test_embedding_failure_is_a_miss(cache, embed):
+    embed.side_effect = Exception("Rate limited")
+
+    lookup = cache.lookup("Hvad dækker glasskade?", 1)
+
+    assert lookup.answer is None
+    cache.store(lookup, "Ruder")
+    assert cache.lookup("Hvad dækker glasskade?", 1).answer == "Ruder"
+
+
+def test_answers_are_not_shared_between_companies(cache):
+    lookup = cache.lookup("Hvad dækker IF ved glasskade?", 1, ("IF_Bil",))
+    cache.store(lookup, "IF dækker ruder")
+
+    tryg = cache.lookup("Hvad dækker Tryg ved glasskade?", 1, ("Tryg_Bil",))
+    assert tryg.answer is None
+    cache.store(tryg, "Tryg dækker ruder og kaskoskader")
+
+    assert (
+        cache.lookup("Hvad dækker IF ved glasskade?", 1, ("IF_Bil",)).answer
+        == "IF dækker ruder"
+    )
+    assert (
+        cache.lookup("Hvad dækker Tryg ved glasskade", 1, ("Tryg_Bil",)).answer
+        == "Tryg dækker ruder og kaskoskader"
+    )
+    # A question naming no company does not get a company's answer
+    assert cache.lookup("Hvad dækker IF ved glasskade?", 1).answer is None
@@ -1,8 +1,17 @@
+import asyncio
 from unittest.mock import patch
 
 import pytest
-from app.models.chatbot import ComparisonRequest, QuestionRequest
+from app.answer_cache import SemanticAnswerCache
+from app.conversation_memory import ConversationStore
+from app.information_query import live_registry
+from app.models.chatbot import (
+    ComparisonRequest,
+    MultiComparisonRequest,
+    QuestionRequest,
+)
 from app.services.chatbot_service import ChatbotService
+from app.usage import record_call, track_usage
 from fastapi import HTTPException
 
 
@@ -11,19 +20,138 @@ def chatbot_service_fixture():
     return ChatbotService()
 
 
+@pytest.fixture(autouse=True)
+def answer_cache_fixture():
+    answer_cache = SemanticAnswerCache(
+        lambda question: [1.0, 0.0], max_entries=8, ttl_seconds=60, threshold=0.95
+    )
+    with patch("app.services.chatbot_service.answer_cache", answer_cache):
+        yield answer_cache
+
+
 @pytest.mark.asyncio
 async def test_ask(chatbot_service_fixture):
-    with patch("app.services.chatbot_service.process_query") as mock_process_query:
+    with patch("app.services.chatbot_service.aprocess_query") as mock_process_query:
         mock_process_query.return_value = "Mocked answer"
         request = QuestionRequest(question="Test question")
         response = await chatbot_service_fixture.ask(request)
         assert response == {"answer": "Mocked answer"}
-        mock_process_query.assert_called_once_with("Test question")
+        mock_process_query.assert_called_once_with(
+            "Test question", live_registry.current()
+        )
+
+
+@pytest.mark.asyncio
+async def test_ask_returns_cached_answer(chatbot_service_fixture):
+    with patch("app.services.chatbot_service.aprocess_query") as mock_process_query:
+        mock_process_query.return_value = "Mocked answer"
+        await chatbot_service_fixture.ask(QuestionRequest(question="Test question"))
+        response = await chatbot_service_fixture.ask(
+            QuestionRequest(question="test  question?")
+        )
+        assert response == {"answer": "Mocked answer"}
+        mock_process_query.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_ask_coalesces_identical_questions(chatbot_service_fixture):
+    async def slow_answer(question, registry):
+        await asyncio.sleep(0.01)
+        return "Mocked answer"
+
+    with patch(
+        "app.services.chatbot_service.aprocess_query", side_effect=slow_answer
+    ) as mock_process_query:
+        responses = await asyncio.gather(
+            chatbot_service_fixture.ask(QuestionRequest(question="Test question")),
+            chatbot_service_fixture.ask(QuestionRequest(question="test question?")),
+        )
+        assert responses == [{"answer": "Mocked answer"}] * 2
+        mock_process_query.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_coalesced_questions_are_each_charged_the_shared_usage(
+    chatbot_service_fixture,
+):
+    async def slow_answer(question, registry):
+        await asyncio.sleep(0.01)
+        record_call("llm", "top_agent", prompt_tokens=100, completion_tokens=20)
+        return "Mocked answer"
+
+    async def ask(question):
+        with track_usage() as usage:
+            await chatbot_service_fixture.ask(QuestionRequest(question=question))
+        return usage
+
+    with patch("app.services.chatbot_service.aprocess_query", side_effect=slow_answer):
+        usages = await asyncio.gather(ask("Test question"), ask("test question?"))
+
+    for usage in usages:
+        assert usage.totals()["llm"]["prompt_tokens"] == 100
+        assert usage.totals()["llm"]["completion_tokens"] == 20
+
+
+@pytest.fixture
+def conversations_fixture():
+    conversations = ConversationStore(max_sessions=8, idle_seconds=60, token_limit=500)
+    with patch("app.services.chatbot_service.conversations", conversations):
+        yield conversations
+
+
+@pytest.mark.asyncio
+async def test_ask_follow_up_uses_own_session_history(
+    chatbot_service_fixture, conversations_fixture
+):
+    with patch("app.services.chatbot_service.aprocess_query") as mock_process_query:
+        mock_process_query.return_value = "Mocked answer"
+        await chatbot_service_fixture.ask(
+            QuestionRequest(question="Hvad dækker kasko?"), "a@example.com"
+        )
+        await chatbot_service_fixture.ask(
+            QuestionRequest(question="Og selvrisikoen?"), "a@example.com"
+        )
+        await chatbot_service_fixture.ask(
+            QuestionRequest(question="Og selvrisikoen?"), "b@example.com"
+        )
+
+    # The follow-up is answered with the history of its own session only. The first
+    # question of session b is not answered from the cache, as "kasko" names the car
+    # policies and it names none
+    first, follow_up, other = mock_process_query.call_args_list
+    assert len(first.args) == 2
+    assert len(other.args) == 2
+    assert [message.content for message in follow_up.args[2]] == [
+        "Hvad dækker kasko?",
+        "Mocked answer",
+    ]
+    assert len(conversations_fixture.get("a@example.com").history()) == 4
+    assert [
+        message.content
+        for message in conversations_fixture.get("b@example.com").history()
+    ] == ["Og selvrisikoen?", "Mocked answer"]
+
+
+@pytest.mark.asyncio
+async def test_ask_without_conversation_memory(chatbot_service_fixture):
+    conversations = ConversationStore(max_sessions=8, idle_seconds=60, token_limit=0)
+    with patch("app.services.chatbot_service.conversations", conversations), patch(
+        "app.services.chatbot_service.aprocess_query"
+    ) as mock_process_query:
+        mock_process_query.return_value = "Mocked answer"
+        for question in ["Hvad dækker kasko?", "Og selvrisikoen?"]:
+            response = await chatbot_service_fixture.ask(
+                QuestionRequest(question=question), "a@example.com"
+            )
+            assert response == {"answer": "Mocked answer"}
+
+    assert all(len(call.args) == 2 for call in mock_process_query.call_args_list)
+    assert len(conversations) == 0
 
 
 @pytest.mark.asyncio
 async def test_ask_error(chatbot_service_fixture):
-    with patch("app.services.chatbot_service.process_query") as mock_process_query:
+    with patch("app.services.chatbot_service.aprocess_query") as mock_process_query:
         mock_process_query.side_effect = Exception("Test error")
         request = QuestionRequest(question="Test question")
         with pytest.raises(HTTPException) as exc_info:
@@ -36,7 +164,7 @@ async def test_ask_error(chatbot_service_fixture):
 
 @pytest.mark.asyncio
 async def test_compare_policies(chatbot_service_fixture):
-    with patch("app.services.chatbot_service.compare_policies_query") as mock_compare:
+    with patch("app.services.chatbot_service.acompare_policies_query") as mock_compare:
         mock_compare.return_value = "Comparison result"
         request = ComparisonRequest(
             policy1="policy1", policy2="policy2", query="comparison query"
@@ -50,7 +178,7 @@ async def test_compare_policies(chatbot_service_fixture):
 
 @pytest.mark.asyncio
 async def test_compare_policies_error(chatbot_service_fixture):
-    with patch("app.services.chatbot_service.compare_policies_query") as mock_compare:
+    with patch("app.services.chatbot_service.acompare_policies_query") as mock_compare:
         mock_compare.side_effect = Exception("Test error")
         request = ComparisonRequest(
             policy1="policy1", policy2="policy2", query="comparison query"
@@ -61,3 +189,58 @@ async def test_compare_policies_error(chatbot_service_fixture):
         assert "An error occurred while comparing policies" in str(
             exc_info.value.detail
         )
+
+
+@pytest.mark.asyncio
+async def test_compare_many_policies(chatbot_service_fixture):
+    with patch(
+        "app.services.chatbot_service.amulti_compare_policies_query"
+    ) as mock_compare:
+        mock_compare.return_value = "Comparison result"
+        request = MultiComparisonRequest(
+            policies=["IF/Bil", "Tryg/Bil", "TopDanmark/Bil"], query="comparison query"
+        )
+        response = await chatbot_service_fixture.compare_many_policies(request)
+        assert response == {"answer": "Comparison result"}
+        mock_compare.assert_called_once_with(
+            ["IF/Bil.pdf", "Tryg/Bil.pdf", "TopDanmark/Bil.pdf"], "comparison query"
+        )
+
+
+async def fake_stream(*args):
+    for token in ["Mocked ", "answer"]:
+        yield token
+
+
+@pytest.mark.asyncio
+async def test_ask_stream(chatbot_service_fixture):
+    with patch(
+        "app.services.chatbot_service.astream_query", side_effect=fake_stream
+    ) as mock_stream:
+        request = QuestionRequest(question="Test question")
+        tokens = [token async for token in chatbot_service_fixture.ask_stream(request)]
+        cached = [token async for token in chatbot_service_fixture.ask_stream(request)]
+
+    assert tokens == ["Mocked ", "answer"]
+    assert cached == ["Mocked answer"]
+    mock_stream.assert_called_once_with("Test question", live_registry.current(), [])
+
+
+@pytest.mark.asyncio
+async def test_compare_policies_stream(chatbot_service_fixture):
+    with patch(
+        "app.services.chatbot_service.astream_compare_policies_query",
+        side_effect=fake_stream,
+    ) as mock_stream:
+        request = ComparisonRequest(
+            policy1="policy1", policy2="policy2", query="comparison query"
+        )
+        tokens = [
+            token
+            async for token in chatbot_service_fixture.compare_policies_stream(request)
+        ]
+
+    assert tokens == ["Mocked ", "answer"]
+    mock_stream.assert_called_once_with(
+        "policy1.pdf", "policy2.pdf", "comparison query"
+    )
@@ -0,0 +1,204 @@
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import asyncio
+
+import pytest
+from app import compare_query
+from app.core.disk_cache import DiskCache
+from app.policy_registry import PolicyAgent, PolicyRegistry
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+
+@pytest.fixture(autouse=True)
+def comparison_cache(tmp_path):
+    cache = DiskCache(str(tmp_path / "comparisons.sqlite3"), max_bytes=1024 * 1024)
+    with patch.object(compare_query, "comparison_cache", cache):
+        yield cache
+    cache.close()
+
+
+@pytest.fixture
+def mock_client():
+    with patch.object(compare_query, "client") as mock_client:
+        mock_client.chat.completions.create.return_value.choices[0].message.content = (
+            "Sammenligning"
+        )
+        yield mock_client
+
+
+@pytest.fixture
+def registry():
+    nodes = [
+        TextNode(text=f"Afsnit {page}", metadata={"page_label": str(page)})
+        for page in range(1, 13)
+    ]
+    vector_index = VectorStoreIndex(nodes, embed_model=MockEmbedding(embed_dim=8))
+    policy_agent = PolicyAgent(MagicMock(), MagicMock(), vector_index)
+    registry = PolicyRegistry(
+        lambda policy_file: policy_agent, max_resident=2, top_agent_factory=MagicMock()
+    ).with_policies(
+        {
+            f"{company}_Bil": Path(company) / "Bil.pdf"
+            for company in ["IF", "TopDanmark", "Tryg"]
+        }
+    )
+    with patch("app.compare_query.live_registry") as mock_live_registry:
+        mock_live_registry.current.return_value = registry
+        yield registry
+
+
+def test_retrieve_policy_data_sends_top_k_chunks_in_page_order(registry):
+    name, text = compare_query.retrieve_policy_data("IF/Bil.pdf", "glasskade", top_k=3)
+
+    assert name == "Bil"
+    pages = [line for line in text.splitlines() if line.startswith("[Side")]
+    assert len(pages) == 3
+    assert pages == sorted(pages, key=lambda line: int(line[6:-1]))
+
+
+def test_retrieve_policy_data_unknown_policy(registry):
+    with pytest.raises(ValueError):
+        compare_query.retrieve_policy_data("Codan/Bil.pdf", "glasskade")
+
+
+def test_compare_policies_query_uses_retrieval_by_default(registry, mock_client):
+    with patch.object(compare_query, "prepare_policy_data") as mock_prepare:
+        answer = compare_query.compare_policies_query(
+            "IF/Bil.pdf", "IF/Bil.pdf", "glasskade"
+        )
+
+    assert answer == "Sammenligning"
+    mock_prepare.assert_not_called()
+    messages = mock_client.chat.completions.create.call_args.kwargs["messages"]
+    assert "[Side" in messages[1]["content"]
+
+
+def test_compare_policies_query_reuses_cached_result(registry, mock_client):
+    compare_query.compare_policies_query("IF/Bil.pdf", "IF/Bil.pdf", "Glasskade?")
+    answer = compare_query.compare_policies_query(
+        "IF/Bil.pdf", "IF/Bil.pdf", "glasskade"
+    )
+
+    assert answer == "Sammenligning"
+    mock_client.chat.completions.create.assert_called_once()
+
+
+def test_compare_policies_query_recomputes_changed_policy(registry, mock_client):
+    compare_query.compare_policies_query("IF/Bil.pdf", "IF/Bil.pdf", "glasskade")
+    with patch.object(compare_query, "content_hash", return_value="changed"):
+        compare_query.compare_policies_query("IF/Bil.pdf", "IF/Bil.pdf", "glasskade")
+
+    assert mock_client.chat.completions.create.call_count == 2
+
+
+def test_compare_policies_query_does_not_cache_errors(registry, mock_client):
+    mock_client.chat.completions.create.side_effect = Exception("Timeout")
+    compare_query.compare_policies_query("IF/Bil.pdf", "IF/Bil.pdf", "glasskade")
+    mock_client.chat.completions.create.side_effect = None
+
+    answer = compare_query.compare_policies_query(
+        "IF/Bil.pdf", "IF/Bil.pdf", "glasskade"
+    )
+
+    assert answer == "Sammenligning"
+
+
+@pytest.mark.asyncio
+async def test_acompare_policies_query_uses_async_client(registry):
+    with patch.object(compare_query, "async_client") as mock_client:
+        create = mock_client.chat.completions.create = AsyncMock()
+        create.return_value.choices[0].message.content = "Sammenligning"
+        answer = await compare_query.acompare_policies_query(
+            "IF/Bil.pdf", "IF/Bil.pdf", "glasskade"
+        )
+        cached = await compare_query.acompare_policies_query(
+            "IF/Bil.pdf", "IF/Bil.pdf", "glasskade"
+        )
+
+    assert answer == cached == "Sammenligning"
+    create.assert_awaited_once()
+    assert "[Side" in create.call_args.kwargs["messages"][1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_astream_compare_policies_query_streams_and_caches(registry):
+    async def completion_stream():
+        for content in ["| Aspekt |", None, " IF |"]:
+            chunk = MagicMock(usage=None)
+            chunk.choices[0].delta.content = content
+            yield chunk
+
+    with patch.object(compare_query, "async_client") as mock_client:
+        create = mock_client.chat.completions.create = AsyncMock()
+        create.return_value = completion_stream()
+        tokens = [
+            token
+            async for token in compare_query.astream_compare_policies_query(
+                "IF/Bil.pdf", "IF/Bil.pdf", "glasskade"
+            )
+        ]
+        cached = await compare_query.acompare_policies_query(
+            "IF/Bil.pdf", "IF/Bil.pdf", "glasskade"
+        )
+
+    assert tokens == ["| Aspekt |", " IF |"]
+    assert cached == "| Aspekt | IF |"
+    assert create.call_args.kwargs["stream"] is True
+
+
+@pytest.mark.asyncio
+async def test_amulti_compare_policies_query_maps_concurrently_and_merges(registry):
+    running = 0
+    most_running = 0
+
+    async def create(model, messages):
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        completion = MagicMock()
+        if "Findings for" in messages[1]["content"]:
+            completion.choices[0].message.content = (
+                "| Aspekt | IF | TopDanmark | Tryg |"
+            )
+        else:
+            completion.choices[0].message.content = "- Glas dækkes"
+        return completion
+
+    policies = ["IF/Bil.pdf", "TopDanmark/Bil.pdf", "Tryg/Bil.pdf"]
+    with patch.object(compare_query, "async_client") as mock_client, patch.object(
+        compare_query.settings, "COMPARISON_CONCURRENCY", 2
+    ):
+        mock_client.chat.completions.create = AsyncMock(side_effect=create)
+        answer = await compare_query.amulti_compare_policies_query(
+            policies, "glasskade"
+        )
+        cached = await compare_query.amulti_compare_policies_query(
+            policies, "Glasskade?"
+        )
+        # The findings of each policy are reused by a comparison of another set
+        await compare_query.amulti_compare_policies_query(policies[:2], "glasskade")
+
+    calls = mock_client.chat.completions.create.call_args_list
+    assert answer == cached == "| Aspekt | IF | TopDanmark | Tryg |"
+    assert most_running == 2
+    assert len(calls) == 5
+    merge_prompt = calls[3].kwargs["messages"][1]["content"]
+    for name in ["IF Bil", "TopDanmark Bil", "Tryg Bil"]:
+        assert f"Findings for {name}" in merge_prompt
+
+
+@pytest.mark.asyncio
+async def test_amulti_compare_policies_query_unknown_policy(registry):
+    with patch.object(compare_query, "async_client") as mock_client:
+        mock_client.chat.completions.create = AsyncMock()
+        answer = await compare_query.amulti_compare_policies_query(
+            ["IF/Bil.pdf", "Codan/Bil.pdf"], "glasskade"
+        )
+
+    assert answer.startswith("Error: Error loading policy Codan/Bil.pdf")
+    mock_client.chat.completions.create.assert_not_called()
@@ -0,0 +1,54 @@
+from unittest.mock import patch
+
+from app.conversation_memory import Conversation, ConversationStore
+
+
+def test_conversation_keeps_a_token_bounded_window():
+    conversation = Conversation(token_limit=40)
+    for i in range(10):
+        conversation.add_turn(f"Spørgsmål nummer {i}?", f"Svar på spørgsmål {i}.")
+
+    history = conversation.history()
+    assert 2 <= len(history) < 20
+    assert history[-1].content == "Svar på spørgsmål 9."
+    assert history[0].role == "user"
+    # Turns outside the window are not kept either
+    assert conversation._memory.get_all() == history
+
+
+def test_store_evicts_least_recently_used_sessions():
+    store = ConversationStore(max_sessions=2, idle_seconds=60, token_limit=100)
+    first = store.get("a@example.com")
+    store.get("b@example.com")
+    assert store.get("a@example.com") is first
+
+    store.get("c@example.com")
+
+    assert len(store) == 2
+    assert store.get("a@example.com") is first
+    assert store.get("b@example.com") is not None
+    assert len(store) == 2
+
+
+def test_store_expires_idle_sessions():
+    store = ConversationStore(max_sessions=10, idle_seconds=60, token_limit=100)
+    with patch("app.conversation_memory.time.monotonic", return_value=1000.0):
+        conversation = store.get("a@example.com")
+        conversation.add_turn("Hvad dækker kasko?", "Kasko dækker skader.")
+        store.get("b@example.com")
+
+    with patch("app.conversation_memory.time.monotonic", return_value=1061.0):
+        fresh = store.get("a@example.com")
+
+    assert fresh is not conversation
+    assert fresh.history() == []
+    assert len(store) == 1
+
+
+def test_drop_starts_a_new_conversation():
+    store = ConversationStore(max_sessions=10, idle_seconds=60, token_limit=100)
+    store.get("a@example.com").add_turn("Hvad dækker kasko?", "Kasko dækker skader.")
+
+    store.drop("a@example.com")
+
+    assert store.get("a@example.com").history() == []
@@ -0,0 +1,117 @@
+from unittest.mock import patch
+
+import pytest
+from app.core.disk_cache import DiskCache
+from app.embedding_cache import CachedEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import MockEmbedding
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = DiskCache(str(tmp_path / "embeddings.sqlite3"), max_bytes=1024 * 1024)
+    yield cache
+    cache.close()
+
+
+class CountingEmbedding(MockEmbedding):
+    _batches: list = PrivateAttr(default_factory=list)
+
+    def __init__(self, **kwargs):
+        super().__init__(embed_dim=4, **kwargs)
+
+    def _get_text_embeddings(self, texts):
+        self._batches.append(texts)
+        return super()._get_text_embeddings(texts)
+
+
+@pytest.fixture
+def embed_model():
+    return CountingEmbedding()
+
+
+def test_disk_cache_get_many(cache):
+    cache.set_many({"a": b"1", "b": b"22"})
+
+    assert cache.get_many(["a", "b", "c"]) == {"a": b"1", "b": b"22"}
+    assert cache.size() == 3
+
+
+def test_disk_cache_persists(cache):
+    cache.set("a", b"1")
+    cache.close()
+
+    reopened = DiskCache(str(cache.path), max_bytes=1024)
+    assert reopened.get("a") == b"1"
+    assert reopened.size() == 1
+    reopened.close()
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=35)
+    with patch("app.core.disk_cache.time.time", side_effect=range(100)):
+        cache.set("a", b"x" * 10)
+        cache.set("b", b"x" * 10)
+        cache.set("c", b"x" * 10)
+        cache.get("a")
+        cache.set("d", b"x" * 10)
+
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+    assert cache.size() == 30
+    cache.close()
+
+
+def test_disk_cache_keeps_total_size_on_overwrite_delete_and_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=35)
+
+    def stored_size():
+        return cache._connect().execute("SELECT SUM(size) FROM entries").fetchone()[0]
+
+    with patch("app.core.disk_cache.time.time", side_effect=range(100)):
+        cache.set_many({"a": b"x" * 10, "b": b"x" * 10})
+        cache.set("a", b"x" * 5)
+        assert cache.size() == stored_size() == 15
+
+        cache.delete_many(["b", "b", "missing"])
+        assert cache.size() == stored_size() == 5
+
+        cache.set_many({"c": b"x" * 20, "d": b"x" * 20})
+        assert set(cache.get_many(["a", "c", "d"])) == {"d"}
+        assert cache.size() == stored_size() == 20
+    cache.close()
+
+
+def test_disk_cache_evicts_writes_of_other_processes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = DiskCache(path, max_bytes=35)
+    second = DiskCache(path, max_bytes=35)
+    with patch("app.core.disk_cache.time.time", side_effect=range(100)):
+        first.set("a", b"x" * 10)
+        second.set("b", b"x" * 10)
+        second.set("c", b"x" * 10)
+        first.set("d", b"x" * 10)
+
+    assert set(first.get_many(["a", "b", "c", "d"])) == {"b", "c", "d"}
+    assert first.size() == second.size() == 30
+    first.close()
+    second.close()
+
+
+def test_cached_embedding_only_embeds_misses(cache, embed_model):
+    model = CachedEmbedding(embed_model, cache)
+
+    first = model.get_text_embedding_batch(["glasskade", "kasko"])
+    second = model.get_text_embedding_batch(["kasko", "ansvar", "glasskade"])
+
+    assert second[0] == first[1]
+    assert second[2] == first[0]
+    assert embed_model._batches == [["glasskade", "kasko"], ["ansvar"]]
+
+
+def test_cached_embedding_is_keyed_by_model(cache):
+    CachedEmbedding(CountingEmbedding(), cache).get_text_embedding("kasko")
+
+    other_model = CountingEmbedding(model_name="other")
+    CachedEmbedding(other_model, cache).get_text_embedding("kasko")
+
+    assert other_model._batches == [["kasko"]]
@@ -0,0 +1,262 @@
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from app import information_query
+from app.llm_backends import FakeLLM
+from app.policy_registry import PolicyAgent, PolicyRegistry
+from llama_index.agent.openai import OpenAIAgent
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import ChatMessage, MessageRole, MockLLM
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.objects import ObjectRetriever
+
+PAGES = ["Dækning ved glasskade. " * 5, "Betaling sker via NemKonto. " * 5]
+
+
+@pytest.fixture
+def mock_pages():
+    with patch("app.information_query.iter_pages") as mock:
+        mock.side_effect = lambda file_path: iter(PAGES)
+        yield mock
+
+
+@pytest.fixture
+def policy_file(tmp_path):
+    policy_file = tmp_path / "IF" / "Bil.pdf"
+    policy_file.parent.mkdir()
+    policy_file.write_bytes(b"%PDF-1.7 policy")
+    with patch("app.information_query.content_hash", return_value="abc"):
+        yield policy_file
+
+
+@pytest.fixture
+def mock_embed_model():
+    Settings.embed_model = MockEmbedding(embed_dim=8)
+    yield
+    Settings.embed_model = None
+
+
+@pytest.fixture
+def mock_llm():
+    previous = Settings._llm
+    llm = MockLLM()
+    Settings.llm = llm
+    with patch.object(MockLLM, "complete", wraps=llm.complete) as complete:
+        yield complete
+    Settings._llm = previous
+
+
+def test_iter_policy_nodes_keeps_page_numbers(mock_pages):
+    nodes = list(information_query.iter_policy_nodes("Bil.pdf", SentenceSplitter()))
+
+    assert [node.metadata["page_label"] for node in nodes] == ["1", "2"]
+    assert "glasskade" in nodes[0].text
+    assert "NemKonto" in nodes[1].text
+
+
+def test_load_policy_indexes_reuses_persisted_indexes(
+    mock_pages, policy_file, mock_embed_model, mock_llm
+):
+    index_path = policy_file.parent / "IF_Bil_index"
+    node_parser = SentenceSplitter()
+
+    vector_index, summaries = information_query.load_policy_indexes(
+        policy_file, index_path, node_parser
+    )
+    assert len(vector_index.docstore.docs) == 2
+    assert [section.pages for section in summaries.sections] == ["1-2"]
+    assert information_query.read_manifest(index_path)["sha256"] == "abc"
+
+    vector_index, reloaded = information_query.load_policy_indexes(
+        policy_file, index_path, node_parser
+    )
+    assert mock_pages.call_count == 1
+    assert mock_llm.call_count == 1
+    assert reloaded == summaries
+
+
+def test_load_policy_indexes_summarizes_index_without_summaries(
+    mock_pages, policy_file, mock_embed_model, mock_llm
+):
+    index_path = policy_file.parent / "IF_Bil_index"
+    information_query.load_policy_indexes(policy_file, index_path, SentenceSplitter())
+    (index_path / "summaries.json").unlink()
+
+    _, summaries = information_query.load_policy_indexes(
+        policy_file, index_path, SentenceSplitter()
+    )
+
+    assert mock_pages.call_count == 1
+    assert mock_llm.call_count == 2
+    assert "glasskade" in summaries.summary
+
+
+def test_load_policy_indexes_rebuilds_changed_policy(
+    mock_pages, policy_file, mock_embed_model, mock_llm
+):
+    index_path = policy_file.parent / "IF_Bil_index"
+    information_query.load_policy_indexes(policy_file, index_path, SentenceSplitter())
+
+    with patch("app.information_query.content_hash", return_value="def"):
+        information_query.load_policy_indexes(
+            policy_file, index_path, SentenceSplitter()
+        )
+
+    assert mock_pages.call_count == 2
+    assert information_query.read_manifest(index_path)["sha256"] == "def"
+
+
+def test_register_policy_skips_policy_deleted_while_building():
+    cancelled = threading.Event()
+
+    def build_policy_agent(policy_file, timer):
+        # A deletion waits for the policy lock, so it lands while the job holds it
+        cancelled.set()
+        return MagicMock()
+
+    with patch(
+        "app.information_query.build_policy_agent", side_effect=build_policy_agent
+    ), patch("app.information_query.live_registry") as mock_live_registry:
+        information_query.register_policy("IF", "Bil", cancelled=cancelled)
+
+    mock_live_registry.update.assert_not_called()
+
+
+def test_policy_lock_is_shared_per_policy():
+    lock = information_query.policy_lock("IF_Bil")
+
+    assert information_query.policy_lock("IF_Bil") is lock
+    assert information_query.policy_lock("Tryg_Bil") is not lock
+
+
+@pytest.mark.asyncio
+async def test_aprocess_query_uses_given_registry():
+    top_agent = information_query.TopAgent([], llm=FakeLLM())
+    registry = PolicyRegistry(
+        MagicMock(), max_resident=1, top_agent_factory=lambda registry: top_agent
+    )
+
+    assert (
+        await information_query.aprocess_query("Hvad dækker kasko?", registry)
+        == "Svar: Hvad dækker kasko"
+    )
+    # The shared agent answers every user, so it must not remember the question
+    assert top_agent.agent("").memory.get_all() == []
+
+
+@pytest.mark.asyncio
+async def test_aprocess_query_without_conversation_memory():
+    top_agent = information_query.TopAgent([], llm=FakeLLM())
+    registry = PolicyRegistry(
+        MagicMock(), max_resident=1, top_agent_factory=lambda registry: top_agent
+    )
+
+    with patch("app.information_query.settings.CONVERSATION_MEMORY_TOKENS", 0):
+        answer = await information_query.aprocess_query("Hvad dækker kasko?", registry)
+
+    assert answer == "Svar: Hvad dækker kasko"
+
+
+@pytest.mark.asyncio
+async def test_aprocess_query_routes_named_policy():
+    policy_agent = PolicyAgent(
+        agent=OpenAIAgent.from_tools([], llm=FakeLLM()), query_engine=MagicMock()
+    )
+    top_agent_factory = MagicMock()
+    registry = PolicyRegistry(
+        lambda policy_file: policy_agent,
+        max_resident=1,
+        top_agent_factory=top_agent_factory,
+    ).with_policies({"IF_Bil": Path("IF") / "Bil.pdf"})
+
+    assert (
+        await information_query.aprocess_query("Hvad dækker IF?", registry)
+        == "Svar: Hvad dækker IF"
+    )
+    top_agent_factory.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_aprocess_query_sends_chat_history():
+    top_agent = information_query.TopAgent([], llm=FakeLLM())
+    registry = PolicyRegistry(
+        MagicMock(), max_resident=1, top_agent_factory=lambda registry: top_agent
+    )
+    history = [
+        ChatMessage(role=MessageRole.USER, content="Hvad dækker kasko?"),
+        ChatMessage(role=MessageRole.ASSISTANT, content="Kasko dækker skader."),
+    ]
+
+    with patch.object(
+        FakeLLM, "_achat", autospec=True, side_effect=FakeLLM._achat
+    ) as achat:
+        await information_query.aprocess_query(
+            "Og selvrisikoen?", registry, chat_history=history
+        )
+
+    system, *messages = achat.call_args.args[1]
+    assert system.content == information_query.TOP_AGENT_PROMPT
+    assert [message.content for message in messages] == [
+        "Hvad dækker kasko?",
+        "Kasko dækker skader.",
+        "Og selvrisikoen?",
+    ]
+    assert top_agent.agent("").memory.get_all() == []
+
+
+@pytest.mark.parametrize("tool_top_k, offered", [(2, 2), (0, 3)])
+def test_top_agent_retrieves_top_k_tools(mock_embed_model, tool_top_k, offered):
+    registry = PolicyRegistry(
+        MagicMock(), max_resident=1, top_agent_factory=MagicMock()
+    ).with_policies(
+        {
+            f"{company}_Bil": Path(company) / "Bil.pdf"
+            for company in ["IF", "Tryg", "TopDanmark"]
+        }
+    )
+    tools = [
+        information_query.build_policy_tool(registry, name) for name in registry.names()
+    ]
+
+    top_agent = information_query.TopAgent(tools, tool_top_k=tool_top_k)
+    agent = top_agent.agent("Hvad dækker Tryg?")
+
+    assert len(agent.agent_worker.get_tools("Hvad dækker Tryg?")) == offered
+
+
+@pytest.mark.asyncio
+async def test_aprocess_query_retrieves_top_k_tools_without_blocking(mock_embed_model):
+    policy_agent = PolicyAgent(
+        agent=OpenAIAgent.from_tools([], llm=FakeLLM()), query_engine=MagicMock()
+    )
+    registry = PolicyRegistry(
+        lambda policy_file: policy_agent,
+        max_resident=4,
+        top_agent_factory=lambda registry: information_query.TopAgent(
+            [
+                information_query.build_policy_tool(registry, name)
+                for name in registry.names()
+            ],
+            tool_top_k=2,
+            llm=FakeLLM(),
+        ),
+    ).with_policies(
+        {
+            f"{company}_Bil": Path(company) / "Bil.pdf"
+            for company in ["IF", "Tryg", "TopDanmark"]
+        }
+    )
+
+    # A blocking retrieval would embed the query on the event loop
+    with patch.object(
+        ObjectRetriever, "retrieve", side_effect=AssertionError("blocking retrieve")
+    ):
+        answer = await information_query.aprocess_query(
+            "Hvad dækker en glasskade?", registry
+        )
+
+    # The fake LLM calls the first tool offered, whose policy agent echoes the query
+    assert answer == "Svar: Svar Hvad dækker en glasskade"
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+from app.models.ingestion import JobStatus
+from app.services.ingestion_service import IngestionQueue
+
+
+def fake_register_policy(insurance_name, policy_name, timer, cancelled):
+    with timer.stage("extract"):
+        timer.count("pages", 3)
+    with timer.stage("embed"):
+        timer.count("nodes", 7)
+    with timer.stage("build_agent"):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_submit_returns_immediately_and_runs_job():
+    queue = IngestionQueue(max_concurrency=1, max_history=10)
+    with patch(
+        "app.services.ingestion_service.register_policy",
+        side_effect=fake_register_policy,
+    ) as mock_register:
+        job = queue.submit("IF", "Bil")
+        assert job.status == JobStatus.QUEUED
+        assert queue.get(job.id) is job
+
+        await queue.join()
+
+    mock_register.assert_called_once()
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.stage is None
+    assert job.progress == {"pages": 3, "nodes": 7}
+    assert set(job.timings) == {"extract", "embed", "build_agent"}
+    assert job.finishedAt >= job.startedAt
+
+
+@pytest.mark.asyncio
+async def test_failed_job_reports_error():
+    queue = IngestionQueue(max_concurrency=1, max_history=10)
+    with patch(
+        "app.services.ingestion_service.register_policy",
+        side_effect=ValueError("Could not load policy"),
+    ):
+        job = queue.submit("IF", "Bil")
+        await queue.join()
+
+    assert job.status == JobStatus.FAILED
+    assert job.error == "Could not load policy"
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    queue = IngestionQueue(max_concurrency=2, max_history=10)
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def slow_register_policy(insurance_name, policy_name, timer, cancelled):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        threading.Event().wait(0.05)
+        with lock:
+            running -= 1
+
+    with patch(
+        "app.services.ingestion_service.register_policy",
+        side_effect=slow_register_policy,
+    ):
+        jobs = [queue.submit("IF", f"Policy{i}") for i in range(5)]
+        await queue.join()
+
+    assert peak == 2
+    assert all(job.status == JobStatus.SUCCEEDED for job in jobs)
+
+
+@pytest.mark.asyncio
+async def test_history_is_bounded():
+    queue = IngestionQueue(max_concurrency=1, max_history=2)
+    with patch("app.services.ingestion_service.register_policy"):
+        jobs = [queue.submit("IF", f"Policy{i}") for i in range(3)]
+        await queue.join()
+
+    assert queue.get(jobs[0].id) is None
+    assert queue.get(jobs[2].id) is jobs[2]
+
+
+@pytest.mark.asyncio
+async def test_cancel_skips_queued_and_running_jobs_of_the_policy():
+    queue = IngestionQueue(max_concurrency=1, max_history=10)
+    started = threading.Event()
+    release = threading.Event()
+    registered = []
+
+    def blocking_register_policy(insurance_name, policy_name, timer, cancelled):
+        started.set()
+        release.wait(1)
+        if not cancelled.is_set():
+            registered.append(policy_name)
+
+    with patch(
+        "app.services.ingestion_service.register_policy",
+        side_effect=blocking_register_policy,
+    ) as mock_register:
+        running = queue.submit("IF", "Bil")
+        queued = queue.submit("IF", "Bil")
+        other = queue.submit("IF", "Hus")
+        await asyncio.to_thread(started.wait, 1)
+
+        queue.cancel("IF", "Bil")
+        release.set()
+        await queue.join()
+
+    assert running.status == JobStatus.CANCELLED
+    assert queued.status == JobStatus.CANCELLED
+    assert queued.startedAt is None
+    assert other.status == JobStatus.SUCCEEDED
+    assert mock_register.call_count == 2
+    assert registered == ["Hus"]
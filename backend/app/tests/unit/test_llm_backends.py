@@ -0,0 +1,110 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from app import llm_backends
+from app.llm_backends import (
+    FakeAsyncOpenAIClient,
+    FakeLLM,
+    HashingEmbedding,
+    close_http_clients,
+    get_async_http_client,
+    get_embed_model,
+    get_http_client,
+    get_llm,
+    get_openai_clients,
+)
+from llama_index.agent.openai import OpenAIAgent
+from llama_index.core.base.response.schema import Response
+from llama_index.core.query_engine import CustomQueryEngine
+from llama_index.core.tools import QueryEngineTool, ToolMetadata
+
+
+class PolicyQueryEngine(CustomQueryEngine):
+    def custom_query(self, query_str: str) -> Response:
+        return Response(response=f"Glasskade dækkes: {query_str}")
+
+
+def test_fake_llm_runs_a_question_through_an_agent_tool():
+    tool = QueryEngineTool(
+        query_engine=PolicyQueryEngine(),
+        metadata=ToolMetadata(name="vector_tool_IF_Bil", description="IF Bil"),
+    )
+    agent = OpenAIAgent.from_tools([tool], llm=FakeLLM())
+
+    response = agent.chat("Dækker IF glasskade?")
+
+    assert response.sources[0].tool_name == "vector_tool_IF_Bil"
+    assert str(response) == "Svar: Glasskade dækkes Dækker IF glasskade"
+
+
+@pytest.mark.asyncio
+async def test_fake_llm_streams_words():
+    agent = OpenAIAgent.from_tools([], llm=FakeLLM())
+
+    response = await agent.astream_chat("Dækker IF glasskade?")
+    tokens = [token async for token in response.async_response_gen()]
+
+    assert "".join(tokens) == "Svar: Dækker IF glasskade"
+    assert len(tokens) == 4
+
+
+def test_hashing_embedding_is_deterministic_and_word_based():
+    embed_model = HashingEmbedding(embed_dim=64)
+    glass = np.array(embed_model.get_text_embedding("dækning ved glasskade"))
+    same = np.array(embed_model.get_query_embedding("Glasskade dækning"))
+    other = np.array(embed_model.get_text_embedding("betaling via NemKonto"))
+
+    assert embed_model.get_text_embedding("dækning ved glasskade") == glass.tolist()
+    assert glass @ same > 0.7
+    assert glass @ same > glass @ other
+
+
+@pytest.mark.asyncio
+async def test_fake_async_client_streams_completion():
+    client = FakeAsyncOpenAIClient()
+    messages = [{"role": "user", "content": "Sammenlign IF og Tryg"}]
+
+    completion = await client.chat.completions.create(model="m", messages=messages)
+    stream = await client.chat.completions.create(
+        model="m", messages=messages, stream=True
+    )
+    content = "".join([chunk.choices[0].delta.content async for chunk in stream])
+
+    assert completion.choices[0].message.content == content
+    assert completion.usage.prompt_tokens == 4
+
+
+def test_backend_is_selected_from_settings():
+    with patch.object(llm_backends.settings, "LLM_BACKEND", "fake"):
+        assert isinstance(get_llm(temperature=0), FakeLLM)
+        assert isinstance(get_embed_model(), HashingEmbedding)
+        assert llm_backends.model_id() == "fake:gpt-4o-mini"
+    with patch.object(llm_backends.settings, "LLM_BACKEND", "local"):
+        with pytest.raises(ValueError):
+            get_llm()
+
+
+@pytest.mark.asyncio
+async def test_openai_clients_share_one_sharded_pool():
+    with patch.object(llm_backends.settings, "LLM_BACKEND", "openai"), patch.object(
+        llm_backends.settings, "LLM_HTTP_POOL_SHARDS", 4
+    ):
+        await close_http_clients()
+        llm, other = get_llm(), get_llm(temperature=0)
+        client, async_client = get_openai_clients()
+
+        assert llm._get_client()._client is get_http_client()
+        assert other._get_aclient()._client is get_async_http_client()
+        assert client._client is get_http_client()
+        assert async_client._client is get_async_http_client()
+
+        transport = get_async_http_client()._transport
+        assert len(transport._transports) == 4
+        limits = transport._transports[0]._pool
+        assert limits._max_connections == 16
+        assert limits._max_keepalive_connections == 16
+
+        await close_http_clients()
+        assert get_async_http_client() is not async_client._client
+        await close_http_clients()
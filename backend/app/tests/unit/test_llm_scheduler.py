@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from app.llm_backends import AsyncShardedTransport, ShardedTransport
+from app.llm_scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    LLMScheduler,
+    llm_priority,
+    retry_after_seconds,
+)
+
+
+async def started(scheduler, order, name, priority):
+    with llm_priority(priority):
+        await scheduler.acquire()
+    order.append(name)
+
+
+@pytest.mark.asyncio
+async def test_interactive_requests_are_admitted_before_background_ones():
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+    await scheduler.acquire()
+
+    tasks = [
+        asyncio.create_task(started(scheduler, order, "ingest-1", BACKGROUND)),
+        asyncio.create_task(started(scheduler, order, "ingest-2", BACKGROUND)),
+    ]
+    await asyncio.sleep(0)
+    tasks.append(
+        asyncio.create_task(started(scheduler, order, "question", INTERACTIVE))
+    )
+    await asyncio.sleep(0)
+    assert scheduler.snapshot()["queued"] == {"interactive": 1, "background": 2}
+
+    for _ in tasks:
+        scheduler.release(200, 0.1)
+        await asyncio.sleep(0.01)
+
+    await asyncio.gather(*tasks)
+    assert order == ["question", "ingest-1", "ingest-2"]
+    waits = scheduler.snapshot()["waits"]
+    assert waits["interactive"]["requests"] == 2
+    assert waits["background"]["requests"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = LLMScheduler(max_concurrency=1)
+    await scheduler.acquire()
+    waiting = asyncio.create_task(scheduler.acquire())
+    await asyncio.sleep(0)
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    scheduler.release(200, 0.1)
+
+    snapshot = scheduler.snapshot()
+    assert snapshot["queued"] == {"interactive": 0, "background": 0}
+    assert snapshot["in_flight"] == 0
+
+
+def test_throttled_response_halves_the_limit_and_pauses_requests():
+    scheduler = LLMScheduler(max_concurrency=8, min_concurrency=2)
+    scheduler.acquire_blocking()
+    scheduler.release(429, 0.1, retry_after=0.2)
+
+    snapshot = scheduler.snapshot()
+    assert snapshot["limit"] == 4
+    assert snapshot["throttled"] == 1
+    assert snapshot["paused_seconds"] > 0.1
+
+    start = time.monotonic()
+    scheduler.acquire_blocking()
+    assert time.monotonic() - start >= 0.15
+    scheduler.release(200, 0.1)
+
+    # The limit grows back by about one per limit successful responses
+    for _ in range(4):
+        scheduler.acquire_blocking()
+        scheduler.release(200, 0.1)
+    assert scheduler.limit == 5
+
+    for _ in range(10):
+        scheduler.release(429, 0.1, retry_after=0)
+        scheduler._decreased_at = 0.0
+    assert scheduler.limit == 2
+
+
+def test_slow_responses_lower_the_limit():
+    scheduler = LLMScheduler(max_concurrency=10, latency_tolerance=2.0)
+    for _ in range(20):
+        scheduler.acquire_blocking()
+        scheduler.release(200, 0.1)
+    assert scheduler.limit == 10
+
+    for _ in range(20):
+        scheduler.acquire_blocking()
+        scheduler.release(200, 1.0)
+        scheduler._decreased_at = 0.0
+    assert scheduler.limit < 10
+
+
+def test_token_bucket_paces_requests_after_the_burst():
+    scheduler = LLMScheduler(max_concurrency=10, requests_per_second=20, burst=2)
+    start = time.monotonic()
+    for _ in range(4):
+        scheduler.acquire_blocking()
+        scheduler.release(200, 0.0)
+    # Two requests of the burst, then one every 50 ms
+    assert 0.08 <= time.monotonic() - start < 0.5
+
+
+def test_blocking_and_async_callers_share_the_limit():
+    scheduler = LLMScheduler(max_concurrency=1)
+    scheduler.acquire_blocking()
+    admitted = threading.Event()
+
+    def background():
+        with llm_priority(BACKGROUND):
+            scheduler.acquire_blocking()
+        admitted.set()
+
+    thread = threading.Thread(target=background)
+    thread.start()
+    assert not admitted.wait(0.05)
+    scheduler.release(200, 0.1)
+    assert admitted.wait(1)
+    thread.join()
+    scheduler.release(200, 0.1)
+    assert scheduler.snapshot()["in_flight"] == 0
+
+
+def test_retry_after_is_read_in_seconds_or_milliseconds():
+    assert retry_after_seconds(httpx.Headers({"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(httpx.Headers({"retry-after": "2"})) == 2.0
+    assert (
+        retry_after_seconds(httpx.Headers({"retry-after": "Wed, 21 Oct 2015"})) is None
+    )
+    assert retry_after_seconds(httpx.Headers()) is None
+
+
+def responder(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/limited":
+        return httpx.Response(429, headers={"retry-after-ms": "10"})
+    return httpx.Response(200, json={"ok": True})
+
+
+def test_transport_holds_the_slot_until_the_response_is_read():
+    scheduler = LLMScheduler(max_concurrency=4)
+    transport = ShardedTransport(2, httpx.Limits(), scheduler)
+    transport._transports = [httpx.MockTransport(responder)] * 2
+
+    with httpx.Client(transport=transport, base_url="http://llm") as client:
+        with client.stream("GET", "/ok") as response:
+            assert scheduler.snapshot()["in_flight"] == 1
+            response.read()
+        assert scheduler.snapshot()["in_flight"] == 0
+
+        assert client.get("/limited").status_code == 429
+        assert scheduler.snapshot()["throttled"] == 1
+        assert scheduler.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_async_transport_reports_responses_to_the_scheduler():
+    scheduler = LLMScheduler(max_concurrency=4)
+    transport = AsyncShardedTransport(2, httpx.Limits(), scheduler)
+    transport._transports = [httpx.MockTransport(responder)] * 2
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://llm") as client:
+        responses = await asyncio.gather(*(client.get("/ok") for _ in range(8)))
+        assert all(response.json() == {"ok": True} for response in responses)
+        assert (await client.get("/limited")).status_code == 429
+
+    snapshot = scheduler.snapshot()
+    assert snapshot["in_flight"] == 0
+    assert snapshot["throttled"] == 1
+    assert snapshot["waits"]["interactive"]["requests"] == 9
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import pytest
+from app.pdf_extraction import count_pages, extract_many, extract_pages, iter_pages
+
+POLICY_FILE = str(Path("insurance_policies") / "IF" / "Bil.pdf")
+
+
+@pytest.fixture(scope="module")
+def sequential_pages():
+    return extract_pages(POLICY_FILE, max_workers=1)
+
+
+def test_extract_pages_sequential(sequential_pages):
+    assert len(sequential_pages) == count_pages(POLICY_FILE)
+    assert any(page.strip() for page in sequential_pages)
+
+
+def test_extract_pages_parallel_keeps_page_order(sequential_pages):
+    pages = extract_pages(POLICY_FILE, max_workers=2, pages_per_task=5)
+    assert pages == sequential_pages
+
+
+def test_extract_many_merges_per_file(sequential_pages):
+    results = extract_many([POLICY_FILE, POLICY_FILE], max_workers=1)
+    assert results == [sequential_pages, sequential_pages]
+
+
+def test_iter_pages_parallel_keeps_page_order(sequential_pages):
+    pages = iter_pages(POLICY_FILE, max_workers=2, pages_per_task=5)
+    assert list(pages) == sequential_pages
@@ -0,0 +1,199 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from app.llm_backends import FakeLLM
+from app.policy_registry import (
+    LazyPolicyQueryEngine,
+    LiveRegistry,
+    PolicyAgent,
+    PolicyRegistry,
+)
+from app.text_cache import content_hash
+from llama_index.agent.openai import OpenAIAgent
+from llama_index.core.base.response.schema import Response
+
+
+def build_policy_agent(policy_file):
+    agent = MagicMock()
+    agent.query.return_value = Response(response=f"Answer from {policy_file}")
+    return PolicyAgent(agent=agent, query_engine=MagicMock())
+
+
+@pytest.fixture
+def builder():
+    return MagicMock(side_effect=build_policy_agent)
+
+
+@pytest.fixture
+def top_agent_factory():
+    return MagicMock(side_effect=lambda registry: MagicMock())
+
+
+@pytest.fixture
+def registry(builder, top_agent_factory):
+    policies = {}
+    for name in ["IF_Bil", "Tryg_Bil", "TopDanmark_Bil"]:
+        company, policy = name.split("_")
+        policies[name] = Path(company) / f"{policy}.pdf"
+    return PolicyRegistry(
+        builder, max_resident=2, top_agent_factory=top_agent_factory
+    ).with_policies(policies)
+
+
+def test_with_policies_does_not_build(registry, builder):
+    assert len(registry) == 3
+    assert registry.version == 1
+    assert registry.resident() == []
+    builder.assert_not_called()
+
+
+def test_get_builds_once(registry, builder):
+    first = registry.get("IF_Bil")
+    second = registry.get("IF_Bil")
+    assert first is second
+    builder.assert_called_once_with(Path("IF") / "Bil.pdf")
+    assert registry._build_locks == {}
+
+
+def test_failed_build_releases_its_lock(registry, builder):
+    builder.side_effect = OSError("Policy file not found")
+    with pytest.raises(OSError):
+        registry.get("IF_Bil")
+
+    assert registry._build_locks == {}
+
+
+def test_get_evicts_least_recently_used(registry, builder):
+    registry.get("IF_Bil")
+    registry.get("Tryg_Bil")
+    registry.get("IF_Bil")
+    registry.get("TopDanmark_Bil")
+    assert registry.resident() == ["IF_Bil", "TopDanmark_Bil"]
+
+    registry.get("Tryg_Bil")
+    assert builder.call_count == 4
+
+
+def test_get_unknown_policy(registry):
+    with pytest.raises(KeyError):
+        registry.get("Unknown_Bil")
+
+
+def test_new_version_shares_unchanged_agents(registry, builder):
+    agent = registry.get("IF_Bil")
+    registry.get("Tryg_Bil")
+
+    updated = registry.with_policy("Alm_Brand_Bil", Path("Alm_Brand") / "Bil.pdf")
+
+    assert updated.version == registry.version + 1
+    assert updated.get("IF_Bil") is agent
+    assert "Alm_Brand_Bil" not in registry
+    assert builder.call_count == 2
+
+
+def test_with_policy_replaces_stale_agent(registry, builder):
+    stale = registry.get("IF_Bil")
+    fresh = build_policy_agent(Path("IF") / "Bil.pdf")
+
+    updated = registry.with_policy("IF_Bil", Path("IF") / "Bil.pdf", fresh)
+
+    assert updated.get("IF_Bil") is fresh
+    assert registry.get("IF_Bil") is stale
+    assert builder.call_count == 1
+
+
+def test_new_version_rebuilds_policy_changed_at_same_path(tmp_path, top_agent_factory):
+    policy_file = tmp_path / "IF" / "Bil.pdf"
+    policy_file.parent.mkdir()
+    policy_file.write_bytes(b"%PDF-1.4 old terms")
+    builder = MagicMock(
+        side_effect=lambda policy_file: PolicyAgent(
+            agent=MagicMock(),
+            query_engine=MagicMock(),
+            content_hash=content_hash(policy_file),
+        )
+    )
+    registry = PolicyRegistry(
+        builder,
+        max_resident=2,
+        top_agent_factory=top_agent_factory,
+        fingerprint=content_hash,
+    ).with_policies({"IF_Bil": policy_file})
+    stale = registry.get("IF_Bil")
+
+    assert registry.with_policies({"IF_Bil": policy_file}).get("IF_Bil") is stale
+
+    policy_file.write_bytes(b"%PDF-1.4 new terms and conditions")
+    updated = registry.with_policies({"IF_Bil": policy_file})
+
+    assert updated.resident() == []
+    assert updated.get("IF_Bil") is not stale
+    assert builder.call_count == 2
+
+
+def test_old_version_keeps_serving_after_removal(registry):
+    registry.get("IF_Bil")
+    updated = registry.without_policy("IF_Bil")
+
+    assert "IF_Bil" not in updated
+    assert updated.resident() == []
+    assert registry.get("IF_Bil").agent.query("Hvad dækker kasko?").response
+
+
+def test_top_agent_is_built_once_per_version(registry, top_agent_factory):
+    assert registry.top_agent() is registry.top_agent()
+    updated = registry.without_policy("IF_Bil")
+    assert updated.top_agent() is not registry.top_agent()
+    assert [call.args[0] for call in top_agent_factory.call_args_list] == [
+        registry,
+        updated,
+    ]
+
+
+def test_live_registry_update_swaps_version(registry):
+    live_registry = LiveRegistry(registry)
+    in_flight = live_registry.current()
+
+    updated = live_registry.update(lambda current: current.without_policy("IF_Bil"))
+
+    assert live_registry.current() is updated
+    assert "IF_Bil" in in_flight
+    assert "IF_Bil" not in live_registry.current()
+
+
+def fake_policy_agent(policy_file):
+    return PolicyAgent(
+        agent=OpenAIAgent.from_tools([], llm=FakeLLM()), query_engine=MagicMock()
+    )
+
+
+def test_lazy_query_engine_resolves_agent(top_agent_factory):
+    builder = MagicMock(side_effect=fake_policy_agent)
+    registry = PolicyRegistry(
+        builder, max_resident=2, top_agent_factory=top_agent_factory
+    ).with_policies({"Tryg_Bil": Path("Tryg") / "Bil.pdf"})
+    engine = LazyPolicyQueryEngine(registry, "Tryg_Bil")
+    builder.assert_not_called()
+
+    response = engine.query("Hvad dækker glasskade?")
+
+    assert response.response == "Svar: Hvad dækker glasskade"
+    builder.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_lazy_query_engine_keeps_no_history_in_shared_agent(top_agent_factory):
+    registry = PolicyRegistry(
+        fake_policy_agent, max_resident=2, top_agent_factory=top_agent_factory
+    ).with_policies({"IF_Bil": Path("IF") / "Bil.pdf"})
+    engine = LazyPolicyQueryEngine(registry, "IF_Bil")
+
+    first = await engine.aquery("Hvad dækker kasko?")
+    second = await engine.aquery("Hvad koster selvrisikoen?")
+
+    assert first.response == "Svar: Hvad dækker kasko"
+    assert second.response == "Svar: Hvad koster selvrisikoen"
+    agent = registry.get("IF_Bil").agent
+    assert agent.memory.get_all() == []
+    assert agent.state.task_dict == {}
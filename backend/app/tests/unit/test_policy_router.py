@@ -0,0 +1,105 @@
+from pathlib import Path
+
+import pytest
+from app.policy_router import PolicyRouter
+
+POLICIES = {
+    "IF_Bil": Path("IF") / "Bil.pdf",
+    "Tryg_Bil": Path("Tryg") / "Bil.pdf",
+    "TopDanmark_Bil": Path("TopDanmark") / "Bil.pdf",
+    "TopDanmark_Hus": Path("TopDanmark") / "Hus.pdf",
+}
+
+
+@pytest.fixture
+def router():
+    return PolicyRouter(POLICIES)
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("Hvad dækker TopDanmark Bil ved glasskade?", "TopDanmark_Bil"),
+        ("Hvad dækker top danmark bilforsikring?", "TopDanmark_Bil"),
+        ("Dækker Topdanmak husforsikringen stormskader?", "TopDanmark_Hus"),
+        ("Hvordan betaler jeg hos Tryg?", "Tryg_Bil"),
+        ("Hvornår udbetaler IF erstatning?", "IF_Bil"),
+        ("IF dækker glasskader?", "IF_Bil"),
+        ("Hvad koster tryg bilforsikring?", "Tryg_Bil"),
+        ("Hvad dækker if forsikring ved brand?", "IF_Bil"),
+    ],
+)
+def test_routes_named_policy(router, question, expected):
+    assert router.route(question) == expected
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Hvad dækker en bilforsikring ved glasskade?",
+        "Hvad er forskellen på IF og Tryg ved glasskade?",
+        "Hvad dækker TopDanmark ved brand?",
+        "Hvordan melder jeg en skade?",
+        "Hvad dækker IF husforsikring?",
+        "Dækker Tryg rejseforsikringen afbestilling?",
+    ],
+)
+def test_ambiguous_question_is_not_routed(router, question):
+    assert router.route(question) is None
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What is covered if I crash my car?",
+        "Er det tryg at køre med en revnet rude?",
+        "Tryg kørsel, giver det rabat?",
+        "if jeg kører galt, hvad så?",
+    ],
+)
+def test_everyday_words_do_not_name_companies(router, question):
+    assert router.named_policies(question) == []
+
+
+def test_named_policies(router):
+    assert router.named_policies("Hvad dækker Tryg ved glasskade?") == ["Tryg_Bil"]
+    assert router.named_policies("Hvad dækker TopDanmark ved brand?") == [
+        "TopDanmark_Bil",
+        "TopDanmark_Hus",
+    ]
+    assert router.named_policies("Hvordan melder jeg en skade?") == []
+
+
+def test_routes_by_embedding_similarity():
+    def embed(texts):
+        return [
+            [1.0, 0.0] if "tryg" in text.casefold() else [0.0, 1.0] for text in texts
+        ]
+
+    router = PolicyRouter(
+        {name: POLICIES[name] for name in ["IF_Bil", "Tryg_Bil"]},
+        embed=embed,
+        similarity_threshold=0.9,
+    )
+
+    assert router.route("Hvad siger den trygge police om glas?") == "Tryg_Bil"
+
+
+def test_policy_type_the_company_does_not_offer_is_not_routed():
+    router = PolicyRouter(
+        {name: POLICIES[name] for name in ["TopDanmark_Bil", "Tryg_Bil"]},
+        embed=lambda texts: [[1.0, 0.0] for _ in texts],
+    )
+
+    assert router.route("Hvad dækker TopDanmark husforsikring?") is None
+    assert router.named_policies("Hvad dækker TopDanmark husforsikring?") == []
+    assert router.route("Hvad dækker TopDanmark bilforsikring?") == "TopDanmark_Bil"
+
+
+def test_embedding_failure_falls_back():
+    def embed(texts):
+        raise RuntimeError("Rate limited")
+
+    router = PolicyRouter(POLICIES, embed=embed)
+
+    assert router.route("Hvordan melder jeg en skade?") is None
@@ -2,6 +2,7 @@ from pathlib import Path
 from unittest.mock import MagicMock, mock_open, patch
 
 import pytest
+from app.models.ingestion import IngestionJob
 from app.services.policy_service import PolicyService
 from fastapi import HTTPException, UploadFile
 
@@ -24,11 +25,57 @@ async def test_upload_policy_success(policy_service):
             mock_file, "TestInsurance", "TestPolicy"
         )
 
-        assert result == "Successfully uploaded TestInsurance/TestPolicy.pdf"
+        assert result == {
+            "message": "Successfully uploaded TestInsurance/TestPolicy.pdf",
+            "job_id": None,
+        }
         mock_file_open.assert_called_once()
         mock_copyfileobj.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_upload_policy_submits_ingestion_job(policy_service):
+    mock_file = MagicMock(spec=UploadFile)
+    mock_file.filename = "test.pdf"
+    mock_file.file = MagicMock()
+
+    with patch("pathlib.Path.exists", return_value=True), patch("os.makedirs"), patch(
+        "builtins.open", mock_open()
+    ), patch("shutil.copyfileobj"), patch(
+        "app.services.policy_service.settings.ENVIRONMENT", "dev"
+    ), patch(
+        "app.services.policy_service.ingestion_queue"
+    ) as mock_queue:
+        mock_queue.submit.return_value = IngestionJob(
+            id="job1", insurance_name="TestInsurance", policy_name="TestPolicy"
+        )
+        result = await policy_service.upload_policy(
+            mock_file, "TestInsurance", "TestPolicy"
+        )
+
+        assert result["job_id"] == "job1"
+        mock_queue.submit.assert_called_once_with("TestInsurance", "TestPolicy")
+
+
+@pytest.mark.asyncio
+async def test_get_ingestion_job(policy_service):
+    job = IngestionJob(id="job1", insurance_name="TestInsurance", policy_name="Bil")
+    with patch("app.services.policy_service.ingestion_queue") as mock_queue:
+        mock_queue.get.return_value = job
+        assert await policy_service.get_ingestion_job("job1") == job
+
+
+@pytest.mark.asyncio
+async def test_get_ingestion_job_not_found(policy_service):
+    with patch("app.services.policy_service.ingestion_queue") as mock_queue:
+        mock_queue.get.return_value = None
+        with pytest.raises(HTTPException) as exc_info:
+            await policy_service.get_ingestion_job("unknown")
+
+    assert exc_info.value.status_code == 404
+    assert "Ingestion job not found" in str(exc_info.value.detail)
+
+
 @pytest.mark.asyncio
 async def test_upload_policy_not_pdf(policy_service):
     mock_file = MagicMock(spec=UploadFile)
@@ -67,6 +114,21 @@ async def test_delete_policy_success(policy_service):
         mock_remove.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_delete_policy_unregisters_policy(policy_service):
+    with patch("pathlib.Path.exists", return_value=True), patch("os.remove"), patch(
+        "shutil.rmtree"
+    ), patch("app.services.policy_service.settings.ENVIRONMENT", "dev"), patch(
+        "app.services.policy_service.unregister_policy"
+    ) as mock_unregister, patch(
+        "app.services.policy_service.ingestion_queue"
+    ) as mock_queue:
+        await policy_service.delete_policy("TestInsurance", "TestPolicy")
+
+        mock_queue.cancel.assert_called_once_with("TestInsurance", "TestPolicy")
+        mock_unregister.assert_called_once_with("TestInsurance", "TestPolicy")
+
+
 @pytest.mark.asyncio
 async def test_delete_policy_not_found(policy_service):
     with patch("pathlib.Path.exists", return_value=False):
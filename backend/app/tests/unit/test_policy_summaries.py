@@ -0,0 +1,97 @@
+from app.policy_summaries import (
+    PolicySummary,
+    PolicySummaryQueryEngine,
+    SectionSummarizer,
+    SectionSummary,
+    read_summaries,
+    write_summaries,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import TextNode
+from llama_index.core.utils import get_tokenizer
+
+
+class RecordingLLM(MockLLM):
+    _prompts: list = PrivateAttr(default_factory=list)
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        self._prompts.append(prompt)
+        return super().complete(f"Resumé {len(self._prompts)}", formatted, **kwargs)
+
+
+def nodes(pages):
+    return [
+        TextNode(
+            text=f"Side {page} " + "dækning " * 20, metadata={"page_label": str(page)}
+        )
+        for page in pages
+    ]
+
+
+def test_sections_are_summarized_then_combined():
+    llm = RecordingLLM()
+    summarizer = SectionSummarizer("IF Bil", llm, section_tokens=150)
+
+    summarizer.add(nodes([1, 2, 3]))
+    summarizer.add(nodes([4]))
+    summary = summarizer.finish()
+
+    assert [section.pages for section in summary.sections] == ["1-2", "3-4"]
+    assert len(llm._prompts) == 3
+    assert "Resumé 1" in llm._prompts[2] and "Resumé 2" in llm._prompts[2]
+    assert summary.summary == "Resumé 3"
+
+
+def test_single_section_is_the_policy_summary():
+    llm = RecordingLLM()
+    summarizer = SectionSummarizer("IF Bil", llm)
+    summarizer.add(nodes([1]))
+    summary = summarizer.finish()
+
+    assert len(llm._prompts) == 1
+    assert summary.summary == summary.sections[0].summary
+
+
+def test_summaries_are_only_read_for_the_same_policy_content(tmp_path):
+    summary = PolicySummary("Resumé", [SectionSummary("1-2", "Glasskade dækkes")])
+    write_summaries(tmp_path, "abc", "openai:gpt-4o-mini", summary)
+
+    assert read_summaries(tmp_path, "abc", "openai:gpt-4o-mini") == summary
+    assert read_summaries(tmp_path, "def", "openai:gpt-4o-mini") is None
+    assert read_summaries(tmp_path / "missing", "abc", "openai:gpt-4o-mini") is None
+
+
+def test_summary_query_engine_answers_without_llm():
+    summary = PolicySummary(
+        "Resumé",
+        [
+            SectionSummary("1-2", "Glasskade dækkes"),
+            SectionSummary("3", "Stormskader dækkes ikke"),
+        ],
+    )
+    engine = PolicySummaryQueryEngine.from_summary(summary)
+
+    overview = str(engine.query("Giv et overblik"))
+    assert overview.startswith("Resumé")
+    assert "Side" not in overview
+
+    glass = str(engine.query("Dækker policen glasskade?"))
+    assert "Side 1-2" in glass
+    assert "Side 3" not in glass
+
+
+def test_summary_query_engine_answer_is_bounded():
+    summary = PolicySummary(
+        "Resumé " + "dækning " * 500,
+        [SectionSummary(str(page), "glasskade " * 50) for page in range(20)],
+    )
+    tokenizer = get_tokenizer()
+
+    for max_tokens in [50, 300, 2000]:
+        engine = PolicySummaryQueryEngine.from_summary(summary, max_tokens=max_tokens)
+        answer = str(engine.query("Hvad med glasskade?"))
+        assert answer.startswith("Resumé")
+        assert len(tokenizer(answer)) <= max_tokens
+    # Only some of the relevant sections fit in the budget
+    assert 0 < answer.count("### Side") < 20
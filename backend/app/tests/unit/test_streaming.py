@@ -0,0 +1,42 @@
+import json
+
+import pytest
+from app.core.streaming import sse_stream
+
+
+async def collect(tokens):
+    return [event async for event in sse_stream(tokens)]
+
+
+def parse(event):
+    lines = event.strip().split("\n")
+    name = lines[0][len("event: ") :] if lines[0].startswith("event: ") else None
+    return name, json.loads(lines[-1][len("data: ") :])
+
+
+@pytest.mark.asyncio
+async def test_sse_stream_sends_tokens_then_done():
+    async def tokens():
+        yield "Glas"
+        yield "skade"
+
+    events = [parse(event) for event in await collect(tokens())]
+
+    assert events == [
+        (None, {"token": "Glas"}),
+        (None, {"token": "skade"}),
+        ("done", {"answer": "Glasskade"}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sse_stream_reports_errors():
+    async def tokens():
+        yield "Glas"
+        raise RuntimeError("Connection reset")
+
+    events = [parse(event) for event in await collect(tokens())]
+
+    assert events[0] == (None, {"token": "Glas"})
+    assert events[1][0] == "error"
+    assert "Connection reset" in events[1][1]["detail"]
@@ -0,0 +1,94 @@
+import os
+from unittest.mock import patch
+
+import pytest
+from app import text_cache
+
+
+@pytest.fixture
+def policy_file(tmp_path):
+    policy_file = tmp_path / "Bil.pdf"
+    policy_file.write_bytes(b"%PDF-1.7 policy")
+    with patch.object(
+        text_cache.settings, "TEXT_CACHE_DIR", str(tmp_path / "cache")
+    ), patch.dict(text_cache._memory, clear=True):
+        yield policy_file
+
+
+@pytest.fixture
+def mock_extract():
+    with patch("app.text_cache.extract_pages") as mock:
+        mock.return_value = ["Side 1. ", "Side 2."]
+        yield mock
+
+
+def test_get_pages_extracts_once(policy_file, mock_extract):
+    assert text_cache.get_pages(policy_file) == ["Side 1. ", "Side 2."]
+    assert text_cache.get_text(policy_file) == "Side 1. Side 2."
+    mock_extract.assert_called_once()
+
+
+def test_get_pages_persists_across_processes(policy_file, mock_extract):
+    text_cache.get_pages(policy_file)
+    text_cache._memory.clear()
+
+    assert text_cache.get_pages(policy_file) == ["Side 1. ", "Side 2."]
+    mock_extract.assert_called_once()
+
+
+def test_touched_file_with_same_content_is_reused(policy_file, mock_extract):
+    text_cache.get_pages(policy_file)
+    stat = os.stat(policy_file)
+    os.utime(policy_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    text_cache.get_pages(policy_file)
+    mock_extract.assert_called_once()
+
+
+def test_changed_file_is_extracted_again(policy_file, mock_extract):
+    text_cache.get_pages(policy_file)
+    policy_file.write_bytes(b"%PDF-1.7 new policy version")
+    mock_extract.return_value = ["Ny side."]
+
+    assert text_cache.get_pages(policy_file) == ["Ny side."]
+    assert mock_extract.call_count == 2
+
+
+def test_content_hash_does_not_extract(policy_file, mock_extract):
+    assert text_cache.content_hash(policy_file) == text_cache.file_sha256(policy_file)
+    mock_extract.assert_not_called()
+
+
+def test_invalidate(policy_file, mock_extract):
+    text_cache.get_pages(policy_file)
+    text_cache.invalidate(policy_file)
+
+    text_cache.get_pages(policy_file)
+    assert mock_extract.call_count == 2
+
+
+def test_iter_pages_streams_and_persists(policy_file, mock_extract):
+    with patch("app.text_cache.stream_pages") as mock_stream, patch(
+        "app.text_cache.count_pages", return_value=2
+    ):
+        mock_stream.return_value = iter(["Side 1. ", "Side 2."])
+        assert list(text_cache.iter_pages(policy_file)) == ["Side 1. ", "Side 2."]
+        text_cache._memory.clear()
+
+        assert list(text_cache.iter_pages(policy_file)) == ["Side 1. ", "Side 2."]
+        assert text_cache.get_pages(policy_file) == ["Side 1. ", "Side 2."]
+        mock_stream.assert_called_once()
+    mock_extract.assert_not_called()
+
+
+def test_iter_pages_abandoned_is_not_persisted(policy_file, mock_extract):
+    with patch("app.text_cache.stream_pages") as mock_stream, patch(
+        "app.text_cache.count_pages", return_value=2
+    ):
+        mock_stream.return_value = iter(["Side 1. ", "Side 2."])
+        pages = text_cache.iter_pages(policy_file)
+        next(pages)
+        pages.close()
+
+    assert text_cache.get_pages(policy_file) == ["Side 1. ", "Side 2."]
+    mock_extract.assert_called_once()
@@ -0,0 +1,97 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from app import compare_query
+from app.llm_backends import FakeAsyncOpenAIClient, FakeLLM, HashingEmbedding
+from app.usage import (
+    UsageCallbackHandler,
+    record_call,
+    track_usage,
+    usage_counters,
+)
+from llama_index.agent.openai import OpenAIAgent
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.schema import TextNode
+from llama_index.core.tools import QueryEngineTool, ToolMetadata
+
+
+def test_calls_are_aggregated_per_request_and_counted():
+    before = usage_counters.snapshot()["calls"].get("llm/compare", {"calls": 0})
+
+    with track_usage() as usage:
+        record_call("llm", "compare", 100, 20, 0.5)
+        record_call("llm", "compare", 50, 10, 0.25)
+    record_call("llm", "compare", 1, 1, 0.1)
+
+    totals = json.loads(usage.header())
+    assert totals["llm"] == {
+        "calls": 2,
+        "prompt_tokens": 150,
+        "completion_tokens": 30,
+        "seconds": 0.75,
+    }
+    after = usage_counters.snapshot()["calls"]["llm/compare"]
+    assert after["calls"] == before["calls"] + 3
+
+
+@pytest.fixture
+def callback_manager():
+    previous = Settings._callback_manager
+    Settings.callback_manager = CallbackManager([UsageCallbackHandler()])
+    yield Settings.callback_manager
+    Settings._callback_manager = previous
+
+
+def test_agent_calls_are_attributed_to_the_tool_they_run_in(callback_manager):
+    llm = FakeLLM(callback_manager=callback_manager)
+    embed_model = HashingEmbedding(embed_dim=32, callback_manager=callback_manager)
+    index = VectorStoreIndex(
+        [TextNode(text="Glasskade dækkes uden selvrisiko")], embed_model=embed_model
+    )
+    tool = QueryEngineTool(
+        query_engine=index.as_query_engine(llm=llm),
+        metadata=ToolMetadata(name="vector_tool_IF_Bil", description="IF Bil"),
+    )
+    agent = OpenAIAgent.from_tools([tool], llm=llm)
+
+    with track_usage() as usage:
+        agent.chat("Dækker IF glasskade?")
+    totals = usage.totals()
+
+    assert totals["llm/top_agent"]["calls"] == 2
+    assert totals["llm/top_agent"]["prompt_tokens"] > 0
+    assert totals["llm/vector_tool_IF_Bil"]["calls"] == 1
+    assert totals["embedding/vector_tool_IF_Bil"]["calls"] == 1
+    assert totals["retrieve/vector_tool_IF_Bil"]["calls"] == 1
+    assert totals["tool/vector_tool_IF_Bil"]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_comparison_completions_are_recorded(monkeypatch):
+    monkeypatch.setattr(compare_query, "async_client", FakeAsyncOpenAIClient())
+    monkeypatch.setattr(compare_query, "comparison_cache", MagicMock())
+    monkeypatch.setattr(
+        compare_query,
+        "_aprepare_comparison",
+        _prepared_comparison,
+    )
+
+    with track_usage() as usage:
+        await compare_query.acompare_policies_query("IF/Bil.pdf", "Tryg/Bil.pdf", "q")
+        [
+            token
+            async for token in compare_query.astream_compare_policies_query(
+                "IF/Bil.pdf", "Tryg/Bil.pdf", "q"
+            )
+        ]
+
+    totals = usage.totals()["llm/compare"]
+    assert totals["calls"] == 2
+    assert totals["prompt_tokens"] == 2 * 3
+    assert totals["completion_tokens"] == 2 * 4
+
+
+async def _prepared_comparison(*args):
+    return None, None, [{"role": "user", "content": "Sammenlign IF Tryg"}]
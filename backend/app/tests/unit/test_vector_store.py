@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from app.vector_store import VECTORS_FILE, MmapVectorStore
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+
+def make_node(node_id, embedding, doc_id="doc"):
+    return TextNode(
+        id_=node_id,
+        text=node_id,
+        embedding=embedding,
+        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)},
+    )
+
+
+@pytest.fixture
+def store():
+    store = MmapVectorStore()
+    store.add(
+        [
+            make_node("glas", [1.0, 0.0, 0.0]),
+            make_node("kasko", [0.0, 2.0, 0.0]),
+            make_node("ansvar", [1.0, 1.0, 0.0], doc_id="other"),
+        ]
+    )
+    return store
+
+
+def test_query_returns_top_k_by_cosine_similarity(store):
+    result = store.query(
+        VectorStoreQuery(query_embedding=[0.0, 3.0, 0.0], similarity_top_k=2)
+    )
+
+    assert result.ids == ["kasko", "ansvar"]
+    assert result.similarities == pytest.approx([1.0, 2**-0.5])
+
+
+def test_query_restricted_to_node_ids(store):
+    result = store.query(
+        VectorStoreQuery(
+            query_embedding=[0.0, 1.0, 0.0], similarity_top_k=5, node_ids=["glas"]
+        )
+    )
+
+    assert result.ids == ["glas"]
+
+
+def test_delete_by_document(store):
+    store.delete("doc")
+
+    result = store.query(
+        VectorStoreQuery(query_embedding=[1.0, 0.0, 0.0], similarity_top_k=5)
+    )
+    assert result.ids == ["ansvar"]
+
+
+def test_persisted_store_is_memory_mapped(store, tmp_path):
+    store.persist(str(tmp_path / "default__vector_store.json"))
+
+    loaded = MmapVectorStore.from_persist_dir(tmp_path)
+    result = loaded.query(
+        VectorStoreQuery(query_embedding=[1.0, 0.1, 0.0], similarity_top_k=1)
+    )
+
+    assert result.ids == ["glas"]
+    assert isinstance(np.load(tmp_path / VECTORS_FILE, mmap_mode="r"), np.memmap)
+    assert isinstance(loaded._vectors, np.memmap)
+
+    loaded.add([make_node("brand", [0.0, 0.0, 1.0])])
+    result = loaded.query(
+        VectorStoreQuery(query_embedding=[0.0, 0.0, 1.0], similarity_top_k=1)
+    )
+    assert result.ids == ["brand"]
+
+
+def test_concurrent_queries_see_consistent_snapshots(store):
+    query = VectorStoreQuery(query_embedding=[0.0, 0.0, 1.0], similarity_top_k=100)
+
+    def add(i):
+        store.add([make_node(f"brand{i}", [0.0, 0.0, 1.0])])
+        return store.query(query)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(add, range(200)))
+
+    for result in results:
+        assert len(result.ids) == len(result.similarities)
+    assert len(store.query(query).ids) == 100
+    assert len(store._snapshot()[1]) == 203
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Union
+
+from app.core.config import settings
+from app.pdf_extraction import count_pages, extract_pages
+from app.pdf_extraction import iter_pages as stream_pages
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout or the extraction itself changes
+CACHE_VERSION = 1
+
+PathLike = Union[str, Path]
+
+
+class CachedText(NamedTuple):
+    mtime_ns: int
+    size: int
+    sha256: str
+    pages: Optional[List[str]]
+
+
+_memory: "OrderedDict[str, CachedText]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def file_sha256(file_path: PathLike) -> str:
+    """
+    Compute the SHA-256 digest of a file without loading it into memory at once.
+
+    Args:
+        file_path (PathLike): The file to hash.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _key(file_path: PathLike) -> str:
+    return os.path.abspath(file_path)
+
+
+def _cache_file(key: str) -> Path:
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return Path(settings.TEXT_CACHE_DIR) / f"{name}.jsonl"
+
+
+def _remember(key: str, entry: CachedText) -> None:
+    with _lock:
+        _memory[key] = entry
+        _memory.move_to_end(key)
+        while len(_memory) > settings.TEXT_CACHE_MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def _read(key: str, with_pages: bool) -> Optional[CachedText]:
+    # Layout: one JSON header line followed by one JSON string per page.
+    try:
+        with open(_cache_file(key), "r", encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != CACHE_VERSION or header.get("path") != key:
+                return None
+            pages = [json.loads(line) for line in file] if with_pages else None
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable text cache entry for {key}: {str(e)}")
+        return None
+    if pages is not None and len(pages) != header["pages"]:
+        return None
+    return CachedText(header["mtime_ns"], header["size"], header["sha256"], pages)
+
+
+def _header(key: str, entry: CachedText, page_count: int) -> dict:
+    return {
+        "version": CACHE_VERSION,
+        "path": key,
+        "mtime_ns": entry.mtime_ns,
+        "size": entry.size,
+        "sha256": entry.sha256,
+        "pages": page_count,
+    }
+
+
+def _write(key: str, entry: CachedText) -> None:
+    cache_file = _cache_file(key)
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    header = _header(key, entry, len(entry.pages))
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            file.write(json.dumps(header) + "\n")
+            for page in entry.pages:
+                file.write(json.dumps(page) + "\n")
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.warning(f"Could not persist text cache entry for {key}: {str(e)}")
+
+
+def _lookup(file_path: PathLike, with_pages: bool) -> CachedText:
+    key = _key(file_path)
+    stat = os.stat(key)
+    current = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        entry = _memory.get(key)
+    if entry is not None and (entry.mtime_ns, entry.size) == current:
+        if entry.pages is not None or not with_pages:
+            _remember(key, entry)
+            return entry
+        sha256 = entry.sha256
+    else:
+        sha256 = None
+
+    entry = _read(key, with_pages)
+    if entry is not None and (entry.mtime_ns, entry.size) != current:
+        # The file was touched or replaced. Keep the extracted text if the content
+        # is unchanged, e.g. after a re-upload of the same PDF.
+        sha256 = sha256 or file_sha256(key)
+        if entry.sha256 == sha256 and entry.pages is None:
+            entry = _read(key, with_pages=True)
+        if entry is not None and entry.sha256 == sha256:
+            entry = entry._replace(mtime_ns=current[0], size=current[1])
+            _write(key, entry)
+        else:
+            entry = None
+
+    if entry is None:
+        sha256 = sha256 or file_sha256(key)
+        # Hashing is far cheaper than extraction, so only extract once the text is
+        # actually needed.
+        pages = extract_pages(key) if with_pages else None
+        entry = CachedText(current[0], current[1], sha256, pages)
+        if pages is not None:
+            _write(key, entry)
+
+    _remember(key, entry)
+    return entry
+
+
+def get_pages(file_path: PathLike) -> List[str]:
+    """
+    Return the text of every page of a PDF file, extracting it only if needed.
+
+    Extracted text is persisted in settings.TEXT_CACHE_DIR keyed by the absolute file
+    path and validated against the file's mtime and size, falling back to its content
+    hash. Recently used entries are also kept in memory.
+
+    Args:
+        file_path (PathLike): The path to the PDF file.
+
+    Returns:
+        List[str]: The text of each page, in page order.
+    """
+    return _lookup(file_path, with_pages=True).pages
+
+
+def iter_pages(file_path: PathLike) -> Iterator[str]:
+    """
+    Yield the text of every page of a PDF file without holding the whole document.
+
+    Cached pages are streamed line by line from disk. Otherwise the pages are streamed
+    from the extractor and written to the cache as they go; the entry is only committed
+    once the last page has been consumed.
+
+    Args:
+        file_path (PathLike): The path to the PDF file.
+
+    Yields:
+        str: The text of the next page.
+    """
+    key = _key(file_path)
+    entry = _lookup(key, with_pages=False)
+
+    with _lock:
+        cached = _memory.get(key)
+    if cached is not None and cached.pages is not None:
+        yield from cached.pages
+        return
+
+    try:
+        file = open(_cache_file(key), "r", encoding="utf-8")
+    except FileNotFoundError:
+        file = None
+    if file is not None:
+        with file:
+            header = json.loads(file.readline())
+            if (
+                header.get("version") == CACHE_VERSION
+                and header.get("sha256") == entry.sha256
+            ):
+                for line in file:
+                    yield json.loads(line)
+                return
+
+    cache_file = _cache_file(key)
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    header = _header(key, entry, count_pages(key))
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    completed = False
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            file.write(json.dumps(header) + "\n")
+            for page in stream_pages(key):
+                file.write(json.dumps(page) + "\n")
+                yield page
+        os.replace(tmp_file, cache_file)
+        completed = True
+    finally:
+        if not completed:
+            try:
+                os.remove(tmp_file)
+            except FileNotFoundError:
+                pass
+
+
+def get_text(file_path: PathLike) -> str:
+    """Return the full text of a PDF file, see get_pages."""
+    return "".join(get_pages(file_path))
+
+
+def content_hash(file_path: PathLike) -> str:
+    """
+    Return the SHA-256 digest of a file, reusing the cached digest when the file's
+    mtime and size are unchanged.
+
+    Args:
+        file_path (PathLike): The path to the file.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    return _lookup(file_path, with_pages=False).sha256
+
+
+def invalidate(file_path: PathLike) -> None:
+    """Drop the cached text of a file from memory and disk."""
+    key = _key(file_path)
+    with _lock:
+        _memory.pop(key, None)
+    try:
+        os.remove(_cache_file(key))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,260 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from llama_index.core.callbacks import CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+T = TypeVar("T")
+
+# Response header carrying the usage of a request when settings.USAGE_HEADER_ENABLED
+USAGE_HEADER = "X-Usage"
+
+# Callback events recorded, by the kind they are recorded as
+_EVENT_KINDS = {
+    CBEventType.LLM: "llm",
+    CBEventType.EMBEDDING: "embedding",
+    CBEventType.RETRIEVE: "retrieve",
+    CBEventType.SYNTHESIZE: "synthesize",
+    CBEventType.FUNCTION_CALL: "tool",
+}
+
+
+class CallRecord(NamedTuple):
+    kind: str
+    tool: str
+    prompt_tokens: int
+    completion_tokens: int
+    seconds: float
+
+
+def _empty() -> Dict[str, float]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+
+
+def _add(totals: Dict[str, float], call: CallRecord) -> None:
+    totals["calls"] += 1
+    totals["prompt_tokens"] += call.prompt_tokens
+    totals["completion_tokens"] += call.completion_tokens
+    totals["seconds"] += call.seconds
+
+
+def _rounded(totals: Dict[str, float]) -> Dict[str, float]:
+    return {**totals, "seconds": round(totals["seconds"], 3)}
+
+
+class RequestUsage:
+    """The LLM, embedding, retrieval and tool calls made while answering one request."""
+
+    def __init__(self):
+        self.calls: List[CallRecord] = []
+        self._lock = threading.Lock()
+
+    def record(self, call: CallRecord) -> None:
+        with self._lock:
+            self.calls.append(call)
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        """Sum the calls by kind, and by kind and tool as "kind/tool"."""
+        totals: Dict[str, Dict[str, float]] = defaultdict(_empty)
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            _add(totals[call.kind], call)
+            _add(totals[f"{call.kind}/{call.tool}"], call)
+        return {key: _rounded(value) for key, value in sorted(totals.items())}
+
+    def header(self) -> str:
+        return json.dumps(self.totals(), separators=(",", ":"))
+
+
+class UsageCounters:
+    """Totals of every call recorded since the process started, by kind and tool."""
+
+    def __init__(self):
+        self._totals: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(_empty)
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def record(self, call: CallRecord) -> None:
+        with self._lock:
+            _add(self._totals[(call.kind, call.tool)], call)
+
+    def count_request(self) -> None:
+        with self._lock:
+            self._requests += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {
+                f"{kind}/{tool}": _rounded(value)
+                for (kind, tool), value in sorted(self._totals.items())
+            }
+            return {"requests": self._requests, "calls": totals}
+
+
+usage_counters = UsageCounters()
+_current_usage: ContextVar[Optional[RequestUsage]] = ContextVar(
+    "current_usage", default=None
+)
+
+
+@contextmanager
+def track_usage() -> Iterator[RequestUsage]:
+    """
+    Collect the calls made in this context, including tasks and threads started in it.
+
+    Yields:
+        RequestUsage: The calls recorded so far.
+    """
+    usage = RequestUsage()
+    token = _current_usage.set(usage)
+    usage_counters.count_request()
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+async def collect_usage(fn: Callable[[], Awaitable[T]]) -> Tuple[T, List[CallRecord]]:
+    """
+    Run a computation shared by several requests, collecting its calls apart.
+
+    The calls are recorded in usage_counters once, but in no request's usage; every
+    request the result is shared with adds them to its own usage with add_usage.
+
+    Args:
+        fn (Callable[[], Awaitable[T]]): Starts the computation.
+
+    Returns:
+        Tuple[T, List[CallRecord]]: The result and the calls made to compute it.
+    """
+    usage = RequestUsage()
+    token = _current_usage.set(usage)
+    try:
+        result = await fn()
+    finally:
+        _current_usage.reset(token)
+    return result, list(usage.calls)
+
+
+def add_usage(calls: List[CallRecord]) -> None:
+    """Add calls made on behalf of the current request to its usage, if any."""
+    usage = _current_usage.get()
+    if usage is not None:
+        for call in calls:
+            usage.record(call)
+
+
+def record_call(
+    kind: str,
+    tool: str,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    seconds: float = 0.0,
+) -> None:
+    """
+    Record a call in the usage of the current request, if any, and in usage_counters.
+
+    Args:
+        kind (str): "llm", "embedding", "retrieve", "synthesize" or "tool".
+        tool (str): The tool the call was made for, or the caller outside any tool.
+        prompt_tokens (int): The tokens sent.
+        completion_tokens (int): The tokens generated.
+        seconds (float): The wall time of the call.
+    """
+    call = CallRecord(kind, tool, prompt_tokens, completion_tokens, seconds)
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.record(call)
+    usage_counters.record(call)
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    Records LlamaIndex LLM, embedding, retrieval, synthesis and tool calls.
+
+    Every call is attributed to the innermost tool it was made in, e.g. the policy
+    agent tool the top agent called, or to "top_agent" outside any tool.
+    """
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self._token_counter = TokenCounter()
+        # Start time and tool of every open event
+        self._events: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def _tool(self, parent_id: str) -> str:
+        return self._events.get(parent_id, (0.0, "top_agent"))[1]
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        with self._lock:
+            tool = self._tool(parent_id)
+            if event_type == CBEventType.FUNCTION_CALL and payload:
+                tool = payload[EventPayload.TOOL].name
+            self._events[event_id] = (time.perf_counter(), tool)
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            start, tool = self._events.pop(event_id, (None, "top_agent"))
+        if start is None or event_type not in _EVENT_KINDS:
+            return
+        seconds = time.perf_counter() - start
+        prompt_tokens = completion_tokens = 0
+        if event_type == CBEventType.LLM and payload:
+            counts = get_llm_token_counts(self._token_counter, payload)
+            prompt_tokens = counts.prompt_token_count
+            completion_tokens = counts.completion_token_count
+        elif event_type == CBEventType.EMBEDDING and payload:
+            prompt_tokens = sum(
+                self._token_counter.get_string_tokens(chunk)
+                for chunk in payload.get(EventPayload.CHUNKS, [])
+            )
+        record_call(
+            _EVENT_KINDS[event_type], tool, prompt_tokens, completion_tokens, seconds
+        )
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        pass
+
+
+usage_handler = UsageCallbackHandler()
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, List, Optional, Tuple, Union
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+# Files written next to the docstore of a storage context
+VECTORS_FILE = "vectors.npy"
+VECTOR_IDS_FILE = "vector_ids.json"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store keeping all embeddings in one float32 matrix.
+
+    The matrix is persisted as a .npy file and memory-mapped when loaded, so loading
+    an index reads nothing until it is queried and processes loading the same index
+    share its pages through the OS cache. Rows are normalized when added, which makes
+    the cosine similarity of a query against every node a single matrix-vector product.
+    Node and document ids are kept in a separate JSON table in row order.
+
+    Agents query the store from several threads at once. Changes happen under a lock
+    and replace the matrix and id lists rather than changing them in place, so a query
+    works on a consistent snapshot of both without holding the lock.
+    """
+
+    stores_text: bool = False
+
+    _vectors: np.ndarray = PrivateAttr()
+    _pending: List[np.ndarray] = PrivateAttr()
+    _node_ids: List[str] = PrivateAttr()
+    _ref_doc_ids: List[Optional[str]] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+
+    def __init__(
+        self,
+        vectors: Optional[np.ndarray] = None,
+        node_ids: Optional[List[str]] = None,
+        ref_doc_ids: Optional[List[Optional[str]]] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self._vectors = (
+            vectors if vectors is not None else np.empty((0, 0), dtype=np.float32)
+        )
+        self._pending = []
+        self._node_ids = list(node_ids or [])
+        self._ref_doc_ids = list(ref_doc_ids or [None] * len(self._node_ids))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: Union[str, Path]) -> "MmapVectorStore":
+        """
+        Memory-map a vector store persisted in persist_dir.
+
+        Args:
+            persist_dir (Union[str, Path]): The directory of the storage context.
+
+        Returns:
+            MmapVectorStore: The loaded vector store.
+        """
+        persist_dir = Path(persist_dir)
+        vectors = np.load(persist_dir / VECTORS_FILE, mmap_mode="r")
+        with open(persist_dir / VECTOR_IDS_FILE, "r", encoding="utf-8") as file:
+            ids = json.load(file)
+        if len(ids["node_ids"]) != len(vectors):
+            raise ValueError(f"Vector ids do not match vectors in {persist_dir}")
+        return cls(vectors, ids["node_ids"], ids["ref_doc_ids"])
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def _matrix(self) -> np.ndarray:
+        # Called with the lock held
+        if self._pending:
+            blocks = [self._vectors] if len(self._vectors) else []
+            self._vectors = np.vstack(blocks + self._pending)
+            self._pending = []
+        return self._vectors
+
+    def _snapshot(self) -> Tuple[np.ndarray, List[str], List[Optional[str]]]:
+        with self._lock:
+            return self._matrix(), self._node_ids, self._ref_doc_ids
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        vectors = _normalize(vectors)
+        with self._lock:
+            self._pending.append(vectors)
+            self._node_ids = self._node_ids + [node.node_id for node in nodes]
+            self._ref_doc_ids = self._ref_doc_ids + [node.ref_doc_id for node in nodes]
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            keep = [doc_id != ref_doc_id for doc_id in self._ref_doc_ids]
+            if all(keep):
+                return
+            matrix = self._matrix()
+            self._vectors = np.ascontiguousarray(matrix[np.asarray(keep)])
+            self._node_ids = [id for id, kept in zip(self._node_ids, keep) if kept]
+            self._ref_doc_ids = [
+                id for id, kept in zip(self._ref_doc_ids, keep) if kept
+            ]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Query mode {query.mode} is not supported")
+        if query.filters is not None:
+            raise ValueError("Metadata filters are not supported")
+        if query.query_embedding is None:
+            raise ValueError("A query embedding is required")
+
+        matrix, node_ids, _ = self._snapshot()
+        rows = np.arange(len(node_ids))
+        if query.node_ids is not None:
+            allowed = set(query.node_ids)
+            rows = np.asarray(
+                [row for row, id in enumerate(node_ids) if id in allowed],
+                dtype=np.intp,
+            )
+        if len(rows) == 0:
+            return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+
+        embedding = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        scores = (matrix if len(rows) == len(matrix) else matrix[rows]) @ embedding
+        top_k = min(query.similarity_top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return VectorStoreQueryResult(
+            nodes=None,
+            similarities=scores[best].tolist(),
+            ids=[node_ids[rows[i]] for i in best],
+        )
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """
+        Write the matrix and the id table next to persist_path.
+
+        Args:
+            persist_path (str): The path the storage context would persist a JSON
+                                vector store to; only its directory is used.
+            fs (Optional[Any]): Unused, only local directories are supported.
+        """
+        persist_dir = Path(persist_path).parent
+        persist_dir.mkdir(parents=True, exist_ok=True)
+        matrix, node_ids, ref_doc_ids = self._snapshot()
+
+        tmp_file = persist_dir / f"{VECTORS_FILE}.tmp"
+        with open(tmp_file, "wb") as file:
+            np.save(file, np.ascontiguousarray(matrix, dtype=np.float32))
+        os.replace(tmp_file, persist_dir / VECTORS_FILE)
+
+        tmp_file = persist_dir / f"{VECTOR_IDS_FILE}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump({"node_ids": node_ids, "ref_doc_ids": ref_doc_ids}, file)
+        os.replace(tmp_file, persist_dir / VECTOR_IDS_FILE)
@@ -0,0 +1,89 @@
+"""
+Measure how concurrent chatbot questions overlap against a fake LLM.
+
+Run from the backend directory:
+
+    python -m benchmarks.chatbot_concurrency --requests 20 --latency 0.5
+
+The top agent is replaced by a fake whose every call takes --latency seconds, so no
+OpenAI key or network is needed. The blocking path calls the synchronous agent from a
+coroutine, as ChatbotService.ask used to; the async path goes through ChatbotService.ask.
+A heartbeat coroutine ticking every 10 ms stands in for other requests, such as logins,
+and reports the longest time the event loop was stalled.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.answer_cache import SemanticAnswerCache
+from app.information_query import process_query
+from app.models.chatbot import QuestionRequest
+from app.policy_registry import LiveRegistry, PolicyRegistry
+from app.services import chatbot_service
+from llama_index.core.base.response.schema import Response
+
+
+class FakeAgent:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def query(self, question):
+        time.sleep(self.latency)
+        return Response(response=f"Svar på {question}")
+
+    async def aquery(self, question):
+        await asyncio.sleep(self.latency)
+        return Response(response=f"Svar på {question}")
+
+
+async def heartbeat(stop: asyncio.Event) -> float:
+    longest = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        longest = max(longest, time.perf_counter() - start - 0.01)
+    return longest
+
+
+async def run(name, ask, requests):
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(ask(f"Spørgsmål {i}") for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    stall = await monitor
+    print(f"{name:>9} {requests:>9} {elapsed:>8.2f} {stall * 1000:>13.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    agent = FakeAgent(args.latency)
+    registry = PolicyRegistry(
+        lambda policy_file: None, max_resident=1, top_agent_factory=lambda r: agent
+    )
+    chatbot_service.live_registry = LiveRegistry(registry)
+    chatbot_service.answer_cache = SemanticAnswerCache(
+        lambda question: [], max_entries=0, ttl_seconds=0, threshold=1
+    )
+    service = chatbot_service.ChatbotService()
+
+    async def ask_blocking(question):
+        return process_query(question, registry)
+
+    async def ask_async(question):
+        return await service.ask(QuestionRequest(question=question))
+
+    print(f"fake LLM latency {args.latency:.2f}s")
+    print(f"{'path':>9} {'requests':>9} {'seconds':>8} {'max stall ms':>13}")
+    await run("blocking", ask_blocking, args.requests)
+    await run("async", ask_async, args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
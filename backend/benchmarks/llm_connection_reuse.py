@@ -0,0 +1,180 @@
+"""
+Measure how many connections concurrent LLM requests open with and without a shared pool.
+
+Run from the backend directory:
+
+    python -m benchmarks.llm_connection_reuse --requests 400 --concurrency 32 --policies 50
+
+A local stand-in for the OpenAI API answers chat completions after --latency seconds
+and counts the TCP connections it accepts. Every new connection is delayed by
+--handshake-ms to stand in for the TLS handshake a real connection costs. The
+"per-agent" run gives each of --policies agents its own AsyncOpenAI client and pool,
+as every policy agent used to have; the "shared" run sends every request through the
+process-wide pool from app.llm_backends, limited and sharded by the LLM_HTTP_* settings.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+
+from openai import AsyncOpenAI
+
+COMPLETION = {
+    "id": "stand-in",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [
+        {
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "Svar"},
+        }
+    ],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class StandInServer:
+    """
+    Minimal keep-alive HTTP/1.1 server answering every request with COMPLETION.
+
+    With a capacity, requests beyond that many at once are answered with a 429, like a
+    rate limited provider, asking to be retried after retry_after seconds.
+    """
+
+    def __init__(
+        self,
+        latency: float,
+        handshake: float,
+        capacity: int = 0,
+        retry_after: float = 0.5,
+    ):
+        self.latency = latency
+        self.handshake = handshake
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.connections = 0
+        self.active = 0
+        self.throttled = 0
+        self.port = None
+        self._ready = threading.Event()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        await asyncio.sleep(self.handshake)
+        body = json.dumps(COMPLETION).encode("utf-8")
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                await reader.readexactly(length)
+                if self.capacity and self.active >= self.capacity:
+                    self.throttled += 1
+                    writer.write(
+                        b"HTTP/1.1 429 Too Many Requests\r\nContent-Length: 0\r\n"
+                        + f"retry-after-ms: {self.retry_after * 1000:.0f}\r\n\r\n".encode(
+                            "latin-1"
+                        )
+                    )
+                    await writer.drain()
+                    continue
+                self.active += 1
+                try:
+                    await asyncio.sleep(self.latency)
+                finally:
+                    self.active -= 1
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def start(self) -> str:
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._ready.wait()
+        return f"http://127.0.0.1:{self.port}/v1"
+
+
+async def run(name, server, clients, requests, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+    client_cycle = itertools.cycle(clients)
+
+    async def request(client):
+        async with limit:
+            start = time.perf_counter()
+            await client.chat.completions.create(
+                model="gpt-4o-mini", messages=[{"role": "user", "content": "Hej"}]
+            )
+            latencies.append(time.perf_counter() - start)
+
+    before = server.connections
+    start = time.perf_counter()
+    await asyncio.gather(*(request(next(client_cycle)) for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>10} {requests:>9} {server.connections - before:>12} "
+        f"{statistics.median(latencies) * 1000:>8.1f} {elapsed:>8.2f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--policies", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--handshake-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    server = StandInServer(args.latency, args.handshake_ms / 1000)
+    base_url = server.start()
+    for name in ["ENVIRONMENT", "JWT_SECRET_KEY", "JWT_ALGORITHM", "MONGO_URL"]:
+        os.environ.setdefault(name, "benchmark")
+    from app.llm_backends import close_http_clients, get_async_http_client
+
+    per_agent = [
+        AsyncOpenAI(base_url=base_url, api_key="benchmark", max_retries=0)
+        for _ in range(args.policies)
+    ]
+    shared = AsyncOpenAI(
+        base_url=base_url,
+        api_key="benchmark",
+        max_retries=0,
+        http_client=get_async_http_client(),
+    )
+
+    print(
+        f"{'clients':>10} {'requests':>9} {'connections':>12} {'p50 ms':>8} {'seconds':>8}"
+    )
+    await run("per-agent", server, per_agent, args.requests, args.concurrency)
+    await run("shared", server, [shared], args.requests, args.concurrency)
+
+    for client in per_agent:
+        await client.close()
+    await close_http_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Measure interactive latency and failures against a rate limited LLM under background load.
+
+Run from the backend directory:
+
+    python -m benchmarks.llm_scheduler --capacity 16 --background 400 --questions 60
+
+A local stand-in for the OpenAI API answers up to --capacity requests at once after
+--latency seconds and answers any request beyond that with a 429. --background
+requests, like the embedding requests of a re-index, are all started at once, while
+--questions interactive requests arrive one every --interval seconds. The
+"unscheduled" run sends everything through a plain AsyncOpenAI client, with its
+default retries; the "scheduled" run goes through the shared client of
+app.llm_backends, whose scheduler adapts its limit to the 429s and sends the
+interactive requests first.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.llm_connection_reuse import StandInServer
+from openai import AsyncOpenAI
+
+
+async def run(name, server, client, args):
+    from app.llm_scheduler import BACKGROUND, INTERACTIVE, llm_priority
+
+    latencies = {INTERACTIVE: [], BACKGROUND: []}
+    failures = {INTERACTIVE: 0, BACKGROUND: 0}
+
+    async def request(priority):
+        start = time.perf_counter()
+        with llm_priority(priority):
+            try:
+                await client.chat.completions.create(
+                    model="gpt-4o-mini", messages=[{"role": "user", "content": "Hej"}]
+                )
+            except Exception:
+                failures[priority] += 1
+                return
+        latencies[priority].append(time.perf_counter() - start)
+
+    async def questions():
+        tasks = []
+        for _ in range(args.questions):
+            tasks.append(asyncio.create_task(request(INTERACTIVE)))
+            await asyncio.sleep(args.interval)
+        await asyncio.gather(*tasks)
+
+    before = server.throttled
+    start = time.perf_counter()
+    background = [request(BACKGROUND) for _ in range(args.background)]
+    await asyncio.gather(questions(), *background)
+    elapsed = time.perf_counter() - start
+
+    def p(values, q):
+        values = sorted(values)
+        return (
+            values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0
+        )
+
+    print(
+        f"{name:>12} {p(latencies[INTERACTIVE], 0.5):>8.0f} "
+        f"{p(latencies[INTERACTIVE], 0.95):>8.0f} {failures[INTERACTIVE]:>8} "
+        f"{failures[BACKGROUND]:>8} {server.throttled - before:>6} {elapsed:>8.2f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--capacity", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--background", type=int, default=400)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = StandInServer(args.latency, 0, args.capacity, args.retry_after)
+    base_url = server.start()
+    for name in ["ENVIRONMENT", "JWT_SECRET_KEY", "JWT_ALGORITHM", "MONGO_URL"]:
+        os.environ.setdefault(name, "benchmark")
+    from app.llm_backends import close_http_clients, get_async_http_client
+    from app.llm_scheduler import llm_scheduler
+
+    unscheduled = AsyncOpenAI(base_url=base_url, api_key="benchmark")
+    scheduled = AsyncOpenAI(
+        base_url=base_url, api_key="benchmark", http_client=get_async_http_client()
+    )
+
+    print(
+        f"{'client':>12} {'q p50 ms':>8} {'q p95 ms':>8} {'q failed':>8} "
+        f"{'bg fail':>8} {'429s':>6} {'seconds':>8}"
+    )
+    await run("unscheduled", server, unscheduled, args)
+    await run("scheduled", server, scheduled, args)
+    snapshot = llm_scheduler.snapshot()
+    print(f"scheduler limit {snapshot['limit']}, waits {snapshot['waits']}")
+
+    await unscheduled.close()
+    await close_http_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
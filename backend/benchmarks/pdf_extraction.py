@@ -0,0 +1,54 @@
+"""
+Measure PDF extraction throughput (pages/sec) for an increasing number of workers.
+
+Run from the backend directory:
+
+    python -m benchmarks.pdf_extraction --repeat 4
+
+Every PDF under insurance_policies is extracted --repeat times per worker count. The
+pool is warmed up before timing so process start-up is not counted.
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from app.pdf_extraction import extract_many, get_process_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--directory", default="insurance_policies")
+    parser.add_argument("--repeat", type=int, default=4)
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="*",
+        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+    )
+    args = parser.parse_args()
+
+    files = [str(path) for path in sorted(Path(args.directory).glob("*/*.pdf"))]
+    files = files * args.repeat
+    if not files:
+        raise SystemExit(f"No PDF files found in {args.directory}")
+
+    print(f"{len(files)} files, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'pages':>8} {'seconds':>8} {'pages/sec':>10}")
+    for workers in args.workers:
+        if workers > 1:
+            pool = get_process_pool(workers)
+            list(pool.map(abs, range(workers)))
+
+        start = time.perf_counter()
+        results = extract_many(files, workers, args.pages_per_task)
+        elapsed = time.perf_counter() - start
+
+        pages = sum(len(pages) for pages in results)
+        print(f"{workers:>8} {pages:>8} {elapsed:>8.2f} {pages / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Measure the latency and throughput of the question and comparison pipeline offline.
+
+Run from the backend directory:
+
+    python -m benchmarks.pipeline_latency --requests 50 --llm-latency 0.2
+
+The app is started with the fake LLM backend, so no OpenAI key or network is needed:
+the LLM answers after --llm-latency seconds and embeddings are hashed locally after
+--embedding-latency seconds per request. The policies in insurance_policies are copied
+to a temporary directory and ingested there, with every cache in that directory too,
+so nothing in the working tree is touched. All policies are ingested before the runs,
+and the answer cache is disabled, so every question runs through routing, the agents,
+retrieval and the LLM.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def configure(data_dir: Path, args) -> None:
+    # Settings are read when the app is imported, so this must run first
+    os.environ.update(
+        {
+            "LLM_BACKEND": "fake",
+            "FAKE_LLM_LATENCY_SECONDS": str(args.llm_latency),
+            "FAKE_EMBEDDING_LATENCY_SECONDS": str(args.embedding_latency),
+            "ANSWER_CACHE_SIZE": "0",
+            "EMBEDDING_CACHE_PATH": str(data_dir / "embedding_cache.sqlite3"),
+            "COMPARISON_CACHE_PATH": str(data_dir / "comparison_cache.sqlite3"),
+            "COMPARISON_CACHE_MAX_BYTES": "0",
+            "TEXT_CACHE_DIR": str(data_dir / "text_cache"),
+        }
+    )
+    for name in ["ENVIRONMENT", "JWT_SECRET_KEY", "JWT_ALGORITHM", "MONGO_URL"]:
+        os.environ.setdefault(name, "benchmark")
+
+
+async def run(name, request, count, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed(i):
+        async with limit:
+            start = time.perf_counter()
+            await request(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{name:>10} {count:>9} {statistics.median(latencies) * 1000:>8.0f} "
+        f"{p95 * 1000:>8.0f} {count / elapsed:>8.1f}"
+    )
+
+
+async def benchmark(policy_dir: Path, args) -> None:
+    from app.information_query import live_registry, load_registry, scan_policies
+    from app.models.chatbot import ComparisonRequest, QuestionRequest
+    from app.services.chatbot_service import ChatbotService
+
+    start = time.perf_counter()
+    await asyncio.to_thread(load_registry, policy_dir)
+    registry = live_registry.current()
+    # Ingest every policy up front so the runs measure answering only
+    for name in registry.names():
+        await asyncio.to_thread(registry.get, name)
+    policies = sorted(scan_policies(policy_dir).values())
+    service = ChatbotService()
+    await service.ask(QuestionRequest(question="Hvad dækker forsikringen?"))
+    print(f"{len(policies)} policies loaded in {time.perf_counter() - start:.2f}s")
+
+    companies = [policy.parent.name for policy in policies]
+    pair = [f"{policy.parent.name}/{policy.stem}" for policy in policies[:2]]
+
+    async def ask(i):
+        company = companies[i % len(companies)]
+        question = f"Hvad dækker {company} ved glasskade nummer {i}?"
+        await service.ask(QuestionRequest(question=question))
+
+    async def compare(i):
+        await service.compare_policies(
+            ComparisonRequest(
+                policy1=pair[0], policy2=pair[-1], query=f"Selvrisiko nummer {i}"
+            )
+        )
+
+    print(f"{'path':>10} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8}")
+    await run("question", ask, args.requests, args.concurrency)
+    await run("compare", compare, args.requests, args.concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        configure(tmp / "data", args)
+        policy_dir = tmp / "insurance_policies"
+        shutil.copytree("insurance_policies", policy_dir)
+        asyncio.run(benchmark(policy_dir, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Measure the top agent's prompt size and overhead for a growing number of policies.
+
+Run from the backend directory:
+
+    python -m benchmarks.top_agent_tools --policies 10 100 1000
+
+For every catalogue size the top agent is built over synthetic policies twice: once
+offering every policy tool to the model and once retrieving the top-k tools from an
+ObjectIndex. The LLM is replaced by a recorder that answers at once, so the reported
+latency is the agent's own overhead (tool selection and request building) and the
+prompt tokens are those of the request that would be sent to OpenAI. Embeddings are
+mocked, so which tools are retrieved is arbitrary; only the sizes are meaningful.
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, List, Sequence
+
+from app.information_query import TopAgent, build_policy_tool
+from app.policy_registry import PolicyRegistry
+from llama_index.core import Settings
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse, MessageRole
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.utils import get_tokenizer
+from llama_index.llms.openai import OpenAI
+
+POLICY_TYPES = ["Bil", "Hus", "Indbo", "Rejse", "Ulykke"]
+
+
+class RecordingOpenAI(OpenAI):
+    """OpenAI LLM that records the prompt of every request instead of sending it."""
+
+    _prompt_tokens: List[int] = PrivateAttr(default_factory=list)
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        tokenizer = get_tokenizer()
+        prompt = json.dumps(kwargs.get("tools") or []) + "".join(
+            str(message.content) for message in messages
+        )
+        self._prompt_tokens.append(len(tokenizer(prompt)))
+        return ChatResponse(
+            message=ChatMessage(role=MessageRole.ASSISTANT, content="Svar")
+        )
+
+
+def synthetic_registry(count: int) -> PolicyRegistry:
+    policies = {}
+    for i in range(count):
+        company = f"Selskab{i // len(POLICY_TYPES)}"
+        policy = POLICY_TYPES[i % len(POLICY_TYPES)]
+        policies[f"{company}_{policy}"] = Path(company) / f"{policy}.pdf"
+    return PolicyRegistry(
+        lambda policy_file: None, max_resident=1, top_agent_factory=lambda r: None
+    ).with_policies(policies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--policies", type=int, nargs="*", default=[10, 100, 1000])
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=5)
+    args = parser.parse_args()
+
+    llm = RecordingOpenAI(model="gpt-4o-mini", api_key="benchmark")
+    Settings.llm = llm
+    Settings.embed_model = MockEmbedding(embed_dim=256)
+
+    print(
+        f"{'policies':>8} {'mode':>9} {'build s':>8} {'query ms':>9} {'prompt tokens':>14}"
+    )
+    for count in args.policies:
+        registry = synthetic_registry(count)
+        tools = [build_policy_tool(registry, name) for name in registry.names()]
+        for mode, top_k in [("all", 0), ("retrieve", args.top_k)]:
+            start = time.perf_counter()
+            top_agent = TopAgent(tools, tool_top_k=top_k)
+            build = time.perf_counter() - start
+
+            llm._prompt_tokens.clear()
+            start = time.perf_counter()
+            for i in range(args.queries):
+                query = f"Hvad dækker Selskab{i} Bil ved glasskade?"
+                top_agent.agent(query).query(query)
+            per_query = (time.perf_counter() - start) / args.queries
+            tokens = sum(llm._prompt_tokens) / len(llm._prompt_tokens)
+
+            print(
+                f"{count:>8} {mode:>9} {build:>8.2f} {per_query * 1000:>9.1f} {tokens:>14.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()